@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+akshare 接口调用指标
+按 (数据源, 接口) 统计调用次数、耗时分布、重试、退避耗时、代码不存在的提前返回以及返回行数。
+每个线程写入自己的分片，不加锁；只在生成快照时合并，采集开销与线程数无关
+"""
+
+import bisect
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# 耗时直方图的桶上界（秒），最后一个桶为 +Inf
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+@dataclass
+class ApiCallStats:
+    """单个 (数据源, 接口) 的累计指标"""
+    calls: int = 0  # 实际发出的请求次数（含重试）
+    errors: int = 0
+    retries: int = 0
+    not_found: int = 0  # 报告代码不存在而停止重试的次数
+    circuit_open: int = 0  # 数据源熔断中而被跳过的调用次数
+    rows: int = 0
+    latency_seconds: float = 0.0
+    backoff_seconds: float = 0.0
+    rate_limit_wait_seconds: float = 0.0
+    latency_buckets: List[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+
+    def merge(self, other: 'ApiCallStats') -> None:
+        self.calls += other.calls
+        self.errors += other.errors
+        self.retries += other.retries
+        self.not_found += other.not_found
+        self.circuit_open += other.circuit_open
+        self.rows += other.rows
+        self.latency_seconds += other.latency_seconds
+        self.backoff_seconds += other.backoff_seconds
+        self.rate_limit_wait_seconds += other.rate_limit_wait_seconds
+        for i, count in enumerate(other.latency_buckets):
+            self.latency_buckets[i] += count
+
+    def latency_quantile(self, q: float) -> Optional[float]:
+        """按直方图估算分位数，返回所在桶的上界；落在 +Inf 桶时返回最后一个有限上界"""
+        total = sum(self.latency_buckets)
+        if total == 0: return None
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(self.latency_buckets):
+            cumulative += count
+            if cumulative >= rank:
+                return LATENCY_BUCKETS[min(i, len(LATENCY_BUCKETS) - 1)]
+        return LATENCY_BUCKETS[-1]
+
+    def to_dict(self) -> Dict:
+        return {
+            'calls': self.calls, 'errors': self.errors, 'retries': self.retries, 'not_found': self.not_found,
+            'circuit_open': self.circuit_open, 'rows': self.rows, 'latency_seconds': round(self.latency_seconds, 3),
+            'avg_latency_ms': round(self.latency_seconds / self.calls * 1000, 1) if self.calls else None,
+            'p50_latency_le_seconds': self.latency_quantile(0.5), 'p99_latency_le_seconds': self.latency_quantile(0.99),
+            'backoff_seconds': round(self.backoff_seconds, 3),
+            'rate_limit_wait_seconds': round(self.rate_limit_wait_seconds, 3),
+            'latency_histogram': {('+Inf' if i == len(LATENCY_BUCKETS) else str(LATENCY_BUCKETS[i])): count
+                                  for i, count in enumerate(self.latency_buckets)},
+        }
+
+
+class ApiMetrics:
+    """进程内的接口调用指标，记录方法可在任意线程中调用"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[Dict[Tuple[str, str], ApiCallStats]] = []
+        self._shards_lock = threading.Lock()
+
+    def _stats(self, func_name: str, source: Optional[str]) -> ApiCallStats:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        key = (source or 'unknown', func_name)
+        stats = shard.get(key)
+        if stats is None:
+            stats = shard[key] = ApiCallStats()
+        return stats
+
+    def record_call(self, func_name: str, source: Optional[str], seconds: float, rows: int = 0, error: bool = False) -> None:
+        stats = self._stats(func_name, source)
+        stats.calls += 1
+        stats.latency_seconds += seconds
+        stats.latency_buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        if error:
+            stats.errors += 1
+        else:
+            stats.rows += rows
+
+    def record_retry(self, func_name: str, source: Optional[str], backoff_seconds: float) -> None:
+        stats = self._stats(func_name, source)
+        stats.retries += 1
+        stats.backoff_seconds += backoff_seconds
+
+    def record_not_found(self, func_name: str, source: Optional[str]) -> None:
+        self._stats(func_name, source).not_found += 1
+
+    def record_circuit_open(self, func_name: str, source: Optional[str]) -> None:
+        self._stats(func_name, source).circuit_open += 1
+
+    def record_rate_limit_wait(self, func_name: str, source: Optional[str], seconds: float) -> None:
+        if seconds > 0:
+            self._stats(func_name, source).rate_limit_wait_seconds += seconds
+
+    def _merged(self) -> Dict[Tuple[str, str], ApiCallStats]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        merged: Dict[Tuple[str, str], ApiCallStats] = {}
+        for shard in shards:
+            for key, stats in list(shard.items()):
+                merged.setdefault(key, ApiCallStats()).merge(stats)
+        return merged
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict]]:
+        """按 数据源 -> 接口 汇总的指标"""
+        result: Dict[str, Dict[str, Dict]] = {}
+        for (source, func_name), stats in sorted(self._merged().items()):
+            result.setdefault(source, {})[func_name] = stats.to_dict()
+        return result
+
+    def to_prometheus(self) -> str:
+        """生成 Prometheus 文本格式（供 node_exporter textfile collector 读取）"""
+        lines = []
+        counters = (('akshare_calls_total', 'calls', '实际发出的请求次数'), ('akshare_errors_total', 'errors', '失败的请求次数'),
+                    ('akshare_retries_total', 'retries', '重试次数'), ('akshare_not_found_total', 'not_found', '代码不存在而停止重试的次数'),
+                    ('akshare_circuit_open_total', 'circuit_open', '数据源熔断中而被跳过的调用次数'),
+                    ('akshare_rows_total', 'rows', '返回的数据行数'), ('akshare_backoff_seconds_total', 'backoff_seconds', '重试退避耗时'),
+                    ('akshare_rate_limit_wait_seconds_total', 'rate_limit_wait_seconds', '等待限流令牌的耗时'))
+        merged = sorted(self._merged().items())
+        for metric, attr, help_text in counters:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for (source, func_name), stats in merged:
+                lines.append(f'{metric}{{source="{source}",func="{func_name}"}} {getattr(stats, attr)}')
+        lines.append("# HELP akshare_request_duration_seconds 单次请求耗时")
+        lines.append("# TYPE akshare_request_duration_seconds histogram")
+        for (source, func_name), stats in merged:
+            labels = f'source="{source}",func="{func_name}"'
+            cumulative = 0
+            for i, count in enumerate(stats.latency_buckets):
+                cumulative += count
+                le = '+Inf' if i == len(LATENCY_BUCKETS) else str(LATENCY_BUCKETS[i])
+                lines.append(f'akshare_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'akshare_request_duration_seconds_sum{{{labels}}} {stats.latency_seconds:.6f}')
+            lines.append(f'akshare_request_duration_seconds_count{{{labels}}} {stats.calls}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str) -> None:
+        """先写临时文件再替换，避免采集端读到半个文件"""
+        directory = os.path.dirname(path)
+        if directory: os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+    def reset(self) -> None:
+        with self._shards_lock:
+            for shard in self._shards:
+                shard.clear()
+
+
+_api_metrics = ApiMetrics()
+
+
+def get_api_metrics() -> ApiMetrics:
+    """获取进程内共享的接口调用指标"""
+    return _api_metrics
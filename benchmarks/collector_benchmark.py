@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+收集器离线基准测试
+用模拟 akshare 后端端到端运行 historical / archive / full 模式，每个模式在独立子进程和临时目录中执行，
+统计吞吐量 (债券/秒)、单只债券抓取耗时的 p50/p99、峰值内存和 SQLite 写入耗时，结果保存为 JSON 便于跨提交对比
+
+用法:
+    python benchmarks/collector_benchmark.py --bonds 200 --workers 8 --output benchmarks/results/latest.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+BENCHMARK_MODES = ('historical', 'archive', 'full')
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, 'results', 'collector_benchmark.json')
+# 子进程标记：合并计算进程池以 spawn 方式重新导入本脚本，需在导入收集器模块之前先装好模拟 akshare
+FAKE_AKSHARE_ENV = 'CB_BENCHMARK_FAKE_AKSHARE'
+
+if os.environ.get(FAKE_AKSHARE_ENV) and 'akshare' not in sys.modules:
+    sys.path[:0] = [REPO_ROOT, BENCHMARK_DIR]
+    import fake_akshare
+    fake_akshare.install()
+
+
+class PhaseRecorder:
+    """记录单只债券抓取耗时与 SQLite 写入耗时，通过包装收集器方法实现，不修改被测代码"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.bond_seconds: List[float] = []
+            self.write_seconds = 0.0
+            self.write_calls = 0
+
+    def wrap_bond(self, func):
+        recorder = self
+
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with recorder._lock:
+                    recorder.bond_seconds.append(time.perf_counter() - started)
+        return wrapper
+
+    def wrap_write(self, func):
+        recorder = self
+
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with recorder._lock:
+                    recorder.write_seconds += time.perf_counter() - started
+                    recorder.write_calls += 1
+        return wrapper
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values: return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def _peak_rss_mb(who: int) -> float:
+    # Linux 下 ru_maxrss 单位为 KB，macOS 下为字节
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _build_fake_config(args):
+    from fake_akshare import FakeAkshareConfig, LatencyProfile
+    config = FakeAkshareConfig(bond_count=args.bonds, history_days=args.days, seed=args.seed)
+    for source, profile in config.profiles.items():
+        config.profiles[source] = LatencyProfile(median_ms=profile.median_ms * args.latency_scale, sigma=profile.sigma,
+                                                 error_rate=args.error_rate, throttle_rate=args.throttle_rate)
+    for item in args.source_error_rate:
+        source, rate = item.split('=', 1)
+        config.profiles[source].error_rate = float(rate)
+    for item in args.source_capacity:
+        source, capacity = item.split('=', 1)
+        config.profiles[source].capacity = int(capacity)
+    return config
+
+
+def run_mode_in_process(mode: str, args) -> Dict:
+    """在当前进程（工作目录已切到临时目录）内运行一个模式并返回指标"""
+    import fake_akshare
+    backend = fake_akshare.install(_build_fake_config(args))
+
+    import master_data_collector
+    from enhanced_history_pipeline import EnhancedBondDataCollector
+    from history_writer import HistoryWriter
+    from rate_limiter import RateLimit, configure_rate_limits, parse_rate_limit
+    from api_metrics import get_api_metrics
+    from concurrency_controller import configure_concurrency_controller, get_concurrency_controller
+    from enhanced_history_pipeline import SOURCE_MAX_CONCURRENCY
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    recorder = PhaseRecorder()
+    EnhancedBondDataCollector.fetch_bond_frames = recorder.wrap_bond(EnhancedBondDataCollector.fetch_bond_frames)
+    EnhancedBondDataCollector.save_to_database = recorder.wrap_write(EnhancedBondDataCollector.save_to_database)
+    HistoryWriter._flush = recorder.wrap_write(HistoryWriter._flush)
+
+    def new_collector():
+        configure_concurrency_controller(args.adaptive_concurrency, max_workers=args.workers, initial_limits=SOURCE_MAX_CONCURRENCY)
+        collector = master_data_collector.MasterDataCollector(fetch_mode=args.fetch_mode, process_workers=args.process_workers,
+                                                              hedge_budget=args.hedge_budget)
+        if args.no_rate_limits:
+            # 放开令牌桶，只测量收集器本身的开销
+            configure_rate_limits(args.workers, {source: RateLimit(rate=1e6, burst=1000) for source in fake_akshare.FAKE_FUNC_SOURCES.values()})
+        else:
+            # 与 master_data_collector 的命令行一致：按 --workers 放大的生产限流，--source-rate 覆盖单个数据源
+            configure_rate_limits(args.workers, dict(parse_rate_limit(item) for item in args.source_rate))
+        return collector
+
+    seed_seconds = 0.0
+    if mode == 'archive':
+        # 先完整收集一遍，再删掉最近若干交易日，让 archive 模式走断点回补路径；预热阶段不计入指标
+        started = time.perf_counter()
+        seeder = new_collector()
+        seeder.collect_historical_data(args.workers)
+        cutoff = backend.trade_dates[-args.archive_gap_days].strftime('%Y-%m-%d')
+        with seeder.engine.begin() as connection:
+            connection.exec_driver_sql("DELETE FROM cb_daily_history WHERE trade_date >= ?", (cutoff,))
+        seed_seconds = time.perf_counter() - started
+        recorder.reset()
+        get_api_metrics().reset()
+
+    collector = new_collector()
+    calls_before = dict(backend.call_counts)
+    started = time.perf_counter()
+    if mode == 'historical':
+        result = collector.collect_historical_data(args.workers)
+    elif mode == 'full':
+        result = collector.run_full_collection(args.workers)
+    else:
+        collector.initialize_database()
+        collector._archive_latest_to_history_and_backfill(args.workers)
+        result = {'static_backfill': collector.last_backfill_counts}
+    wall_seconds = time.perf_counter() - started
+
+    with collector.bond_collector.engine.connect() as connection:
+        history_rows = connection.exec_driver_sql("SELECT COUNT(*) FROM cb_daily_history").scalar()
+    bond_count = len(recorder.bond_seconds)
+    return {
+        'mode': mode,
+        'wall_seconds': round(wall_seconds, 3),
+        'seed_seconds': round(seed_seconds, 3),
+        'bonds': bond_count,
+        'bonds_per_sec': round(bond_count / wall_seconds, 3) if wall_seconds else 0.0,
+        'bond_latency_p50_ms': round(_percentile(recorder.bond_seconds, 50) * 1000, 1),
+        'bond_latency_p99_ms': round(_percentile(recorder.bond_seconds, 99) * 1000, 1),
+        'sqlite_write_seconds': round(recorder.write_seconds, 3),
+        'sqlite_write_calls': recorder.write_calls,
+        'peak_rss_mb': round(_peak_rss_mb(resource.RUSAGE_SELF), 1),
+        'peak_rss_children_mb': round(_peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        'history_rows': history_rows,
+        'api_calls': {name: count - calls_before.get(name, 0) for name, count in backend.call_counts.items()},
+        'injected_errors': dict(backend.injected_errors),
+        'write_stats': result.get('write_stats') if isinstance(result, dict) else None,
+        'api_metrics': get_api_metrics().snapshot(),
+        'hedging': collector.bond_collector.hedger.get_stats() if collector.bond_collector.hedger is not None else None,
+        'concurrency': get_concurrency_controller().get_stats() if get_concurrency_controller() is not None else None,
+    }
+
+
+def _child_command(mode: str, args, output_path: str) -> List[str]:
+    command = [sys.executable, os.path.abspath(__file__), '--child-mode', mode, '--child-output', output_path,
+               '--bonds', str(args.bonds), '--days', str(args.days), '--workers', str(args.workers),
+               '--fetch-mode', args.fetch_mode, '--process-workers', str(args.process_workers),
+               '--latency-scale', str(args.latency_scale), '--error-rate', str(args.error_rate),
+               '--throttle-rate', str(args.throttle_rate), '--archive-gap-days', str(args.archive_gap_days),
+               '--seed', str(args.seed)]
+    for item in args.source_error_rate:
+        command += ['--source-error-rate', item]
+    for item in args.source_capacity:
+        command += ['--source-capacity', item]
+    if args.adaptive_concurrency: command.append('--adaptive-concurrency')
+    command += ['--hedge-budget', str(args.hedge_budget)]
+    for item in args.source_rate:
+        command += ['--source-rate', item]
+    if args.no_rate_limits: command.append('--no-rate-limits')
+    if args.verbose: command.append('--verbose')
+    return command
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+
+def run_benchmarks(args) -> Dict:
+    results = {'revision': _git_revision(), 'started_at': datetime.now().isoformat(timespec='seconds'),
+               'config': {key: value for key, value in vars(args).items() if not key.startswith('child_')},
+               'modes': {}}
+    for mode in args.modes:
+        with tempfile.TemporaryDirectory(prefix=f'cb_bench_{mode}_') as work_dir:
+            output_path = os.path.join(work_dir, 'result.json')
+            print(f"运行 {mode} 模式基准测试 ...", flush=True)
+            completed = subprocess.run(_child_command(mode, args, output_path), cwd=work_dir,
+                                       env=dict(os.environ, **{FAKE_AKSHARE_ENV: '1'}))
+            if completed.returncode != 0 or not os.path.exists(output_path):
+                results['modes'][mode] = {'mode': mode, 'error': f"子进程退出码 {completed.returncode}"}
+                continue
+            with open(output_path, 'r', encoding='utf-8') as f:
+                results['modes'][mode] = json.load(f)
+        summary = results['modes'][mode]
+        print(f"  {mode}: {summary['bonds']} 只债券, {summary['bonds_per_sec']} 只/秒, "
+              f"p50 {summary['bond_latency_p50_ms']} ms, p99 {summary['bond_latency_p99_ms']} ms, "
+              f"峰值内存 {summary['peak_rss_mb']} MB, SQLite 写入 {summary['sqlite_write_seconds']} 秒", flush=True)
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='可转债收集器离线基准测试')
+    parser.add_argument('--modes', nargs='+', choices=BENCHMARK_MODES, default=list(BENCHMARK_MODES), help='要测试的运行模式')
+    parser.add_argument('--bonds', type=int, default=200, help='模拟的可转债数量')
+    parser.add_argument('--days', type=int, default=250, help='每只债券的历史交易日数')
+    parser.add_argument('--workers', type=int, default=8, help='收集器并发线程数')
+    parser.add_argument('--fetch-mode', choices=('sequential', 'concurrent'), default='sequential', help='单只债券内部的抓取方式')
+    parser.add_argument('--process-workers', type=int, default=0, help='合并与指标计算使用的进程数')
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='模拟延迟的缩放系数，0 表示不模拟网络延迟')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='每次调用注入普通错误的概率')
+    parser.add_argument('--source-error-rate', action='append', default=[], metavar='SOURCE=RATE',
+                        help='单独设置某个数据源的错误率，如 eastmoney=0.9，可重复指定')
+    parser.add_argument('--source-capacity', action='append', default=[], metavar='SOURCE=N',
+                        help='某个数据源同时在途请求超过 N 时断开连接，如 eastmoney=6，可重复指定')
+    parser.add_argument('--adaptive-concurrency', action='store_true', help='启用自适应并发')
+    parser.add_argument('--hedge-budget', type=float, default=0.0, help='对冲请求预算，0 表示不对冲')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='每次调用注入限流错误的概率')
+    parser.add_argument('--archive-gap-days', type=int, default=5, help='archive 模式预热后删除的最近交易日数，用于触发断点回补')
+    parser.add_argument('--source-rate', action='append', default=[], metavar='SOURCE=RATE[:BURST]', help='覆盖某个数据源的总请求速率和突发量')
+    parser.add_argument('--no-rate-limits', action='store_true', help='放开令牌桶，只测收集器本身的开销（默认按生产配置限流）')
+    parser.add_argument('--seed', type=int, default=20240101, help='随机种子')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='结果 JSON 文件路径')
+    parser.add_argument('--verbose', action='store_true', help='输出收集器日志')
+    parser.add_argument('--child-mode', choices=BENCHMARK_MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--child-output', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child_mode:
+        metrics = run_mode_in_process(args.child_mode, args)
+        with open(args.child_output, 'w', encoding='utf-8') as f:
+            json.dump(metrics, f, ensure_ascii=False, indent=2, default=str)
+        return
+    results = run_benchmarks(args)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2, default=str)
+    print(f"基准测试结果已保存至: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+字段质量画像基准测试
+在临时数据库上写入模拟历史数据，对比原先逐列 COUNT(*) IS NULL + COUNT(DISTINCT) 的统计方式与 ColumnProfiler
+单次扫描的耗时，以及数据未变化时读取缓存的耗时；同时核对空值数与精确值一致、HyperLogLog 唯一值估算误差不超过 --max-error
+
+用法:
+    python benchmarks/column_profile_benchmark.py --bonds 400 --days 750
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+sys.path[:0] = [REPO_ROOT, BENCHMARK_DIR]
+
+from query_plan_check import populate
+from schema_migrations import HISTORY_TABLE_NAME, apply_migrations
+from stock_app import column_profiler
+from stock_app.column_profiler import ColumnProfiler
+
+
+def per_column_stats(db_path: str):
+    """原先 get_column_quality_stats 的做法：每个字段两次全表查询"""
+    conn = sqlite3.connect(db_path)
+    try:
+        stats = {}
+        for _, name, *_ in conn.execute(f"PRAGMA table_info({HISTORY_TABLE_NAME})").fetchall():
+            nulls = conn.execute(f'SELECT COUNT(*) FROM {HISTORY_TABLE_NAME} WHERE "{name}" IS NULL').fetchone()[0]
+            distinct = conn.execute(f'SELECT COUNT(DISTINCT "{name}") FROM {HISTORY_TABLE_NAME}').fetchone()[0]
+            stats[name] = (nulls, distinct)
+        return stats
+    finally:
+        conn.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="对比逐列统计与单次扫描字段画像的耗时和准确度")
+    parser.add_argument('--bonds', type=int, default=400, help="模拟债券数量")
+    parser.add_argument('--days', type=int, default=750, help="每只债券的交易日数")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    parser.add_argument('--max-error', type=float, default=0.03, help="唯一值估算允许的最大相对误差")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='cb_profile_') as workdir:
+        db_path = os.path.join(workdir, 'cb_data.db')
+        apply_migrations(db_path)
+        conn = sqlite3.connect(db_path)
+        populate(conn, HISTORY_TABLE_NAME, args.bonds, args.days, args.seed)
+        conn.close()
+
+        started = time.perf_counter()
+        expected = per_column_stats(db_path)
+        legacy_seconds = time.perf_counter() - started
+
+        profiler = ColumnProfiler(db_path)
+        started = time.perf_counter()
+        profile = profiler.profile(use_cache=False)
+        scan_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        profiler.profile()
+        cached_seconds = time.perf_counter() - started
+        # 新进程（如看板）没有内存缓存，只能读到持久化缓存
+        column_profiler._memory_cache.clear()
+        started = time.perf_counter()
+        persisted = ColumnProfiler(db_path).profile()
+        persisted_seconds = time.perf_counter() - started
+
+        failures = 0
+        worst_error = 0.0
+        for column in profile['columns']:
+            nulls, distinct = expected[column['column']]
+            error = abs(column['distinct_count'] - distinct) / max(distinct, 1)
+            worst_error = max(worst_error, error)
+            if column['null_count'] != nulls or error > args.max_error:
+                failures += 1
+                print(f"  不一致 {column['column']}: 空值 {column['null_count']}/{nulls}, 唯一值 {column['distinct_count']}/{distinct}")
+
+        print(f"模拟数据: {args.bonds} 只债券 x {args.days} 个交易日 = {profile['total_rows']} 行, {len(profile['columns'])} 个字段")
+        print(f"  逐列统计:         {legacy_seconds:8.3f} 秒")
+        print(f"  单次扫描画像:     {scan_seconds:8.3f} 秒 ({profile['distinct_method']}, 加速 {legacy_seconds / scan_seconds:.1f}x)")
+        print(f"  内存缓存命中:     {cached_seconds * 1000:8.1f} 毫秒")
+        print(f"  持久化缓存命中:   {persisted_seconds * 1000:8.1f} 毫秒")
+        print(f"  唯一值最大相对误差 {worst_error:.2%}, 不一致字段 {failures} 个")
+        if persisted['data_version'] != profile['data_version'] or persisted['computed_at'] != profile['computed_at']:
+            print("  持久化缓存未命中")
+            failures += 1
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模拟 akshare 后端
+按各数据源真实返回的列名生成行情数据，可配置延迟分布和错误率，用于离线基准测试；
+install() 会把模拟模块注册为 sys.modules['akshare']，必须在导入收集器模块之前调用
+"""
+
+import inspect
+import random
+import sys
+import threading
+import time
+import types
+import zlib
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+# akshare 接口名 -> 数据源，与 enhanced_history_pipeline.AKSHARE_FUNC_SOURCES 一致
+FAKE_FUNC_SOURCES = {
+    'stock_zh_a_hist': 'eastmoney',
+    'bond_zh_cov_value_analysis': 'eastmoney',
+    'bond_zh_cov': 'eastmoney',
+    'bond_zh_hs_cov_daily': 'sina',
+    'tool_trade_date_hist_sina': 'sina',
+    'stock_zh_a_hist_tx': 'tencent',
+    'bond_zh_cov_info_ths': 'ths',
+    'bond_cb_jsl': 'jsl',
+}
+
+
+@dataclass
+class LatencyProfile:
+    """单个数据源的延迟分布（对数正态）与错误率"""
+    median_ms: float = 40.0
+    sigma: float = 0.5  # 对数正态分布的形状参数，越大长尾越明显
+    error_rate: float = 0.0  # 普通错误（连接超时等），会触发重试
+    throttle_rate: float = 0.0  # 限流错误，会触发整个数据源暂停
+    capacity: Optional[int] = None  # 同时在途请求超过该数时上游以断开连接回应，用于验证自适应并发
+
+    def sample_seconds(self, rng: random.Random) -> float:
+        if self.median_ms <= 0: return 0.0
+        return rng.lognormvariate(np.log(self.median_ms / 1000.0), self.sigma)
+
+
+@dataclass
+class FakeAkshareConfig:
+    """模拟后端配置"""
+    bond_count: int = 200
+    history_days: int = 250
+    matured_ratio: float = 0.1  # 已到期债券的比例，用于覆盖增量模式的跳过逻辑
+    missing_stock_ratio: float = 0.02  # 东财报告正股代码不存在、需要降级到腾讯的比例
+    seed: int = 20240101
+    profiles: Dict[str, LatencyProfile] = field(default_factory=lambda: {
+        'eastmoney': LatencyProfile(median_ms=60, sigma=0.6),
+        'sina': LatencyProfile(median_ms=40, sigma=0.4),
+        'tencent': LatencyProfile(median_ms=50, sigma=0.5),
+        'ths': LatencyProfile(median_ms=300, sigma=0.2),
+        'jsl': LatencyProfile(median_ms=200, sigma=0.2),
+    })
+
+
+class FakeAkshareBackend:
+    """生成与真实接口列名一致的 DataFrame，并按配置注入延迟和错误"""
+
+    def __init__(self, config: FakeAkshareConfig):
+        self.config = config
+        self._rng = random.Random(config.seed)
+        self._rng_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.call_counts: Dict[str, int] = {}
+        self.injected_errors: Dict[str, int] = {}
+        self._in_flight: Dict[str, int] = {}
+        end = date.today() - timedelta(days=1)
+        self.trade_dates = pd.bdate_range(end=end, periods=config.history_days)
+        self.bonds = self._build_universe()
+        self._stocks_missing_on_eastmoney = {
+            bond['stock_code'] for bond in self.bonds[:int(len(self.bonds) * config.missing_stock_ratio)]}
+
+    def _build_universe(self):
+        bonds = []
+        matured_count = int(self.config.bond_count * self.config.matured_ratio)
+        for i in range(self.config.bond_count):
+            exchange_prefix = '11' if i % 2 == 0 else '12'
+            stock_code = f"{'60' if i % 2 == 0 else '00'}{i % 10000:04d}"
+            maturity = (self.trade_dates[len(self.trade_dates) // 2].date() if i < matured_count
+                        else date.today() + timedelta(days=365 * 3))
+            bonds.append({'bond_code': f"{exchange_prefix}{i:04d}", 'bond_name': f"模拟转债{i}",
+                          'stock_code': stock_code, 'stock_name': f"模拟正股{i}", 'maturity_date': maturity})
+        return bonds
+
+    def _simulate(self, func_name: str, symbol: Optional[str] = None) -> None:
+        source = FAKE_FUNC_SOURCES[func_name]
+        profile = self.config.profiles.get(source, LatencyProfile())
+        with self._rng_lock:
+            delay = profile.sample_seconds(self._rng)
+            roll = self._rng.random()
+        with self._lock:
+            self.call_counts[func_name] = self.call_counts.get(func_name, 0) + 1
+            in_flight = self._in_flight[source] = self._in_flight.get(source, 0) + 1
+        try:
+            time.sleep(delay)
+        finally:
+            with self._lock:
+                self._in_flight[source] -= 1
+        if profile.capacity is not None and in_flight > profile.capacity:
+            self._count_error(func_name)
+            raise ConnectionError("('Connection aborted.', RemoteDisconnected('Remote end closed connection without response'))")
+        if roll < profile.throttle_rate:
+            self._count_error(func_name)
+            raise ConnectionError("('Connection aborted.', RemoteDisconnected('Remote end closed connection without response'))")
+        if roll < profile.throttle_rate + profile.error_rate:
+            self._count_error(func_name)
+            raise TimeoutError(f"模拟请求超时: {func_name} {symbol}")
+
+    def _count_error(self, func_name: str) -> None:
+        with self._lock:
+            self.injected_errors[func_name] = self.injected_errors.get(func_name, 0) + 1
+
+    def _daily_frame(self, symbol: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> pd.DataFrame:
+        """按代码生成确定性的随机游走行情，再按 [start_date, end_date] 截取"""
+        rng = np.random.default_rng(zlib.crc32(symbol.encode('utf-8')))
+        total = len(self.trade_dates)
+        close = 100 + np.cumsum(rng.normal(0, 1, total))
+        df = pd.DataFrame({
+            '日期': self.trade_dates.strftime('%Y-%m-%d'), '开盘': close + rng.normal(0, 0.5, total), '收盘': close,
+            '最高': close + 1.0, '最低': close - 1.0, '成交量': rng.integers(100, 100000, total),
+            '成交额': rng.uniform(1e6, 1e8, total), '换手率': rng.uniform(0.1, 20, total), '涨跌幅': rng.normal(0, 1.5, total),
+        })
+        keep = np.ones(total, dtype=bool)
+        if start_date: keep &= self.trade_dates >= pd.to_datetime(start_date)
+        if end_date: keep &= self.trade_dates <= pd.to_datetime(end_date)
+        return df[keep].reset_index(drop=True)
+
+    # ---- 以下方法与 akshare 同名同参，install() 时挂到模拟模块上 ----
+
+    def stock_zh_a_hist(self, symbol='000001', period='daily', start_date='19700101', end_date='20500101', adjust='', timeout=None):
+        self._simulate('stock_zh_a_hist', symbol)
+        if symbol in self._stocks_missing_on_eastmoney:
+            raise KeyError('date')
+        return self._daily_frame(symbol, start_date, end_date)
+
+    def stock_zh_a_hist_tx(self, symbol='sz000001', start_date='19000101', end_date='20500101', adjust='', timeout=None):
+        self._simulate('stock_zh_a_hist_tx', symbol)
+        df = self._daily_frame(symbol[2:], start_date, end_date)
+        return df[['日期', '开盘', '收盘', '最高', '最低', '成交额']].rename(
+            columns={'日期': 'date', '开盘': 'open', '收盘': 'close', '最高': 'high', '最低': 'low', '成交额': 'amount'})
+
+    def bond_zh_hs_cov_daily(self, symbol='sz128039'):
+        self._simulate('bond_zh_hs_cov_daily', symbol)
+        df = self._daily_frame(symbol[2:])
+        return df[['日期', '开盘', '最高', '最低', '收盘', '成交量']].rename(
+            columns={'日期': 'date', '开盘': 'open', '最高': 'high', '最低': 'low', '收盘': 'close', '成交量': 'volume'})
+
+    def bond_zh_cov_value_analysis(self, symbol='113527'):
+        self._simulate('bond_zh_cov_value_analysis', symbol)
+        df = self._daily_frame(symbol)
+        return pd.DataFrame({'日期': df['日期'], '收盘价': df['收盘'], '纯债价值': 95.0, '纯债溢价率': df['收盘'] / 95.0 * 100 - 100,
+                             '转股价值': df['收盘'] * 0.9, '转股溢价率': 100 / 0.9 - 100})
+
+    def bond_zh_cov_info_ths(self):
+        self._simulate('bond_zh_cov_info_ths')
+        return pd.DataFrame({'债券代码': [b['bond_code'] for b in self.bonds], '债券简称': [b['bond_name'] for b in self.bonds],
+                             '正股代码': [b['stock_code'] for b in self.bonds], '正股简称': [b['stock_name'] for b in self.bonds],
+                             '到期时间': [b['maturity_date'] for b in self.bonds]})
+
+    def bond_cb_jsl(self, cookie=None):
+        self._simulate('bond_cb_jsl')
+        live = [b for b in self.bonds if b['maturity_date'] > date.today()]
+        n = len(live)
+        return pd.DataFrame({
+            '代码': [b['bond_code'] for b in live], '转债名称': [b['bond_name'] for b in live], '现价': 120.0, '涨跌幅': 0.3,
+            '正股代码': [('sh' if b['stock_code'].startswith('6') else 'sz') + b['stock_code'] for b in live],
+            '正股名称': [b['stock_name'] for b in live], '正股价': 10.0, '正股涨跌': 0.5, '正股PB': 1.5, '转股价': 10.0,
+            '转股价值': 100.0, '转股溢价率': 20.0, '债券评级': 'AA', '回售触发价': 7.0, '强赎触发价': 13.0, '转债占比': 10.0,
+            '到期时间': [b['maturity_date'].isoformat() for b in live], '剩余年限': 3.0, '剩余规模': 5.0,
+            '成交额': np.linspace(1000, 5000, n), '换手率': 2.0, '到期税前收益': 1.5, '双低': 140.0})
+
+    def bond_zh_cov(self):
+        self._simulate('bond_zh_cov')
+        return pd.DataFrame({'债券代码': [b['bond_code'] for b in self.bonds], '债券简称': [b['bond_name'] for b in self.bonds],
+                             '正股简称': [b['stock_name'] for b in self.bonds], '转股价格': 10.0, '信用评级': 'AA'})
+
+    def tool_trade_date_hist_sina(self):
+        self._simulate('tool_trade_date_hist_sina')
+        return pd.DataFrame({'trade_date': pd.bdate_range(self.trade_dates[0], date.today() + timedelta(days=365)).date})
+
+
+def _make_proxy(bound):
+    """包一层普通函数：收集器依赖 func.__name__ 和 inspect.signature 判断数据源与 timeout 参数"""
+    def proxy(*args, **kwargs):
+        return bound(*args, **kwargs)
+    proxy.__name__ = bound.__name__
+    proxy.__signature__ = inspect.signature(bound)
+    return proxy
+
+
+def install(config: Optional[FakeAkshareConfig] = None) -> FakeAkshareBackend:
+    """创建模拟后端并注册为 akshare 模块"""
+    backend = FakeAkshareBackend(config or FakeAkshareConfig())
+    module = types.ModuleType('akshare')
+    module.__doc__ = "offline fake akshare backend for benchmarks"
+    for func_name in FAKE_FUNC_SOURCES:
+        setattr(module, func_name, _make_proxy(getattr(backend, func_name)))
+    module.backend = backend
+    sys.modules['akshare'] = module
+    return backend
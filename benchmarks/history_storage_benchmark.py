@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史数据规范化存储基准测试
+在临时数据库上按旧结构（迁移到版本 8）写入模拟历史数据并 VACUUM，记录文件体积、各表与索引占用和关键查询耗时；
+随后执行规范化迁移，在同一份数据上再测一次，并核对兼容视图与原表的逐日字段完全一致
+
+用法:
+    python benchmarks/history_storage_benchmark.py --bonds 400 --days 750
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from query_plan_check import populate
+from schema_migrations import HISTORY_TABLE_NAME, MIGRATIONS, apply_migrations
+from stock_app.history_storage import (BOND_TABLE_NAME, BOND_WATERMARKS_SQL, DIMENSION_COLUMNS, FACT_TABLE_NAME, LATEST_TRADE_DATE_SQL,
+                                       MEASURE_COLUMNS, date_sql, history_select_sql, to_day_number)
+
+LEGACY_VERSION = 8
+REPEATS = 20
+
+# (名称, 旧结构 SQL, 规范化后 SQL, 参数类型)；规范化后的 SQL 与看板、收集器实际执行的一致
+QUERIES: List[Tuple[str, str, str, str]] = [
+    ('可用交易日', f"SELECT DISTINCT trade_date FROM {HISTORY_TABLE_NAME} ORDER BY trade_date DESC",
+     f"SELECT {date_sql('day')} AS trade_date FROM (SELECT DISTINCT day FROM {FACT_TABLE_NAME}) ORDER BY day DESC", None),
+    ('按日期取全部字段', f"SELECT * FROM {HISTORY_TABLE_NAME} WHERE trade_date = ? ORDER BY double_low",
+     f"SELECT * FROM ({history_select_sql(with_keys=True)}) WHERE day = ? ORDER BY double_low", 'date'),
+    ('单只债券历史', f"SELECT * FROM {HISTORY_TABLE_NAME} WHERE bond_code = ? ORDER BY trade_date",
+     f"SELECT * FROM {HISTORY_TABLE_NAME} WHERE bond_code = ? ORDER BY trade_date", 'bond'),
+    ('增量水位线', f"SELECT bond_code, MAX(trade_date) FROM {HISTORY_TABLE_NAME} GROUP BY bond_code", BOND_WATERMARKS_SQL, None),
+    ('最新交易日', f"SELECT MAX(trade_date) FROM {HISTORY_TABLE_NAME}", LATEST_TRADE_DATE_SQL, None),
+    ('全表聚合', f"SELECT AVG(price), AVG(premium_rate) FROM {HISTORY_TABLE_NAME}",
+     f"SELECT AVG(price), AVG(premium_rate) FROM {FACT_TABLE_NAME}", None),
+    ('经视图读全历史', f"SELECT * FROM {HISTORY_TABLE_NAME}", f"SELECT * FROM {HISTORY_TABLE_NAME}", None),
+]
+
+
+def object_sizes(conn: sqlite3.Connection) -> Dict[str, int]:
+    """各表和索引占用的字节数；SQLite 未编译 dbstat 时返回空字典"""
+    try:
+        return dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall())
+    except sqlite3.OperationalError:
+        return {}
+
+
+def measure(db_path: str, normalized: bool, codes: List[str], dates: List[str], seed: int) -> Dict:
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("VACUUM")
+        sizes = object_sizes(conn)
+        rng = random.Random(seed)
+        timings = {}
+        for name, legacy_sql, normalized_sql, arg in QUERIES:
+            sql = normalized_sql if normalized else legacy_sql
+            repeats = 3 if name == '经视图读全历史' else REPEATS
+            started = time.perf_counter()
+            for _ in range(repeats):
+                if arg == 'date':
+                    trade_date = rng.choice(dates)
+                    params = (to_day_number(trade_date),) if normalized else (trade_date,)
+                else:
+                    params = (rng.choice(codes),) if arg == 'bond' else ()
+                conn.execute(sql, params).fetchall()
+            timings[name] = (time.perf_counter() - started) / repeats * 1000
+    finally:
+        conn.close()
+    return {'file_mb': os.path.getsize(db_path) / 1024 / 1024, 'sizes': sizes, 'timings': timings}
+
+
+def snapshot(conn: sqlite3.Connection) -> Tuple[List[tuple], Dict[str, tuple]]:
+    """逐日字段按 (trade_date, bond_code) 排序的全部行，以及每行的债券属性"""
+    columns = ', '.join(('trade_date', 'bond_code') + MEASURE_COLUMNS)
+    rows = conn.execute(f"SELECT {columns} FROM {HISTORY_TABLE_NAME} ORDER BY trade_date, bond_code").fetchall()
+    attrs = {f"{row[0]}|{row[1]}": row[2:] for row in conn.execute(
+        f"SELECT trade_date, bond_code, {', '.join(DIMENSION_COLUMNS)} FROM {HISTORY_TABLE_NAME}")}
+    return rows, attrs
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="对比规范化存储前后的文件体积与查询耗时")
+    parser.add_argument('--bonds', type=int, default=400, help="模拟债券数量")
+    parser.add_argument('--days', type=int, default=750, help="每只债券的交易日数")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='cb_history_storage_') as workdir:
+        db_path = os.path.join(workdir, 'cb_data.db')
+        apply_migrations(db_path, [m for m in MIGRATIONS if m.version <= LEGACY_VERSION])
+        conn = sqlite3.connect(db_path)
+        codes, dates = populate(conn, HISTORY_TABLE_NAME, args.bonds, args.days, args.seed)
+        conn.execute("ANALYZE")
+        legacy_rows, legacy_attrs = snapshot(conn)
+        conn.close()
+        before = measure(db_path, False, codes, dates, args.seed)
+
+        started = time.perf_counter()
+        applied = apply_migrations(db_path)
+        migrate_seconds = time.perf_counter() - started
+        after = measure(db_path, True, codes, dates, args.seed)
+
+        conn = sqlite3.connect(db_path)
+        rows, attrs = snapshot(conn)
+        conn.close()
+
+    print(f"模拟数据: {args.bonds} 只债券 x {args.days} 个交易日，迁移 {applied} 耗时 {migrate_seconds:.2f} 秒")
+    print(f"  {'':16s} {'规范化前':>10s} {'规范化后':>10s}")
+    print(f"  {'文件体积 (MB)':16s} {before['file_mb']:10.1f} {after['file_mb']:10.1f}")
+    if before['sizes'] and after['sizes']:
+        legacy_objects = [name for name in before['sizes'] if name == HISTORY_TABLE_NAME or name.startswith(('idx_history', f'sqlite_autoindex_{HISTORY_TABLE_NAME}'))]
+        normalized_objects = [name for name in after['sizes'] if name in (FACT_TABLE_NAME, BOND_TABLE_NAME)
+                              or name.startswith(('idx_fact', f'sqlite_autoindex_{FACT_TABLE_NAME}', f'sqlite_autoindex_{BOND_TABLE_NAME}'))]
+        legacy_mb = sum(before['sizes'][name] for name in legacy_objects) / 1024 / 1024
+        normalized_mb = sum(after['sizes'][name] for name in normalized_objects) / 1024 / 1024
+        print(f"  {'历史表及索引 (MB)':16s} {legacy_mb:10.1f} {normalized_mb:10.1f}")
+    print("  单次查询毫秒:")
+    for name, _, _, _ in QUERIES:
+        print(f"  {name:16s} {before['timings'][name]:10.2f} {after['timings'][name]:10.2f}")
+
+    failures = 0
+    if rows != legacy_rows:
+        print("  兼容视图的逐日字段与原表不一致")
+        failures += 1
+    # 属性按债券取最近的非空值，原表中逐行变化或为空的属性会统一为该值
+    differing = sum(1 for key, values in legacy_attrs.items() if attrs.get(key) != values)
+    print(f"  兼容视图逐日字段一致: {'是' if rows == legacy_rows else '否'}；债券属性统一为最新值的行: {differing}/{len(legacy_attrs)}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模块导入耗时预算检查
+每个模块在全新的解释器中导入，记录耗时并确认 akshare、pandas、SQLAlchemy 等重量级依赖没有被顺带导入；
+超出预算或导入了禁止的模块时以非零状态退出，可直接放进 cron 或 CI 的检查步骤
+
+用法:
+    python benchmarks/import_time_check.py --budget-ms 300
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+
+# 模块 -> 导入后不应出现在 sys.modules 中的依赖
+IMPORT_CHECKS = {
+    'master_data_collector': ('akshare', 'pandas', 'numpy', 'sqlalchemy', 'requests'),
+    'enhanced_history_pipeline': ('akshare', 'pandas', 'numpy', 'sqlalchemy', 'requests'),
+    'data_quality_validator': ('akshare', 'pandas', 'numpy', 'sqlalchemy'),
+    'data_source_manager': ('akshare', 'pandas', 'requests'),
+    'stock_app.database': ('streamlit', 'akshare', 'sqlalchemy'),
+}
+# 页面本身必然用到的依赖先于计时导入，预算只衡量模块自身的导入开销（data_center 在导入 database 之前已导入 pandas）
+PRELOAD = {
+    'stock_app.database': ('pandas',),
+}
+
+_PROBE = """
+import json, sys, time
+{preload}
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'loaded': [name for name in {forbidden!r} if name in sys.modules]}}))
+"""
+
+
+def measure(module: str, forbidden: tuple, preload: tuple, repeats: int) -> Dict:
+    """在独立解释器中多次导入，取最小耗时以排除磁盘缓存冷启动的噪声"""
+    # 看板以 stock_app 为脚本目录运行，其中的模块按顶层模块名互相导入
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.path.join(REPO_ROOT, 'stock_app'),
+                                                                     os.environ.get('PYTHONPATH')])))
+    timings: List[float] = []
+    loaded: List[str] = []
+    probe = _PROBE.format(module=module, forbidden=forbidden, preload='\n'.join(f'import {name}' for name in preload))
+    for _ in range(repeats):
+        proc = subprocess.run([sys.executable, '-c', probe], cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            return {'module': module, 'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'unknown'}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        timings.append(result['seconds'])
+        loaded = result['loaded']
+    return {'module': module, 'milliseconds': round(min(timings) * 1000, 1), 'heavy_modules_loaded': loaded}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="检查模块导入耗时与重量级依赖是否被延迟导入")
+    parser.add_argument('--budget-ms', type=float, default=300.0, help="单个模块导入耗时上限（毫秒）")
+    parser.add_argument('--repeats', type=int, default=3, help="每个模块重复导入的次数，取最小值")
+    parser.add_argument('--modules', nargs='+', choices=sorted(IMPORT_CHECKS), default=sorted(IMPORT_CHECKS), help="要检查的模块")
+    args = parser.parse_args()
+
+    failures = 0
+    for module in args.modules:
+        result = measure(module, IMPORT_CHECKS[module], PRELOAD.get(module, ()), args.repeats)
+        if 'error' in result:
+            print(f"  失败 {module}: 导入出错 ({result['error']})")
+            failures += 1
+            continue
+        problems = []
+        if result['milliseconds'] > args.budget_ms:
+            problems.append(f"超出预算 {args.budget_ms:.0f} ms")
+        if result['heavy_modules_loaded']:
+            problems.append(f"导入了 {', '.join(result['heavy_modules_loaded'])}")
+        status = '失败' if problems else '通过'
+        print(f"  {status} {module}: {result['milliseconds']:.1f} ms{'  (' + '；'.join(problems) + ')' if problems else ''}")
+        failures += bool(problems)
+
+    print(f"导入检查完成: {len(args.modules) - failures}/{len(args.modules)} 通过")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+查询计划检查
+在临时数据库上执行全部迁移并写入模拟历史数据，对看板和收集器的关键查询执行 EXPLAIN QUERY PLAN，
+确认它们走预期的索引而不是全表扫描；任何一条不符合预期时以非零状态退出。
+--evaluate-without-rowid 额外建一份 WITHOUT ROWID 版本的历史表，对比文件体积和查询耗时
+
+用法:
+    python benchmarks/query_plan_check.py --bonds 400 --days 500 --evaluate-without-rowid
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from schema_migrations import BACKFILL_NULL_FIELDS, CREATE_HISTORY_TABLE_SQL, HISTORY_TABLE_NAME, apply_migrations
+from stock_app.history_storage import (BOND_TABLE_NAME, BOND_WATERMARKS_SQL, FACT_TABLE_NAME, LATEST_TRADE_DATE_SQL, MEASURE_COLUMNS,
+                                       date_sql, day_sql, history_select_sql)
+
+# (名称, SQL, 参数, 计划中必须出现的索引)；None 表示只要求不做全表扫描。历史数据已规范化为 bond_info 与 cb_daily_fact，
+# 看板和收集器的热点查询按整数键访问事实表，其余读取经兼容视图 cb_daily_history
+FACT_PK_INDEX = f'sqlite_autoindex_{FACT_TABLE_NAME}_1'
+QUERY_CHECKS: List[Tuple[str, str, tuple, str]] = [
+    ('看板: 可用交易日', f"SELECT {date_sql('day')} AS trade_date FROM (SELECT DISTINCT day FROM {FACT_TABLE_NAME}) ORDER BY day DESC", (),
+     FACT_PK_INDEX),
+    ('看板: 评级列表', f"SELECT DISTINCT bond_rating FROM {BOND_TABLE_NAME} b WHERE bond_rating IS NOT NULL "
+                 f"AND EXISTS (SELECT 1 FROM {FACT_TABLE_NAME} f WHERE f.bond_id = b.bond_id) ORDER BY bond_rating", (), 'idx_fact_bond_day'),
+    ('看板: 按日期筛选', f"SELECT * FROM ({history_select_sql(with_keys=True)}) WHERE day = ? ORDER BY double_low ASC", (19877,),
+     FACT_PK_INDEX),
+    ('看板: 日期范围', f"SELECT MIN(day), MAX(day) FROM {FACT_TABLE_NAME}", (), None),
+    ('收集器: 单只债券历史', f"SELECT * FROM {HISTORY_TABLE_NAME} WHERE bond_code = ? ORDER BY trade_date", ('110010',),
+     'idx_fact_bond_day'),
+    ('收集器: 增量水位线', BOND_WATERMARKS_SQL, (), 'idx_fact_bond_day'),
+    ('收集器: 最新交易日', LATEST_TRADE_DATE_SQL, (), None),
+    ('镜像: 水位线后有变化的月份', f"SELECT DISTINCT substr(trade_date, 1, 7) FROM {HISTORY_TABLE_NAME} WHERE updated_at >= datetime(?, '-60 seconds')",
+     ('2024-06-03 00:00:00',), 'idx_fact_updated_at'),
+    ('镜像: 按月导出', f"SELECT * FROM ({history_select_sql(with_keys=True)}) WHERE day >= ? AND day < ? ORDER BY day, bond_code",
+     (19875, 19905), FACT_PK_INDEX),
+    ('收集器: 存档前删除当日', f"DELETE FROM {FACT_TABLE_NAME} WHERE day = {day_sql('?')}", ('2024-06-03',), FACT_PK_INDEX),
+] + [
+    (f'收集器: 回填 {field}',
+     f"UPDATE {FACT_TABLE_NAME} SET {field} = (SELECT s.{field} FROM temp.latest_static s JOIN {BOND_TABLE_NAME} b ON b.bond_code = s.bond_code "
+     f"WHERE b.bond_id = {FACT_TABLE_NAME}.bond_id) "
+     f"WHERE {field} IS NULL AND bond_id IN (SELECT b.bond_id FROM {BOND_TABLE_NAME} b JOIN temp.latest_static s "
+     f"ON s.bond_code = b.bond_code WHERE s.{field} IS NOT NULL)", (),
+     f'idx_fact_null_{field}')
+    for field in BACKFILL_NULL_FIELDS if field in MEASURE_COLUMNS
+]
+
+# WITHOUT ROWID 对比用的查询
+TIMED_QUERIES = [
+    ('按日期取全部字段', "SELECT * FROM {table} WHERE trade_date = ?", 'date'),
+    ('单只债券历史', "SELECT * FROM {table} WHERE bond_code = ? ORDER BY trade_date", 'bond'),
+    ('增量水位线', "SELECT bond_code, MAX(trade_date) FROM {table} GROUP BY bond_code", None),
+    ('全表聚合', "SELECT AVG(price), AVG(premium_rate) FROM {table}", None),
+]
+
+
+def populate(conn: sqlite3.Connection, table: str, bonds: int, days: int, seed: int) -> Tuple[List[str], List[str]]:
+    """写入模拟历史数据；约 5% 的行静态字段为空，模拟待回填的记录"""
+    rng = random.Random(seed)
+    codes = [str(110000 + i) for i in range(bonds)]
+    dates, day = [], date(2022, 1, 3)
+    while len(dates) < days:
+        if day.weekday() < 5: dates.append(day.isoformat())
+        day += timedelta(days=1)
+    ratings = ['AAA', 'AA+', 'AA', 'AA-', 'A+']
+    rows = []
+    for trade_date in dates:
+        for code in codes:
+            missing = rng.random() < 0.05
+            price = rng.uniform(90, 180)
+            rows.append((trade_date, code, f'转债{code}', price, rng.uniform(-5, 5), price, price + 1, price - 1,
+                         rng.uniform(1e4, 1e6), rng.uniform(1e6, 1e8), rng.uniform(0, 30), code, f'正股{code}',
+                         rng.uniform(5, 50), rng.uniform(-5, 5), None if missing else rng.uniform(0.5, 5), None if missing else rng.uniform(5, 40),
+                         rng.uniform(60, 160), rng.uniform(-10, 80), rng.uniform(80, 110), rng.uniform(0, 60), price + 20,
+                         None if missing else rng.choice(ratings), None if missing else rng.uniform(3, 20),
+                         None if missing else rng.uniform(10, 50), rng.uniform(0, 30), None if missing else '2028-06-30',
+                         rng.uniform(0.5, 6), rng.uniform(1, 30), rng.uniform(-5, 5)))
+    columns = ('trade_date, bond_code, bond_name, price, price_chg_pct, open_price, high_price, low_price, volume, turnover, '
+               'turnover_rate, stock_code, stock_name, stock_price, stock_chg_pct, stock_pb, conv_price, conv_value, premium_rate, '
+               'pure_bond_value, pure_bond_premium_rate, double_low, bond_rating, put_trigger_price, force_redeem_trigger_price, '
+               'conv_proportion, maturity_date, remaining_years, remaining_size, ytm_before_tax')
+    with conn:
+        conn.executemany(f"INSERT INTO {table} ({columns}) VALUES ({', '.join('?' * 30)})", rows)
+    return codes, dates
+
+
+def check_plans(conn: sqlite3.Connection, codes: List[str]) -> int:
+    conn.execute("CREATE TEMP TABLE latest_static (bond_code TEXT PRIMARY KEY, "
+                 + ', '.join(BACKFILL_NULL_FIELDS) + ")")
+    conn.executemany(f"INSERT INTO temp.latest_static VALUES ({', '.join('?' * (len(BACKFILL_NULL_FIELDS) + 1))})",
+                     [(code, 'AA', 5.0, 30.0, 15.0, '2028-06-30', 1.2) for code in codes[:20]])
+    failures = 0
+    for name, sql, params, expected_index in QUERY_CHECKS:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+        # 对事实表的全表扫描在计划中显示为不带 USING 的 SCAN cb_daily_fact（经视图或别名访问时为 SCAN f）
+        full_scans = [step for step in plan if step.split()[:2] in (['SCAN', FACT_TABLE_NAME], ['SCAN', 'f']) and 'USING' not in step]
+        problems = []
+        if full_scans:
+            problems.append('全表扫描')
+        if expected_index and not any(expected_index in step for step in plan):
+            problems.append(f'未使用 {expected_index}')
+        status = '失败' if problems else '通过'
+        print(f"  {status} {name}: {' | '.join(plan)}{'  (' + '；'.join(problems) + ')' if problems else ''}")
+        failures += bool(problems)
+    return failures
+
+
+def evaluate_without_rowid(bonds: int, days: int, seed: int, workdir: str) -> None:
+    """分别建 rowid 表和 WITHOUT ROWID 表（同样的主键和二级索引），对比文件体积与查询耗时"""
+    results: Dict[str, Dict] = {}
+    for variant in ('rowid', 'without_rowid'):
+        path = os.path.join(workdir, f'{variant}.db')
+        conn = sqlite3.connect(path)
+        ddl = CREATE_HISTORY_TABLE_SQL.strip()
+        if variant == 'without_rowid':
+            ddl += ' WITHOUT ROWID'
+        conn.execute(ddl)
+        conn.execute(f"CREATE INDEX idx_history_bond_date ON {HISTORY_TABLE_NAME} (bond_code, trade_date)")
+        started = time.perf_counter()
+        codes, dates = populate(conn, HISTORY_TABLE_NAME, bonds, days, seed)
+        insert_seconds = time.perf_counter() - started
+        conn.execute("ANALYZE")
+        conn.commit()
+        timings = {}
+        rng = random.Random(seed)
+        for name, sql, arg in TIMED_QUERIES:
+            started = time.perf_counter()
+            for _ in range(20):
+                params = (rng.choice(dates),) if arg == 'date' else (rng.choice(codes),) if arg == 'bond' else ()
+                conn.execute(sql.format(table=HISTORY_TABLE_NAME), params).fetchall()
+            timings[name] = (time.perf_counter() - started) / 20 * 1000
+        conn.close()
+        results[variant] = {'size_mb': os.path.getsize(path) / 1024 / 1024, 'insert_seconds': insert_seconds, 'timings': timings}
+
+    print("\nWITHOUT ROWID 对比 (单次查询毫秒):")
+    print(f"  {'':16s} {'rowid':>12s} {'without_rowid':>14s}")
+    print(f"  {'文件体积 (MB)':16s} {results['rowid']['size_mb']:12.1f} {results['without_rowid']['size_mb']:14.1f}")
+    print(f"  {'写入耗时 (秒)':16s} {results['rowid']['insert_seconds']:12.2f} {results['without_rowid']['insert_seconds']:14.2f}")
+    for name, _, _ in TIMED_QUERIES:
+        print(f"  {name:16s} {results['rowid']['timings'][name]:12.2f} {results['without_rowid']['timings'][name]:14.2f}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="检查关键查询的执行计划是否使用预期索引")
+    parser.add_argument('--bonds', type=int, default=300, help="模拟债券数量")
+    parser.add_argument('--days', type=int, default=250, help="每只债券的交易日数")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    parser.add_argument('--evaluate-without-rowid', action='store_true', help="额外对比 WITHOUT ROWID 表的体积和查询耗时")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='cb_query_plan_') as workdir:
+        db_path = os.path.join(workdir, 'cb_data.db')
+        apply_migrations(db_path)
+        conn = sqlite3.connect(db_path)
+        codes, _ = populate(conn, HISTORY_TABLE_NAME, args.bonds, args.days, args.seed)
+        conn.close()
+        # 与收集器启动时相同：迁移已全部执行，只刷新统计
+        apply_migrations(db_path)
+        conn = sqlite3.connect(db_path)
+        print(f"查询计划检查 ({args.bonds} 只债券 x {args.days} 个交易日):")
+        failures = check_plans(conn, codes)
+        conn.close()
+        print(f"查询计划检查完成: {len(QUERY_CHECKS) - failures}/{len(QUERY_CHECKS)} 通过")
+
+        if args.evaluate_without_rowid:
+            evaluate_without_rowid(args.bonds, args.days, args.seed, workdir)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
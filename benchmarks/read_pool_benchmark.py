@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+看板读连接池基准测试
+在临时数据库上写入模拟历史数据，后台线程模拟收集器持续写入，多个线程模拟并发的看板会话执行
+按日期筛选、评级列表和统计查询。分别用每次新建连接（原先的 get_connection）和只读连接池运行，
+对比查询延迟分位数、出错次数（如 database is locked），并输出连接池指标
+
+用法:
+    python benchmarks/read_pool_benchmark.py --sessions 8 --queries 200
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+sys.path[:0] = [REPO_ROOT, os.path.join(REPO_ROOT, 'stock_app'), BENCHMARK_DIR]
+
+from connection_pool import DEFAULT_POOL_SIZE
+from database import BondDatabase
+from query_plan_check import populate
+from schema_migrations import HISTORY_TABLE_NAME, apply_migrations
+
+
+class LegacyBondDatabase(BondDatabase):
+    """原先的做法：每次调用新建一个读写连接"""
+
+    def get_connection(self):
+        return sqlite3.connect(self.db_path)
+
+
+def _writer(db_path: str, codes: List[str], dates: List[str], stop: threading.Event, counter: Dict) -> None:
+    """模拟收集器：每批在一个事务内更新一个交易日的行情"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    rng = random.Random(0)
+    while not stop.is_set():
+        trade_date = rng.choice(dates)
+        with conn:
+            conn.executemany(f"UPDATE {HISTORY_TABLE_NAME} SET price = ?, updated_at = CURRENT_TIMESTAMP WHERE trade_date = ? AND bond_code = ?",
+                             [(rng.uniform(90, 180), trade_date, code) for code in codes])
+        counter['batches'] += 1
+    conn.close()
+
+
+def _session(db: BondDatabase, dates: List[str], queries: int, seed: int, latencies: List[float], errors: List[str]) -> None:
+    rng = random.Random(seed)
+    for i in range(queries):
+        started = time.perf_counter()
+        try:
+            if i % 10 == 0:
+                db.get_database_stats()
+            elif i % 10 == 1:
+                db.get_bond_ratings()
+            else:
+                db.search_bonds({'date': rng.choice(dates)}, limit=100)
+        except Exception as e:
+            errors.append(str(e))
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+def run(db: BondDatabase, db_path: str, codes: List[str], dates: List[str], sessions: int, queries: int) -> Dict:
+    stop = threading.Event()
+    counter = {'batches': 0}
+    writer = threading.Thread(target=_writer, args=(db_path, codes, dates, stop, counter))
+    latencies: List[float] = []
+    errors: List[str] = []
+    threads = [threading.Thread(target=_session, args=(db, dates, queries, seed, latencies, errors)) for seed in range(sessions)]
+    writer.start()
+    started = time.perf_counter()
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    writer.join()
+    latencies.sort()
+    quantile = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else float('nan')
+    return {'seconds': elapsed, 'queries': len(latencies), 'errors': len(errors), 'p50_ms': quantile(0.5), 'p95_ms': quantile(0.95),
+            'p99_ms': quantile(0.99), 'writer_batches': counter['batches'], 'first_error': errors[0] if errors else None}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="对比每次新建连接与只读连接池在并发读写下的查询延迟")
+    parser.add_argument('--bonds', type=int, default=400, help="模拟债券数量")
+    parser.add_argument('--days', type=int, default=250, help="每只债券的交易日数")
+    parser.add_argument('--sessions', type=int, default=8, help="并发看板会话数")
+    parser.add_argument('--queries', type=int, default=200, help="每个会话的查询次数")
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE, help="连接池大小")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='cb_read_pool_') as workdir:
+        db_path = os.path.join(workdir, 'cb_data.db')
+        apply_migrations(db_path)
+        conn = sqlite3.connect(db_path)
+        codes, dates = populate(conn, HISTORY_TABLE_NAME, args.bonds, args.days, args.seed)
+        conn.close()
+
+        legacy = run(LegacyBondDatabase(db_path), db_path, codes, dates, args.sessions, args.queries)
+        pooled_db = BondDatabase(db_path, pool_size=args.pool_size)
+        pooled = run(pooled_db, db_path, codes, dates, args.sessions, args.queries)
+
+        print(f"模拟数据: {len(codes)} 只债券 x {len(dates)} 个交易日, {args.sessions} 个并发会话 x {args.queries} 次查询, 后台持续写入")
+        print(f"  {'':10s} {'总耗时(秒)':>10s} {'p50(ms)':>9s} {'p95(ms)':>9s} {'p99(ms)':>9s} {'出错':>6s} {'写入批次':>8s}")
+        for name, result in (('每次新建', legacy), ('连接池', pooled)):
+            print(f"  {name:10s} {result['seconds']:10.2f} {result['p50_ms']:9.2f} {result['p95_ms']:9.2f} {result['p99_ms']:9.2f} "
+                  f"{result['errors']:6d} {result['writer_batches']:8d}")
+            if result['first_error']:
+                print(f"    首个错误: {result['first_error']}")
+        print(f"  连接池指标: {pooled_db.get_pool_stats()}")
+    return 1 if pooled['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
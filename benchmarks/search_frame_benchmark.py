@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+查询结果 DataFrame 内存基准测试
+在临时数据库上写入模拟历史数据，对比原先的 search_bonds（float64 + 字符串，再由看板复制、to_numeric、换算单位）
+与压缩类型的 search_bonds(display_units=True) 在单日、全历史查询下的结果内存、读取内存峰值和耗时，
+并核对两者换算后的数值一致
+
+用法:
+    python benchmarks/search_frame_benchmark.py --bonds 400 --days 750
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+sys.path[:0] = [REPO_ROOT, os.path.join(REPO_ROOT, 'stock_app'), BENCHMARK_DIR]
+
+import numpy as np
+import pandas as pd
+
+from database import BondDatabase
+from query_plan_check import populate
+from schema_migrations import HISTORY_TABLE_NAME, apply_migrations
+
+NUMERIC_COLUMNS = ['price', 'premium_rate', 'double_low', 'conv_value', 'stock_price', 'stock_pb', 'conv_price', 'remaining_years',
+                   'remaining_size', 'ytm_before_tax', 'turnover_rate', 'put_trigger_price', 'force_redeem_trigger_price',
+                   'pure_bond_value', 'pure_bond_premium_rate', 'conv_proportion', 'price_chg_pct', 'stock_chg_pct',
+                   'open_price', 'high_price', 'low_price']
+
+
+def legacy_dashboard_frame(db: BondDatabase, filters):
+    """原先的路径：默认类型读取，看板再复制、逐列 to_numeric、换算成交量和成交额"""
+    with db.get_connection() as conn:
+        where_clause, params = db.build_where_conditions(filters)
+        df = pd.read_sql_query(f"SELECT * FROM {HISTORY_TABLE_NAME} WHERE {where_clause} ORDER BY double_low ASC", conn, params=params)
+    display_df = df.copy()
+    for col in NUMERIC_COLUMNS:
+        display_df[col] = pd.to_numeric(display_df[col], errors='coerce')
+    display_df['volume'] = display_df['volume'] / 100
+    display_df['turnover'] = display_df['turnover'] / 10000
+    return display_df
+
+
+def measure(func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / 1024 / 1024
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="对比原先与压缩类型查询结果的内存和耗时")
+    parser.add_argument('--bonds', type=int, default=400, help="模拟债券数量")
+    parser.add_argument('--days', type=int, default=750, help="每只债券的交易日数")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='cb_search_frame_') as workdir:
+        db_path = os.path.join(workdir, 'cb_data.db')
+        apply_migrations(db_path)
+        conn = sqlite3.connect(db_path)
+        _, dates = populate(conn, HISTORY_TABLE_NAME, args.bonds, args.days, args.seed)
+        conn.close()
+        db = BondDatabase(db_path)
+
+        failures = 0
+        print(f"模拟数据: {args.bonds} 只债券 x {args.days} 个交易日")
+        print(f"  {'':8s} {'原先内存(MB)':>12s} {'压缩内存(MB)':>12s} {'原先峰值(MB)':>12s} {'压缩峰值(MB)':>12s} {'原先(秒)':>9s} {'压缩(秒)':>9s}")
+        for name, filters in (('单日', {'date': dates[-1]}), ('全历史', {})):
+            legacy, legacy_seconds, legacy_peak = measure(lambda: legacy_dashboard_frame(db, filters))
+            compact, compact_seconds, compact_peak = measure(lambda: db.search_bonds(filters, display_units=True))
+            legacy_mb = legacy.memory_usage(deep=True).sum() / 1024 / 1024
+            compact_mb = compact.memory_usage(deep=True).sum() / 1024 / 1024
+            print(f"  {name:8s} {legacy_mb:12.2f} {compact_mb:12.2f} {legacy_peak:12.2f} {compact_peak:12.2f} "
+                  f"{legacy_seconds:9.3f} {compact_seconds:9.3f}")
+            # 两种路径的数值在 float32 精度内一致（同一排序下逐行比较）
+            for col in NUMERIC_COLUMNS + ['volume', 'turnover']:
+                expected = legacy[col].fillna(0).to_numpy(dtype=np.float64)
+                if not np.allclose(compact[col].to_numpy(dtype=np.float64), expected, rtol=1e-6, atol=1e-4):
+                    print(f"    数值不一致: {col}")
+                    failures += 1
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据源熔断与路由
+每个数据源一个熔断器（关闭 / 打开 / 半开）：连续失败达到阈值后打开，冷却期内的请求直接跳过，
+冷却期满后放行一个探测请求，成功则恢复，失败则加倍冷却时间。
+同时按延迟和成功率的指数加权平均 (EWMA) 为候选数据源排序，结果持久化到 source_status_report.json，
+下次启动时直接沿用，故障数据源不必每只债券都先付出重试与退避的代价
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from enum import Enum
+from typing import Dict, List, Optional, Sequence
+
+DEFAULT_REPORT_PATH = os.path.join('data', 'source_status_report.json')
+
+EWMA_ALPHA = 0.2
+# 没有历史样本的数据源按 1 秒延迟、全部成功估算
+DEFAULT_LATENCY_SECONDS = 1.0
+MIN_SUCCESS_RATE = 0.05
+# 候选列表中每靠后一位，预期代价乘以该系数；靠后的数据源需明显更优才会被提到前面
+ROUTE_PREFERENCE_STEP = 2.0
+
+
+class BreakerState(Enum):
+    """熔断器状态"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """单个数据源的熔断器及其 EWMA 健康度，线程安全"""
+
+    def __init__(self, source: str, failure_threshold: int = 5, open_seconds: float = 30.0,
+                 max_open_seconds: float = 300.0):
+        self.source = source
+        self.failure_threshold = failure_threshold
+        self.base_open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.state = BreakerState.CLOSED
+        self.consecutive_failures = 0
+        self.open_seconds = open_seconds
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.ewma_latency: Optional[float] = None
+        self.ewma_success: Optional[float] = None
+        self.samples = 0
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    def _cooldown_elapsed(self, now: float) -> bool:
+        return now - self.opened_at >= self.open_seconds
+
+    def is_available(self) -> bool:
+        """是否可以尝试该数据源（不占用半开探测名额），用于排序和筛选"""
+        with self._lock:
+            if self.state == BreakerState.CLOSED: return True
+            if self.state == BreakerState.OPEN: return self._cooldown_elapsed(time.monotonic())
+            return not self.probe_in_flight
+
+    def try_acquire(self) -> bool:
+        """发请求前调用；打开状态下冷却期满时转为半开，并只放行一个探测请求"""
+        with self._lock:
+            if self.state == BreakerState.CLOSED: return True
+            if self.state == BreakerState.OPEN:
+                if not self._cooldown_elapsed(time.monotonic()): return False
+                self.state = BreakerState.HALF_OPEN
+                logging.info(f"数据源 {self.source} 熔断冷却结束，进入半开状态，放行探测请求")
+            if self.probe_in_flight: return False
+            self.probe_in_flight = True
+            return True
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self._update_ewma(latency, 1.0)
+            self.consecutive_failures = 0
+            if self.state != BreakerState.CLOSED:
+                logging.info(f"数据源 {self.source} 探测成功，熔断器恢复关闭")
+                self.state = BreakerState.CLOSED
+                self.open_seconds = self.base_open_seconds
+            self.probe_in_flight = False
+
+    def record_failure(self, latency: Optional[float] = None) -> None:
+        with self._lock:
+            self._update_ewma(latency, 0.0)
+            self.consecutive_failures += 1
+            if self.state == BreakerState.HALF_OPEN:
+                self.open_seconds = min(self.open_seconds * 2, self.max_open_seconds)
+                self._trip(f"探测失败，冷却 {self.open_seconds:.0f} 秒")
+            elif self.state == BreakerState.CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self._trip(f"连续失败 {self.consecutive_failures} 次，冷却 {self.open_seconds:.0f} 秒")
+            self.probe_in_flight = False
+
+    def _trip(self, reason: str) -> None:
+        self.state = BreakerState.OPEN
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        logging.warning(f"数据源 {self.source} 熔断: {reason}")
+
+    def _update_ewma(self, latency: Optional[float], success: float) -> None:
+        self.samples += 1
+        self.ewma_success = success if self.ewma_success is None else EWMA_ALPHA * success + (1 - EWMA_ALPHA) * self.ewma_success
+        if latency is not None:
+            self.ewma_latency = latency if self.ewma_latency is None else EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.ewma_latency
+
+    def expected_cost(self) -> float:
+        """预期代价 = 平均延迟 / 成功率，越小越优"""
+        with self._lock:
+            latency = self.ewma_latency if self.ewma_latency is not None else DEFAULT_LATENCY_SECONDS
+            success = self.ewma_success if self.ewma_success is not None else 1.0
+        return latency / max(success, MIN_SUCCESS_RATE)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {'state': self.state.value, 'ewma_latency': self.ewma_latency, 'ewma_success': self.ewma_success,
+                    'samples': self.samples, 'trips': self.trips, 'consecutive_failures': self.consecutive_failures}
+
+    def restore(self, saved: Dict) -> None:
+        """从持久化记录恢复 EWMA；熔断状态只在进程内有效，不恢复"""
+        with self._lock:
+            self.ewma_latency = saved.get('ewma_latency')
+            self.ewma_success = saved.get('ewma_success')
+            self.samples = saved.get('samples', 0)
+
+
+class SourceRouter:
+    """按数据源分组的熔断器集合，并负责为同一数据的多个来源排序"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, source: str, failure_threshold: int = 5, open_seconds: float = 30.0) -> None:
+        breaker = self.breaker(source)
+        with breaker._lock:
+            breaker.failure_threshold = failure_threshold
+            breaker.base_open_seconds = open_seconds
+            if breaker.state == BreakerState.CLOSED:
+                breaker.open_seconds = open_seconds
+
+    def breaker(self, source: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(source)
+            if breaker is None:
+                breaker = self._breakers[source] = CircuitBreaker(source)
+            return breaker
+
+    def order(self, sources: Sequence[str]) -> List[str]:
+        """按预期代价排序候选数据源，熔断中的数据源被剔除；候选列表本身的先后作为偏好"""
+        ranked = []
+        for rank, source in enumerate(sources):
+            breaker = self.breaker(source)
+            if not breaker.is_available(): continue
+            ranked.append((breaker.expected_cost() * ROUTE_PREFERENCE_STEP ** rank, rank, source))
+        return [source for _, _, source in sorted(ranked)]
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {source: breaker.snapshot() for source, breaker in sorted(breakers.items())}
+
+    def load_report(self, path: str = DEFAULT_REPORT_PATH) -> None:
+        """从数据源状态报告的 routing 字段恢复各数据源的 EWMA"""
+        if not os.path.exists(path): return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                routing = json.load(f).get('routing', {})
+        except Exception as e:
+            logging.warning(f"读取数据源路由记录失败，将从默认值开始: {e}")
+            return
+        for source, saved in routing.items():
+            self.breaker(source).restore(saved)
+        if routing:
+            logging.info(f"已从 {path} 恢复 {len(routing)} 个数据源的路由统计")
+
+
+_source_router: Optional[SourceRouter] = None
+_source_router_lock = threading.Lock()
+
+
+def get_source_router() -> SourceRouter:
+    """获取进程内共享的路由器，首次调用时从数据源状态报告恢复 EWMA"""
+    global _source_router
+    with _source_router_lock:
+        if _source_router is None:
+            _source_router = SourceRouter()
+            _source_router.load_report()
+        return _source_router
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史数据收集的断点续跑账本
+逐只债券记录收集状态，进程中断后可只重跑未完成和失败的债券
+"""
+
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+LEDGER_TABLE_NAME = 'collection_ledger'
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+CREATE_LEDGER_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {LEDGER_TABLE_NAME} (
+    bond_code TEXT NOT NULL, stage TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT, rows_written INTEGER NOT NULL DEFAULT 0, started_at TIMESTAMP, finished_at TIMESTAMP,
+    PRIMARY KEY (bond_code, stage)
+)
+"""
+
+
+class CollectionLedger:
+    """收集任务账本，所有写入经由同一连接并加锁，可在工作线程和写线程中调用"""
+
+    def __init__(self, db_path: str, stage: str = 'historical'):
+        self.stage = stage
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._run_started = time.monotonic()
+        self._finished_this_run = 0
+        self.total = 0
+        with self._lock, self._conn:
+            self._conn.execute(CREATE_LEDGER_TABLE_SQL)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def start_run(self, bond_codes: List[str]) -> None:
+        """全新运行：清空本阶段账本，所有债券置为待处理"""
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {LEDGER_TABLE_NAME} WHERE stage = ?", (self.stage,))
+            self._conn.executemany(f"INSERT INTO {LEDGER_TABLE_NAME} (bond_code, stage, status) VALUES (?, ?, ?)",
+                                   [(code, self.stage, STATUS_PENDING) for code in bond_codes])
+        self._reset_progress(len(bond_codes))
+
+    def plan_resume(self, bond_codes: List[str]) -> List[str]:
+        """续跑：只安排未完成和失败的债券，待处理的在前，失败的按重试次数排在最后；账本中没有的债券视为待处理"""
+        with self._lock, self._conn:
+            rows = self._conn.execute(f"SELECT bond_code, status, attempts FROM {LEDGER_TABLE_NAME} WHERE stage = ?",
+                                      (self.stage,)).fetchall()
+            known = {code: (status, attempts) for code, status, attempts in rows}
+            new_codes = [code for code in bond_codes if code not in known]
+            self._conn.executemany(f"INSERT INTO {LEDGER_TABLE_NAME} (bond_code, stage, status) VALUES (?, ?, ?)",
+                                   [(code, self.stage, STATUS_PENDING) for code in new_codes])
+        pending, failed = [], []
+        for code in bond_codes:
+            status, attempts = known.get(code, (STATUS_PENDING, 0))
+            if status == STATUS_DONE: continue
+            if status == STATUS_FAILED:
+                failed.append((attempts, code))
+            else:
+                pending.append(code)
+        scheduled = pending + [code for _, code in sorted(failed)]
+        self._reset_progress(len(bond_codes), already_done=len(bond_codes) - len(scheduled))
+        return scheduled
+
+    def _reset_progress(self, total: int, already_done: int = 0) -> None:
+        self.total = total
+        self._already_done = already_done
+        self._finished_this_run = 0
+        self._run_started = time.monotonic()
+
+    def mark_running(self, bond_code: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE {LEDGER_TABLE_NAME} SET status = ?, attempts = attempts + 1, started_at = ? "
+                               f"WHERE bond_code = ? AND stage = ?",
+                               (STATUS_RUNNING, datetime.now().isoformat(timespec='seconds'), bond_code, self.stage))
+
+    def mark_done(self, bond_code: str, rows_written: int) -> None:
+        self._finish(bond_code, STATUS_DONE, None, rows_written)
+
+    def mark_failed(self, bond_code: str, error: str) -> None:
+        self._finish(bond_code, STATUS_FAILED, error[:500], 0)
+
+    def _finish(self, bond_code: str, status: str, error: Optional[str], rows_written: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE {LEDGER_TABLE_NAME} SET status = ?, last_error = ?, rows_written = rows_written + ?, "
+                               f"finished_at = ? WHERE bond_code = ? AND stage = ?",
+                               (status, error, rows_written, datetime.now().isoformat(timespec='seconds'), bond_code, self.stage))
+            self._finished_this_run += 1
+
+    def get_summary(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT status, COUNT(*), COALESCE(SUM(rows_written), 0) FROM {LEDGER_TABLE_NAME} "
+                                      f"WHERE stage = ? GROUP BY status", (self.stage,)).fetchall()
+        summary = {status: count for status, count, _ in rows}
+        summary['rows_written'] = sum(rows_written for _, _, rows_written in rows)
+        return summary
+
+    def format_progress(self) -> str:
+        """供进度日志使用：账本口径的完成数及按本次运行速度估算的剩余时间"""
+        with self._lock:
+            finished = self._already_done + self._finished_this_run
+            finished_this_run = self._finished_this_run
+        elapsed = time.monotonic() - self._run_started
+        remaining = max(0, self.total - finished)
+        if finished_this_run and remaining:
+            eta_seconds = int(elapsed / finished_this_run * remaining)
+            eta = f"{eta_seconds // 3600}时{eta_seconds % 3600 // 60:02d}分{eta_seconds % 60:02d}秒"
+        else:
+            eta = "--"
+        return f"账本已完成 {finished}/{self.total}，预计剩余 {eta}"
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+声明式列定义与向量化清洗
+各数据源返回的列名、类型和单位各不相同，这里统一用列定义描述，再由 normalize_frame 一次性完成
+重命名、类型转换、日期格式化和单位换算，全程只做列级运算，不逐单元格调用 Python 函数
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from lazy_import import lazy_module
+
+np = lazy_module('numpy')
+pd = lazy_module('pandas')
+
+
+@dataclass(frozen=True)
+class ColumnSpec:
+    """单列定义"""
+    name: str  # 目标列名
+    aliases: Tuple[str, ...] = ()  # 各数据源可能使用的原始列名，按优先级排列
+    dtype: str = 'float'  # float: 数值；str: 去空白的文本；code: 去掉 sh/sz 前缀的证券代码；date: YYYY-MM-DD；raw: 只重命名
+    scale: float = 1.0  # 单位换算系数
+    scale_if_mean_below: Optional[float] = None  # 仅当列均值低于该阈值时才换算（如以手为单位的成交量）
+    required: bool = False  # 该列为空（含无法解析的日期）的行将被丢弃
+
+
+# 债券日行情（东财 stock_zh_a_hist / 新浪 bond_zh_hs_cov_daily）
+BOND_HISTORY_SCHEMA = (
+    ColumnSpec('trade_date', ('日期', 'date'), 'date', required=True),
+    ColumnSpec('open_price', ('开盘', 'open')),
+    ColumnSpec('high_price', ('最高', 'high')),
+    ColumnSpec('low_price', ('最低', 'low')),
+    ColumnSpec('price', ('收盘', 'close')),
+    ColumnSpec('volume', ('成交量', 'volume'), scale=100, scale_if_mean_below=1000000),
+    ColumnSpec('turnover', ('成交额', 'amount')),
+    ColumnSpec('turnover_rate', ('换手率',)),
+)
+
+# 正股日行情（东财 stock_zh_a_hist / 腾讯 stock_zh_a_hist_tx）
+STOCK_HISTORY_SCHEMA = (
+    ColumnSpec('trade_date', ('日期', 'date'), 'date', required=True),
+    ColumnSpec('stock_price', ('收盘', 'close')),
+    ColumnSpec('stock_chg_pct', ('涨跌幅',)),
+)
+
+# 债券价值分析（东财 bond_zh_cov_value_analysis）
+VALUE_ANALYSIS_SCHEMA = (
+    ColumnSpec('trade_date', ('日期',), 'date', required=True),
+    ColumnSpec('price_val', ('收盘价',)),
+    ColumnSpec('pure_bond_value', ('纯债价值',)),
+    ColumnSpec('conv_value', ('转股价值',)),
+    ColumnSpec('pure_bond_premium_rate', ('纯债溢价率',)),
+    ColumnSpec('premium_rate', ('转股溢价率',)),
+)
+
+# 全量可转债列表（同花顺 bond_zh_cov_info_ths）
+THS_BOND_LIST_SCHEMA = (
+    ColumnSpec('bond_code', ('债券代码',), 'raw'),
+    ColumnSpec('stock_code', ('正股代码',), 'code'),
+    ColumnSpec('bond_name', ('债券简称',), 'raw'),
+    ColumnSpec('stock_name', ('正股简称',), 'raw'),
+    ColumnSpec('maturity_date', ('到期时间',), 'date'),
+)
+
+# 最新数据（集思录 bond_cb_jsl）
+JSL_SCHEMA = (
+    ColumnSpec('bond_code', ('代码',), 'str'),
+    ColumnSpec('bond_name', ('转债名称',), 'str'),
+    ColumnSpec('price', ('现价',)),
+    ColumnSpec('price_chg_pct', ('涨跌幅',)),
+    ColumnSpec('stock_code', ('正股代码',), 'code'),
+    ColumnSpec('stock_name', ('正股名称',), 'str'),
+    ColumnSpec('stock_price', ('正股价',)),
+    ColumnSpec('stock_chg_pct', ('正股涨跌',)),
+    ColumnSpec('stock_pb', ('正股PB',)),
+    ColumnSpec('conv_price', ('转股价',)),
+    ColumnSpec('conv_value', ('转股价值',)),
+    ColumnSpec('premium_rate', ('转股溢价率',)),
+    ColumnSpec('bond_rating', ('债券评级',), 'str'),
+    ColumnSpec('put_trigger_price', ('回售触发价',)),
+    ColumnSpec('force_redeem_trigger_price', ('强赎触发价',)),
+    ColumnSpec('conv_proportion', ('转债占比',)),
+    ColumnSpec('maturity_date', ('到期时间',), 'str'),
+    ColumnSpec('remaining_years', ('剩余年限',)),
+    ColumnSpec('remaining_size', ('剩余规模',)),
+    ColumnSpec('turnover', ('成交额',)),
+    ColumnSpec('turnover_rate', ('换手率',)),
+    ColumnSpec('ytm_before_tax', ('到期税前收益',)),
+    ColumnSpec('double_low', ('双低',)),
+)
+
+# 最新数据（东财 bond_zh_cov）
+EASTMONEY_SCHEMA = (
+    ColumnSpec('bond_code', ('债券代码',), 'raw'),
+    ColumnSpec('bond_name', ('债券简称',), 'raw'),
+    ColumnSpec('subscription_date', ('申购日期',), 'raw'),
+    ColumnSpec('subscription_code', ('申购代码',), 'raw'),
+    ColumnSpec('stock_name', ('正股简称',), 'raw'),
+    ColumnSpec('conv_price', ('转股价格',)),
+    ColumnSpec('maturity_date', ('到期时间',), 'raw'),
+    ColumnSpec('bond_rating', ('信用评级',), 'raw'),
+)
+
+
+def _resolve_renames(columns: Sequence[str], schema: Sequence[ColumnSpec]) -> Dict[str, str]:
+    """为每个目标列挑出实际存在的原始列；目标列名本身已存在时不再重命名"""
+    present = set(columns)
+    renames = {}
+    for spec in schema:
+        if spec.name in present: continue
+        for alias in spec.aliases:
+            if alias in present and alias not in renames:
+                renames[alias] = spec.name
+                break
+    return renames
+
+
+def format_dates(values: pd.Series) -> pd.Series:
+    """一次解析后用 numpy 的 datetime64[D] 转换输出 YYYY-MM-DD，缺失值保持为 None"""
+    parsed = pd.to_datetime(values, errors='coerce')
+    days = parsed.to_numpy(dtype='datetime64[D]')
+    formatted = np.where(pd.isna(parsed).to_numpy(), None, days.astype(str))
+    return pd.Series(formatted, index=values.index, dtype=object)
+
+
+def _strip_text(values: pd.Series, pattern: Optional[str] = None) -> pd.Series:
+    text = values.astype(str).str.strip()
+    if pattern is not None:
+        text = text.str.replace(pattern, '', regex=True, case=False).str.strip()
+    return text.where(values.notna(), None)
+
+
+def normalize_frame(df: pd.DataFrame, schema: Sequence[ColumnSpec], keep_unmapped: bool = True) -> pd.DataFrame:
+    """按列定义一次性完成重命名、类型转换、日期格式化与单位换算"""
+    if df.empty: return df
+    df = df.rename(columns=_resolve_renames(df.columns, schema))
+    specs = [spec for spec in schema if spec.name in df.columns]
+    if not keep_unmapped:
+        df = df[[spec.name for spec in specs]].copy()
+
+    numeric_cols = [spec.name for spec in specs if spec.dtype == 'float']
+    if numeric_cols:
+        df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors='coerce')
+    for spec in specs:
+        if spec.dtype == 'date':
+            df[spec.name] = format_dates(df[spec.name])
+        elif spec.dtype == 'str':
+            df[spec.name] = _strip_text(df[spec.name])
+        elif spec.dtype == 'code':
+            df[spec.name] = _strip_text(df[spec.name], r'^(sh|sz)')
+        elif spec.dtype == 'float' and spec.scale != 1.0:
+            column = df[spec.name]
+            if spec.scale_if_mean_below is None:
+                df[spec.name] = column * spec.scale
+            elif column.notna().any() and column.mean() < spec.scale_if_mean_below:
+                df[spec.name] = column * spec.scale
+    required_cols = [spec.name for spec in specs if spec.required]
+    if required_cols:
+        df = df.dropna(subset=required_cols).reset_index(drop=True)
+    return df
+
+
+def schema_columns(schema: Sequence[ColumnSpec]) -> List[str]:
+    return [spec.name for spec in schema]
+
+
+def sanitize_text_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """去除文本列中无法按 UTF-8 编码的字符（如孤立代理项），只对整列都是字符串的列做列级处理"""
+    for col in df.select_dtypes(include=['object', 'string']).columns:
+        if pd.api.types.infer_dtype(df[col], skipna=True) == 'string':
+            df[col] = df[col].str.encode('utf-8', 'ignore').str.decode('utf-8', 'ignore')
+    return df
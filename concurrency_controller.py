@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+自适应并发控制 (AIMD)
+每个数据源维护一个并发上限：请求成功且延迟正常时加性增长（约每轮往返 +1），
+遇到连接被重置或限流时乘性减半；在途债券数也按同样规则调整。
+--workers 只作为上限，收集器自行找到上游能承受的最快速度，并记录并发变化轨迹
+"""
+
+import logging
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# 延迟超过基线的该倍数时视为拥塞前兆，不再增长
+LATENCY_TOLERANCE = 2.0
+DECREASE_FACTOR = 0.5
+BASELINE_ALPHA = 0.1
+
+
+class AIMDLimit:
+    """单个维度的 AIMD 并发上限，可作为上下文管理器占用一个并发名额"""
+
+    def __init__(self, name: str, initial: int, min_limit: int = 1, max_limit: int = 32):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.limit = float(min(max(initial, min_limit), self.max_limit))
+        self.in_flight = 0
+        self.baseline_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._started = time.monotonic()
+        self._cond = threading.Condition()
+        self.trajectory: List[Tuple[float, int, str]] = [(0.0, int(self.limit), 'initial')]
+
+    @property
+    def current(self) -> int:
+        return int(self.limit)
+
+    def __enter__(self) -> 'AIMDLimit':
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self, latency: float) -> None:
+        """延迟不高于基线的容忍倍数、且上限确实被用满时加性增长，每 limit 次成功约增加 1"""
+        with self._cond:
+            if self.baseline_latency is None:
+                self.baseline_latency = latency
+            healthy = latency <= self.baseline_latency * LATENCY_TOLERANCE
+            # 上限没有用满时（瓶颈在别处）增长没有依据，只会越过上游的真实容量
+            saturated = self.in_flight + 1 >= int(self.limit)
+            # 基线只吸收正常样本，避免拥塞时被慢请求抬高
+            if healthy:
+                self.baseline_latency = BASELINE_ALPHA * latency + (1 - BASELINE_ALPHA) * self.baseline_latency
+            if healthy and saturated:
+                self._set_limit(min(self.max_limit, self.limit + 1.0 / max(self.limit, 1.0)), 'increase')
+
+    def on_congestion(self, reason: str) -> None:
+        """连接被重置或限流时减半；同一轮往返内的多次信号只减一次"""
+        with self._cond:
+            now = time.monotonic()
+            cooldown = max(0.5, 2 * (self.baseline_latency or 0.0))
+            if now - self._last_decrease < cooldown: return
+            self._last_decrease = now
+            self._set_limit(max(self.min_limit, math.floor(self.limit * DECREASE_FACTOR)), f'decrease: {reason}')
+
+    def _set_limit(self, new_limit: float, reason: str) -> None:
+        old = int(self.limit)
+        self.limit = float(new_limit)
+        if int(self.limit) != old:
+            self.trajectory.append((round(time.monotonic() - self._started, 3), int(self.limit), reason))
+            logging.info(f"并发调整 [{self.name}]: {old} -> {int(self.limit)} ({reason})")
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict:
+        with self._cond:
+            limits = [limit for _, limit, _ in self.trajectory]
+            return {'limit': int(self.limit), 'min_seen': min(limits), 'max_seen': max(limits),
+                    'baseline_latency': self.baseline_latency, 'changes': len(self.trajectory) - 1,
+                    'trajectory': list(self.trajectory)}
+
+
+class ConcurrencyController:
+    """按数据源的 AIMD 并发上限，以及在途债券数的 AIMD 窗口"""
+
+    def __init__(self, max_workers: int, initial_limits: Dict[str, int]):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._initial_limits = initial_limits
+        self._sources: Dict[str, AIMDLimit] = {}
+        self.bonds = AIMDLimit('bonds', initial=max(2, max_workers // 4), min_limit=1, max_limit=max_workers * 2)
+
+    def source_limit(self, source: str) -> AIMDLimit:
+        with self._lock:
+            limit = self._sources.get(source)
+            if limit is None:
+                initial = self._initial_limits.get(source, 2)
+                limit = self._sources[source] = AIMDLimit(source, initial=initial, max_limit=max(initial, self.max_workers))
+            return limit
+
+    def on_success(self, source: str, latency: float) -> None:
+        self.source_limit(source).on_success(latency)
+
+    def on_congestion(self, source: str, reason: str) -> None:
+        """上游限流同时收缩该数据源并发和在途债券数"""
+        self.source_limit(source).on_congestion(reason)
+        self.bonds.on_congestion(f"{source} {reason}")
+
+    def on_bond_done(self, latency: float) -> None:
+        self.bonds.on_success(latency)
+
+    def bond_window(self) -> int:
+        return self.bonds.current
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            sources = dict(self._sources)
+        return {'max_workers': self.max_workers, 'bonds': self.bonds.get_stats(),
+                'sources': {source: limit.get_stats() for source, limit in sorted(sources.items())}}
+
+    def log_summary(self) -> None:
+        stats = self.get_stats()
+        parts = [f"债券窗口 {stats['bonds']['limit']} (区间 {stats['bonds']['min_seen']}-{stats['bonds']['max_seen']})"]
+        parts += [f"{source} {item['limit']} (区间 {item['min_seen']}-{item['max_seen']})" for source, item in stats['sources'].items()]
+        logging.info(f"自适应并发最终上限: {'，'.join(parts)}")
+
+
+_controller: Optional[ConcurrencyController] = None
+
+
+def configure_concurrency_controller(enabled: bool, max_workers: int = 8,
+                                     initial_limits: Optional[Dict[str, int]] = None) -> Optional[ConcurrencyController]:
+    """启用时创建进程内共享的自适应并发控制器；未启用时使用固定的并发上限"""
+    global _controller
+    _controller = ConcurrencyController(max_workers, initial_limits or {}) if enabled else None
+    return _controller
+
+
+def get_concurrency_controller() -> Optional[ConcurrencyController]:
+    return _controller
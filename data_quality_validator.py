@@ -4,43 +4,52 @@
 数据质量验证和完整性检查模块
 """
 
+from __future__ import annotations
+
 import os
 import sys
 import logging
-import pandas as pd
-import numpy as np
-from sqlalchemy import create_engine, text
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple, Optional
 import json
 
+from lazy_import import lazy_module
+from db_engine import get_engine
+from trading_calendar import TradingCalendar
+from history_stats import HistoryStats
+from stock_app.column_profiler import ColumnProfiler
+from stock_app.history_storage import IS_NORMALIZED_SQL, LATEST_TRADE_DATE_SQL
+
+pd = lazy_module('pandas')
+
 # 配置
 DB_FOLDER = 'data'
 DB_FILE = 'cb_data.db'
 DB_PATH = os.path.join(DB_FOLDER, DB_FILE)
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
-engine = create_engine(f'sqlite:///{DB_PATH}')
 
 
 class DataQualityValidator:
     """数据质量验证器"""
     
     def __init__(self):
-        self.engine = engine
+        self.engine = get_engine(DB_PATH)
+        # 只读取本地保存的交易日历，质量检查不访问网络
+        self.trade_calendar = TradingCalendar(DB_PATH)
+        self.history_stats = HistoryStats(DB_PATH)
+        self.column_profiler = ColumnProfiler(DB_PATH)
         
     def validate_data_completeness(self) -> Dict:
         logging.info("开始验证数据完整性")
         results = {'total_bonds': 0, 'total_records': 0, 'date_range': {}, 'missing_data': {}, 'data_quality_score': 0.0}
         try:
-            with self.engine.connect() as conn:
-                results['total_bonds'] = conn.execute(text("SELECT COUNT(DISTINCT bond_code) FROM cb_daily_history")).scalar_one_or_none() or 0
-                results['total_records'] = conn.execute(text("SELECT COUNT(*) FROM cb_daily_history")).scalar_one_or_none() or 0
-                date_info = conn.execute(text("SELECT MIN(trade_date), MAX(trade_date), COUNT(DISTINCT trade_date) FROM cb_daily_history")).fetchone()
-                if date_info and date_info[0]:
-                    results['date_range'] = {'start_date': date_info[0], 'end_date': date_info[1], 'trading_days': date_info[2]}
+            summary = self.history_stats.summary()
+            results['total_bonds'] = summary['total_bonds']
+            results['total_records'] = summary['total_records']
+            if summary['start_date']:
+                results['date_range'] = {'start_date': summary['start_date'], 'end_date': summary['end_date'], 'trading_days': summary['trading_days']}
             
-            results['missing_data'] = self._check_missing_data()
+            results['missing_data'] = self._check_missing_data(summary['total_records'])
             results['data_quality_score'] = self._calculate_quality_score(results)
             logging.info(f"数据完整性验证完成")
             return results
@@ -48,15 +57,16 @@ class DataQualityValidator:
             logging.error(f"数据完整性验证失败: {e}", exc_info=True)
             return results
     
-    def _check_missing_data(self) -> Dict:
+    def _check_missing_data(self, total_records: int) -> Dict:
         missing_data = {}
         try:
-            with self.engine.connect() as conn:
-                table_info = pd.read_sql("SELECT * FROM cb_daily_history LIMIT 0", conn)
-                total_records = conn.execute(text("SELECT COUNT(*) FROM cb_daily_history")).scalar_one_or_none() or 1
-                for col in table_info.columns:
-                    null_count = conn.execute(text(f"SELECT COUNT(*) FROM cb_daily_history WHERE {col} IS NULL")).scalar_one_or_none() or 0
-                    missing_data[col] = {'count': null_count, 'percentage': round((null_count / total_records) * 100, 2)}
+            # 与看板共用按数据版本缓存的字段画像，数据未变化时不再扫描历史表；这里算出的画像也会被看板直接复用
+            total_records = total_records or 1
+            for column in self.column_profiler.profile()['columns']:
+                null_count = column['null_count']
+                missing_data[column['column']] = {'count': null_count, 'percentage': round((null_count / total_records) * 100, 2),
+                                                  'distinct': column['distinct_count'], 'zero_count': column['zero_count'],
+                                                  'min': column['min'], 'max': column['max']}
         except Exception as e:
             logging.error(f"检查缺失数据失败: {e}", exc_info=True)
         return missing_data
@@ -84,17 +94,29 @@ class DataQualityValidator:
 
     def validate_data_freshness(self) -> Dict:
         logging.info("开始验证数据新鲜度")
-        results = {'latest_date': None, 'days_since_update': 0, 'freshness_score': 0.0}
+        results = {'latest_date': None, 'days_since_update': 0, 'trading_days_since_update': None, 'freshness_score': 0.0}
         try:
-            latest_date = pd.read_sql("SELECT MAX(trade_date) as latest_date FROM cb_daily_history", self.engine).iloc[0]['latest_date']
+            with self.engine.connect() as connection:
+                # 规范化存储下直接取事实表主键上的 MAX(day)，不经过兼容视图逐行换算日期
+                normalized = connection.exec_driver_sql(IS_NORMALIZED_SQL).scalar() > 0
+                latest_sql = LATEST_TRADE_DATE_SQL if normalized else "SELECT MAX(trade_date) FROM cb_daily_history"
+                latest_date = connection.exec_driver_sql(latest_sql).scalar()
             results['latest_date'] = latest_date
             if latest_date:
+                today_str = datetime.now().strftime('%Y-%m-%d')
                 days_since_update = (datetime.now() - datetime.strptime(latest_date, '%Y-%m-%d')).days
                 results['days_since_update'] = days_since_update
-                if days_since_update <= 1: freshness_score = 100.0
-                elif days_since_update <= 3: freshness_score = 90.0
-                elif days_since_update <= 7: freshness_score = 80.0
-                else: freshness_score = max(0.0, 80.0 - (days_since_update - 7))
+                # 按交易日计算落后程度，周末和节假日不扣分；本地没有交易日历时退回自然日
+                if self.trade_calendar.ensure_loaded():
+                    lag = int(self.trade_calendar.count_between(latest_date, today_str))
+                    results['trading_days_since_update'] = lag
+                else:
+                    logging.warning("本地没有交易日历，新鲜度按自然日计算")
+                    lag = days_since_update
+                if lag <= 1: freshness_score = 100.0
+                elif lag <= 3: freshness_score = 90.0
+                elif lag <= 7: freshness_score = 80.0
+                else: freshness_score = max(0.0, 80.0 - (lag - 7))
                 results['freshness_score'] = freshness_score
             logging.info(f"数据新鲜度验证完成")
             return results
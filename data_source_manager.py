@@ -5,12 +5,11 @@
 管理多个数据源的配置、优先级和故障转移
 """
 
+from __future__ import annotations
+
 import os
 import sys
 import logging
-import pandas as pd
-import akshare as ak
-import requests
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 import json
@@ -18,12 +17,23 @@ import time
 from dataclasses import dataclass
 from enum import Enum
 
+from lazy_import import lazy_module
+from rate_limiter import get_rate_limiter
+from response_cache import get_response_cache
+from column_schema import JSL_SCHEMA, EASTMONEY_SCHEMA, normalize_frame
+from api_metrics import get_api_metrics
+from circuit_breaker import BreakerState, get_source_router
+
 # 配置
 DB_FOLDER = 'data'
 DB_FILE = 'cb_data.db'
 DB_PATH = os.path.join(DB_FOLDER, DB_FILE)
+# 债券列表接口所属的数据源
+LIST_FUNC_SOURCES = {'bond_cb_jsl': 'jsl', 'bond_zh_cov': 'eastmoney'}
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+ak = lazy_module('akshare')
+pd = lazy_module('pandas')
+requests = lazy_module('requests')
 
 
 class DataSourceStatus(Enum):
@@ -40,7 +50,7 @@ class DataSourceConfig:
     name: str
     priority: int  # 优先级，数字越小优先级越高
     status: DataSourceStatus
-    request_delay: float  # 请求间隔（秒）
+    request_delay: float  # 单个工作线程的请求间隔（秒），rate_limiter.SOURCE_RATE_LIMITS 据此换算
     max_retries: int  # 最大重试次数
     timeout: int  # 超时时间（秒）
     last_success: Optional[datetime] = None
@@ -95,12 +105,19 @@ class DataSourceManager:
                 timeout=10
             )
         }
+        # 请求速率由 rate_limiter 按工作线程数统一配置（request_delay 为单个线程的请求间隔），此处不再覆盖
+        source_router = get_source_router()
+        for source_id, config in self.sources.items():
+            # 连续 max_retries 次调用在重试后仍失败即熔断，冷却后半开探测自动恢复，不再永久停用
+            source_router.configure(source_id, failure_threshold=config.max_retries)
     
     def get_source_by_priority(self) -> List[Tuple[str, DataSourceConfig]]:
         """按优先级获取数据源"""
+        # INACTIVE 表示熔断中，冷却期满后熔断器允许探测时重新参与
+        source_router = get_source_router()
         active_sources = [
             (source_id, config) for source_id, config in self.sources.items()
-            if config.status == DataSourceStatus.ACTIVE
+            if config.status != DataSourceStatus.MAINTENANCE and source_router.breaker(source_id).is_available()
         ]
         return sorted(active_sources, key=lambda x: x[1].priority)
     
@@ -121,33 +138,41 @@ class DataSourceManager:
             logging.info(f"数据源 {source_id} 状态更新为: {status.value}")
     
     def get_bond_list_with_fallback(self) -> pd.DataFrame:
-        """获取债券列表（带故障转移）"""
-        for source_id, config in self.get_source_by_priority():
+        """获取债券列表（带故障转移）；按 EWMA 预期代价排序数据源，静态优先级只作为同等条件下的偏好"""
+        candidates = {source_id: config for source_id, config in self.get_source_by_priority() if source_id in LIST_FUNC_SOURCES.values()}
+        for source_id in get_source_router().order(list(candidates)):
+            config = candidates[source_id]
+            breaker = get_source_router().breaker(source_id)
+            if not breaker.try_acquire():
+                logging.info(f"数据源 {config.name} 熔断中，跳过")
+                continue
+            started = time.perf_counter()
             try:
                 logging.info(f"尝试从 {config.name} 获取债券列表")
+                get_rate_limiter().acquire(source_id)
                 
                 if source_id == 'jsl':
                     result = self._get_bond_list_from_jsl()
-                elif source_id == 'eastmoney':
+                else:
                     result = self._get_bond_list_from_eastmoney()
-                else: continue
                 
                 if not result.empty:
+                    breaker.record_success(time.perf_counter() - started)
                     self.update_source_status(source_id, DataSourceStatus.ACTIVE)
                     logging.info(f"成功从 {config.name} 获取到 {len(result)} 只债券")
                     return result
                 else:
+                    breaker.record_failure(time.perf_counter() - started)
                     self.update_source_status(source_id, DataSourceStatus.ERROR, "返回空数据")
                     
             except Exception as e:
+                breaker.record_failure(time.perf_counter() - started)
                 error_msg = str(e)
                 logging.error(f"从 {config.name} 获取债券列表失败: {error_msg}", exc_info=True)
                 self.update_source_status(source_id, DataSourceStatus.ERROR, error_msg)
-                if config.error_count >= config.max_retries:
-                    self.update_source_status(source_id, DataSourceStatus.INACTIVE, "错误次数过多")
-                    logging.warning(f"数据源 {config.name} 暂时禁用")
-            
-            time.sleep(config.request_delay)
+            if breaker.snapshot()['state'] == BreakerState.OPEN.value:
+                self.update_source_status(source_id, DataSourceStatus.INACTIVE, "错误次数过多，熔断中")
+                logging.warning(f"数据源 {config.name} 暂时禁用，冷却后自动探测恢复")
         
         logging.error("所有数据源都无法获取债券列表")
         return pd.DataFrame()
@@ -159,50 +184,38 @@ class DataSourceManager:
             with open(cookie_path, 'r', encoding='utf-8') as f:
                 cookie = f.read().strip()
         
-        bond_df = ak.bond_cb_jsl(cookie=cookie) if cookie else ak.bond_cb_jsl()
+        jsl_kwargs = {'cookie': cookie} if cookie else {}
+        bond_df = self._fetch_with_cache(ak.bond_cb_jsl, **jsl_kwargs)
         return self._clean_jsl_data(bond_df)
     
     def _get_bond_list_from_eastmoney(self) -> pd.DataFrame:
-        bond_df = ak.bond_zh_cov()
+        bond_df = self._fetch_with_cache(ak.bond_zh_cov)
         return self._clean_eastmoney_data(bond_df)
 
+    def _fetch_with_cache(self, func, **kwargs) -> pd.DataFrame:
+        """启用响应缓存时经由缓存获取，异常仍向上抛出以触发故障转移"""
+        cache = get_response_cache()
+        if cache is None: return self._timed_call(func, **kwargs)
+        return cache.fetch(func.__name__, kwargs, lambda: self._timed_call(func, **kwargs))
+
+    def _timed_call(self, func, **kwargs) -> pd.DataFrame:
+        """记录接口调用耗时与返回行数，异常原样抛出"""
+        source = LIST_FUNC_SOURCES.get(func.__name__)
+        started = time.perf_counter()
+        try:
+            result = func(**kwargs)
+        except Exception:
+            get_api_metrics().record_call(func.__name__, source, time.perf_counter() - started, error=True)
+            raise
+        get_api_metrics().record_call(func.__name__, source, time.perf_counter() - started,
+                                      rows=len(result) if isinstance(result, pd.DataFrame) else 0)
+        return result
+
     def _clean_jsl_data(self, df: pd.DataFrame) -> pd.DataFrame:
-        if df.empty: return df
-        column_mapping = {
-            '代码': 'bond_code', '转债名称': 'bond_name', '现价': 'price', '涨跌幅': 'price_chg_pct', '正股代码': 'stock_code',
-            '正股名称': 'stock_name', '正股价': 'stock_price', '正股涨跌': 'stock_chg_pct', '正股PB': 'stock_pb',
-            '转股价': 'conv_price', '转股价值': 'conv_value', '转股溢价率': 'premium_rate', '债券评级': 'bond_rating',
-            '回售触发价': 'put_trigger_price', '强赎触发价': 'force_redeem_trigger_price', '转债占比': 'conv_proportion',
-            '到期时间': 'maturity_date', '剩余年限': 'remaining_years', '剩余规模': 'remaining_size', '成交额': 'turnover',
-            '换手率': 'turnover_rate', '到期税前收益': 'ytm_before_tax', '双低': 'double_low'
-        }
-        df = df.rename(columns=column_mapping)
-        numeric_cols = [
-            'price', 'price_chg_pct', 'stock_price', 'stock_chg_pct', 'stock_pb', 'conv_price', 'conv_value',
-            'premium_rate', 'put_trigger_price', 'force_redeem_trigger_price', 'conv_proportion',
-            'remaining_years', 'remaining_size', 'turnover', 'turnover_rate', 'ytm_before_tax', 'double_low'
-        ]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        string_cols = ['bond_code', 'bond_name', 'stock_code', 'stock_name', 'bond_rating', 'maturity_date']
-        for col in string_cols:
-            if col in df.columns:
-                df[col] = df[col].astype(str).str.strip()
-        if 'stock_code' in df.columns:
-            df['stock_code'] = df['stock_code'].astype(str).str.replace(r'^(sh|sz)', '', regex=True, case=False).str.strip()
-        return df
+        return normalize_frame(df, JSL_SCHEMA)
 
     def _clean_eastmoney_data(self, df: pd.DataFrame) -> pd.DataFrame:
-        if df.empty: return df
-        column_mapping = {
-            '债券代码': 'bond_code', '债券简称': 'bond_name', '申购日期': 'subscription_date', '申购代码': 'subscription_code',
-            '正股简称': 'stock_name', '转股价格': 'conv_price', '到期时间': 'maturity_date', '信用评级': 'bond_rating'
-        }
-        df = df.rename(columns=column_mapping)
-        if 'conv_price' in df.columns:
-            df['conv_price'] = pd.to_numeric(df['conv_price'], errors='coerce')
-        return df
+        return normalize_frame(df, EASTMONEY_SCHEMA)
 
     def get_source_status_report(self) -> Dict:
         """获取数据源状态报告"""
@@ -217,7 +230,9 @@ class DataSourceManager:
                     'last_success': config.last_success.isoformat() if config.last_success else None,
                     'last_error': config.last_error
                 } for source_id, config in self.sources.items()
-            }
+            },
+            # 各数据源的熔断状态与延迟/成功率 EWMA，下次启动时用于数据源排序
+            'routing': get_source_router().snapshot()
         }
     
     def save_source_status_report(self) -> None:
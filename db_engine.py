@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享的数据库引擎
+引擎在第一次使用时才创建，同一数据库文件在进程内只创建一个；SQLAlchemy 也随之延迟导入
+"""
+
+import os
+import threading
+from typing import Dict
+
+DB_FOLDER = 'data'
+DB_FILE = 'cb_data.db'
+DB_PATH = os.path.join(DB_FOLDER, DB_FILE)
+
+_engines: Dict[str, object] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(db_path: str = DB_PATH):
+    """获取（必要时创建）指定 SQLite 文件的 SQLAlchemy 引擎"""
+    with _engines_lock:
+        engine = _engines.get(db_path)
+        if engine is None:
+            from sqlalchemy import create_engine
+            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+            engine = _engines[db_path] = create_engine(f'sqlite:///{db_path}')
+        return engine
+
+
+def text(statement: str):
+    """sqlalchemy.text 的延迟导入版本"""
+    from sqlalchemy import text as sqlalchemy_text
+    return sqlalchemy_text(statement)
@@ -5,72 +5,251 @@
 修复了因不同接口返回不同列名导致的 KeyError
 """
 
+from __future__ import annotations
+
 import os
-import sys
 import logging
-import pandas as pd
-import akshare as ak
-from sqlalchemy import create_engine, text, MetaData, Table
-from sqlalchemy.dialects import sqlite
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime
-import requests
+import threading
+from contextlib import nullcontext
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple, Callable
 import json
 import inspect
 
+from lazy_import import lazy_module
+from db_engine import get_engine
+from history_cache import SingleFlightFrameCache
+from history_writer import HistoryWriter, frame_to_rows, history_insert_statements
+from collection_ledger import CollectionLedger
+from stock_app.history_storage import BOND_WATERMARKS_SQL, IS_NORMALIZED_SQL
+from column_schema import (BOND_HISTORY_SCHEMA, STOCK_HISTORY_SCHEMA, VALUE_ANALYSIS_SCHEMA, THS_BOND_LIST_SCHEMA,
+                           normalize_frame, schema_columns)
+from rate_limiter import get_rate_limiter, is_throttle_error
+from response_cache import get_response_cache, may_have_today_bar
+from api_metrics import get_api_metrics
+from circuit_breaker import get_source_router
+from concurrency_controller import get_concurrency_controller
+from hedging import HedgedFetcher
+
 # --- 配置区 ---
 DB_FOLDER = 'data'
 DB_FILE = 'cb_data.db'
 DB_PATH = os.path.join(DB_FOLDER, DB_FILE)
 HISTORY_TABLE_NAME = 'cb_daily_history'
+# 写入历史表时随每条记录携带的债券基础信息字段
+BOND_INFO_COLUMNS = ['bond_code', 'stock_code', 'bond_name', 'stock_name']
+
+ak = lazy_module('akshare')
+pd = lazy_module('pandas')
+
+# 单只债券内部三路抓取的执行方式：sequential 逐个请求，concurrent 三路并发
+FETCH_MODES = ('sequential', 'concurrent')
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
-engine = create_engine(f'sqlite:///{DB_PATH}')
+# akshare 接口所属的数据源
+AKSHARE_FUNC_SOURCES = {
+    'stock_zh_a_hist': 'eastmoney', 'bond_zh_cov_value_analysis': 'eastmoney', 'bond_zh_cov': 'eastmoney',
+    'bond_zh_hs_cov_daily': 'sina', 'tool_trade_date_hist_sina': 'sina',
+    'stock_zh_a_hist_tx': 'tencent',
+    'bond_zh_cov_info_ths': 'ths',
+    'bond_cb_jsl': 'jsl',
+}
+SOURCE_DISPLAY_NAMES = {'eastmoney': '东财', 'sina': '新浪', 'tencent': '腾讯', 'ths': '同花顺', 'jsl': '集思录'}
+# 每个数据源允许同时在途的请求数（所有工作线程共享）
+SOURCE_MAX_CONCURRENCY = {'eastmoney': 4, 'sina': 4, 'tencent': 4, 'ths': 2, 'jsl': 2}
+_source_semaphores = {source: threading.BoundedSemaphore(limit) for source, limit in SOURCE_MAX_CONCURRENCY.items()}
+# concurrent 模式下单只债券的三路请求同时在途：正股行情优先走腾讯，不与债券行情、价值分析在东财的限流额度上互相排队。
+# 债券行情仍按路由器排序，新浪的转债日线缺少成交额和换手率；腾讯熔断或无数据时换回东财
+CONCURRENT_SOURCE_PREFERENCE = {'stock_history': ('tencent', 'eastmoney')}
+
+def get_func_source(func: Callable) -> Optional[str]:
+    """根据 akshare 函数名确定其数据源，未登记的接口返回 None"""
+    return AKSHARE_FUNC_SOURCES.get(getattr(func, '__name__', ''))
 
 def robust_akshare_call(func: Callable, max_retries: int = 3, initial_delay: float = 2.0, **kwargs):
-    delay = initial_delay
+    """带重试的 akshare 调用；启用响应缓存时先查本地缓存，离线模式下只读缓存"""
+    cache = get_response_cache()
+    if cache is None:
+        return _call_with_retries(func, max_retries, initial_delay, **kwargs)
+    return cache.fetch(func.__name__, kwargs, lambda: _call_with_retries(func, max_retries, initial_delay, **kwargs))
+
+def fetch_daily_bars(func: Callable, date_column: str, start_date: Optional[str] = None, **kwargs) -> pd.DataFrame:
+    """支持 start_date/end_date 的日线请求。截至昨天的部分不再变化，以 end_date=昨天 为键永久缓存；当天的部分收盘前仍在变化，不写入缓存。
+    缓存命中时只补请求当天一段（周末和开盘前不请求）；未命中时一次请求到最新，再把截至昨天的部分拆出来写入缓存"""
+    range_kwargs = dict(kwargs, start_date=start_date.replace('-', '')) if start_date else dict(kwargs)
+    cache = get_response_cache()
+    if cache is None:
+        return _call_with_retries(func, 3, 2.0, **range_kwargs)
+    now = datetime.now()
+    today = now.strftime('%Y%m%d')
+    settled_kwargs = dict(range_kwargs, end_date=(now - timedelta(days=1)).strftime('%Y%m%d'))
+    settled = cache.get(func.__name__, settled_kwargs)
+    if settled is not None:
+        if cache.offline or not may_have_today_bar(now): return settled
+        tail = _call_with_retries(func, 3, 2.0, **dict(kwargs, start_date=today, end_date=today))
+        return settled if tail.empty else pd.concat([settled, tail], ignore_index=True)
+    if cache.offline:
+        # 离线模式下由缓存记录未命中并返回空表
+        return cache.fetch(func.__name__, settled_kwargs, pd.DataFrame)
+    df = _call_with_retries(func, 3, 2.0, **range_kwargs)
+    if isinstance(df, pd.DataFrame) and date_column in df.columns:
+        settled_rows = pd.to_datetime(df[date_column], errors='coerce') < pd.Timestamp(now.date())
+        cache.put(func.__name__, settled_kwargs, df[settled_rows].reset_index(drop=True))
+    return df
+
+def _call_with_retries(func: Callable, max_retries: int, initial_delay: float, **kwargs):
     func_params = inspect.signature(func).parameters
+    func_name = func.__name__
+    source = get_func_source(func)
+    controller = get_concurrency_controller() if source else None
+    # 自适应模式下由 AIMD 上限代替固定信号量
+    source_slot = controller.source_limit(source) if controller is not None else _source_semaphores.get(source)
+    rate_limiter = get_rate_limiter()
+    metrics = get_api_metrics()
+    breaker = get_source_router().breaker(source) if source else None
+    if breaker is not None and not breaker.try_acquire():
+        # 数据源熔断中：不再等待重试与退避，直接交给调用方换用其他数据源
+        logging.debug(f"数据源 {source} 熔断中，跳过 {func_name}: {kwargs.get('symbol')}")
+        metrics.record_circuit_open(func_name, source)
+        return pd.DataFrame()
+    # 熔断器按逻辑调用计数：重试全部失败才记一次失败，单只债券反复出错不会让整个数据源熔断
     for attempt in range(max_retries):
+        call_started = None
         try:
             call_kwargs = kwargs.copy()
             if 'timeout' in func_params and 'timeout' not in call_kwargs:
                 call_kwargs['timeout'] = 30
-            result = func(**call_kwargs)
-            time.sleep(0.5)
+            # 令牌桶替代固定的 0.5 秒间隔：每个数据源按自身允许的速率放行，所有线程共享额度
+            metrics.record_rate_limit_wait(func_name, source, rate_limiter.acquire(source))
+            with source_slot if source_slot is not None else nullcontext():
+                call_started = time.perf_counter()
+                result = func(**call_kwargs)
+            latency = time.perf_counter() - call_started
+            metrics.record_call(func_name, source, latency, rows=len(result) if isinstance(result, pd.DataFrame) else 0)
+            if breaker is not None: breaker.record_success(latency)
+            if controller is not None: controller.on_success(source, latency)
             return result
         except Exception as e:
+            latency = time.perf_counter() - call_started if call_started is not None else None
+            if latency is not None:
+                metrics.record_call(func_name, source, latency, error=True)
             error_str = str(e).lower()
-            if "remote end closed connection" in error_str or "connection aborted" in error_str:
-                logging.warning(f"远程服务器关闭连接: {func.__name__} (第 {attempt + 1} 次尝试). {kwargs.get('symbol')}")
+            throttled = is_throttle_error(e)
+            if throttled:
+                logging.warning(f"远程服务器关闭连接或限流: {func_name} (第 {attempt + 1} 次尝试). {kwargs.get('symbol')}")
+                if controller is not None: controller.on_congestion(source, '限流或连接被重置')
             elif "该股票代码不存在" in str(e) or "not found" in error_str or "'date'" in str(e): # 增加对KeyError的处理
-                logging.warning(f"接口 {func.__name__} 报告代码不存在或返回数据异常: {kwargs.get('symbol')}. 错误: {e}. 停止重试。")
+                logging.warning(f"接口 {func_name} 报告代码不存在或返回数据异常: {kwargs.get('symbol')}. 错误: {e}. 停止重试。")
+                metrics.record_not_found(func_name, source)
+                # 数据源正常应答，只是没有该代码，不计入熔断
+                if breaker is not None: breaker.record_success(latency or 0.0)
                 return pd.DataFrame()
             else:
-                 logging.warning(f"调用 {func.__name__} 失败 (第 {attempt + 1} 次尝试): {kwargs.get('symbol')}. 错误: {e}")
+                 logging.warning(f"调用 {func_name} 失败 (第 {attempt + 1} 次尝试): {kwargs.get('symbol')}. 错误: {e}")
             if attempt < max_retries - 1:
+                delay = rate_limiter.backoff_delay(source, attempt, initial_delay, throttled)
+                metrics.record_retry(func_name, source, delay)
                 logging.info(f"将在 {delay:.2f} 秒后重试...")
                 time.sleep(delay)
-                delay *= 2
             else:
-                logging.error(f"调用 {func.__name__} 达到最大重试次数，放弃: {kwargs.get('symbol')}")
+                logging.error(f"调用 {func_name} 达到最大重试次数，放弃: {kwargs.get('symbol')}")
+                if breaker is not None: breaker.record_failure(latency)
                 return pd.DataFrame()
     return pd.DataFrame()
 
+def merge_bond_frames(hist_df: pd.DataFrame, value_df: pd.DataFrame, stock_df: pd.DataFrame, bond_info: Dict) -> pd.DataFrame:
+    if hist_df.empty and value_df.empty: return pd.DataFrame()
+    if not hist_df.empty:
+        merged_df = hist_df
+        if not value_df.empty:
+            merged_df = pd.merge(merged_df, value_df, on='trade_date', how='left', suffixes=('', '_val'))
+            if 'price' in merged_df.columns and 'price_val' in merged_df.columns:
+                merged_df['price'] = merged_df['price'].fillna(merged_df['price_val'])
+                merged_df.drop(columns=['price_val'], inplace=True)
+    else:
+        merged_df = value_df.rename(columns={'price_val': 'price'})
+    for key in BOND_INFO_COLUMNS:
+        if key in bond_info: merged_df[key] = bond_info[key]
+    if not stock_df.empty:
+        merged_df = pd.merge(merged_df, stock_df, on='trade_date', how='left')
+    return calculate_derived_metrics(merged_df)
+
+def calculate_derived_metrics(df: pd.DataFrame) -> pd.DataFrame:
+    if df.empty: return df
+    df = df.sort_values(by='trade_date').reset_index(drop=True)
+    if 'price' in df.columns:
+        df['price_chg_pct'] = df['price'].pct_change() * 100
+    if 'price' in df.columns and 'premium_rate' in df.columns:
+        df['double_low'] = df['price'] + df['premium_rate']
+    return df
+
+def transform_bond_frames(hist_df: pd.DataFrame, value_df: pd.DataFrame, stock_df: pd.DataFrame, bond_info: Dict,
+                          since: Optional[str] = None) -> pd.DataFrame:
+    """合并三路数据、计算衍生指标并按增量起点截取；为模块级函数，可直接提交到进程池"""
+    merged_df = merge_bond_frames(hist_df, value_df, stock_df, bond_info)
+    if since and not merged_df.empty:
+        merged_df = merged_df[merged_df['trade_date'] > since].reset_index(drop=True)
+    return merged_df
+
 class EnhancedBondDataCollector:
-    def __init__(self):
-        self.engine = engine
+    def __init__(self, fetch_mode: str = 'sequential', write_batch_rows: int = 5000, write_batch_ms: int = 1000,
+                 process_workers: int = 0, hedge_budget: float = 0.0):
+        if fetch_mode not in FETCH_MODES:
+            raise ValueError(f"未知的抓取模式: {fetch_mode}，可选: {FETCH_MODES}")
+        self.engine = get_engine(DB_PATH)
+        self.fetch_mode = fetch_mode
+        self._fetch_executor = None
+        self._fetch_executor_workers = 3
+        self._fetch_executor_lock = threading.Lock()
+        # 正股历史行情按 (stock_code, adjust) 在本次运行内共享，多只转债对应同一正股时只请求一次
+        self.stock_history_cache = SingleFlightFrameCache()
+        # 历史表写入由单独的写线程按批提交
+        self.write_batch_rows = write_batch_rows
+        self.write_batch_ms = write_batch_ms
+        self.last_write_stats: Dict = {}
+        self.last_ledger_summary: Dict = {}
+        self.last_concurrency_stats: Dict = {}
+        # 合并与指标计算使用的进程数，0 表示在主线程内完成
+        self.process_workers = process_workers
+        # 债券/正股行情的对冲请求，预算为补发请求占首发请求的比例，0 表示不对冲
+        self.hedger = HedgedFetcher(budget_ratio=hedge_budget) if hedge_budget > 0 else None
+        self._table_columns_cache: Dict[str, List[str]] = {}
+
+    def _get_fetch_executor(self) -> ThreadPoolExecutor:
+        """获取（必要时创建）用于单只债券内部并发抓取的线程池"""
+        with self._fetch_executor_lock:
+            if self._fetch_executor is None:
+                self._fetch_executor = ThreadPoolExecutor(max_workers=self._fetch_executor_workers, thread_name_prefix='bond-fetch')
+            return self._fetch_executor
+
+    def _size_fetch_executor(self, max_workers: int) -> None:
+        """按本次收集的债券并发数设定单只债券内部抓取线程池和对冲线程池的大小：concurrent 模式下每只债券三路请求同时在途，
+        每路请求在对冲池中最多占用首发和补发两个线程"""
+        lanes = max_workers * 3 if self.fetch_mode == 'concurrent' else max_workers
+        if self.hedger is not None:
+            self.hedger.resize(lanes * 2)
+        if self.fetch_mode != 'concurrent': return
+        self.shutdown_fetch_executor()
+        self._fetch_executor_workers = lanes
+
+    def shutdown_fetch_executor(self) -> None:
+        with self._fetch_executor_lock:
+            if self._fetch_executor is not None:
+                self._fetch_executor.shutdown(wait=True)
+                self._fetch_executor = None
 
     def get_all_bonds_list(self) -> pd.DataFrame:
         try:
             logging.info("开始从同花顺获取全量可转债列表...")
             all_bonds_df = robust_akshare_call(ak.bond_zh_cov_info_ths)
             if all_bonds_df.empty: return pd.DataFrame()
-            all_bonds_df.rename(columns={'债券代码': 'bond_code', '正股代码': 'stock_code', '债券简称': 'bond_name', '正股简称': 'stock_name'}, inplace=True)
-            if 'stock_code' in all_bonds_df.columns:
-                 all_bonds_df['stock_code'] = all_bonds_df['stock_code'].astype(str).str.replace(r'^(sh|sz)', '', regex=True, case=False).str.strip()
-            required_cols = ['bond_code', 'stock_code', 'bond_name', 'stock_name']
+            all_bonds_df = normalize_frame(all_bonds_df, THS_BOND_LIST_SCHEMA, keep_unmapped=False)
+            required_cols = list(BOND_INFO_COLUMNS)
+            # 到期日用于增量模式下跳过已到期且数据已齐全的债券
+            if 'maturity_date' in all_bonds_df.columns:
+                required_cols.append('maturity_date')
             all_bonds_df = all_bonds_df[required_cols].drop_duplicates(subset=['bond_code']).reset_index(drop=True)
             logging.info(f"成功获取到 {len(all_bonds_df)} 只历史可转债信息。")
             return all_bonds_df
@@ -82,91 +261,78 @@ class EnhancedBondDataCollector:
         value_df = robust_akshare_call(ak.bond_zh_cov_value_analysis, symbol=bond_code)
         return self._clean_value_analysis_data(value_df)
 
-    def get_bond_history(self, bond_code: str) -> pd.DataFrame:
-        hist_df = robust_akshare_call(ak.stock_zh_a_hist, symbol=bond_code, period="daily", adjust="")
-        if not hist_df.empty:
-            logging.info(f"成功从[东财]获取债券 {bond_code} 历史行情。")
+    def get_bond_history(self, bond_code: str, start_date: Optional[str] = None) -> pd.DataFrame:
+        """start_date 形如 'YYYY-MM-DD'，仅东财接口支持按日期截取，新浪接口总是返回全量；数据源顺序由路由器按健康度决定"""
+        def from_eastmoney() -> pd.DataFrame:
+            return fetch_daily_bars(ak.stock_zh_a_hist, '日期', start_date, symbol=bond_code, period="daily", adjust="")
+
+        def from_sina() -> pd.DataFrame:
+            market_code = self._get_market_code_for_hist(bond_code)
+            return robust_akshare_call(ak.bond_zh_hs_cov_daily, symbol=market_code) if market_code else pd.DataFrame()
+
+        source, hist_df = self._fetch_first_available('bond_history', {'eastmoney': from_eastmoney, 'sina': from_sina})
+        if source is not None:
+            logging.info(f"成功从[{SOURCE_DISPLAY_NAMES[source]}]获取债券 {bond_code} 历史行情。")
             return self._clean_bond_history_data(hist_df)
-        market_code = self._get_market_code_for_hist(bond_code)
-        if market_code:
-            hist_df = robust_akshare_call(ak.bond_zh_hs_cov_daily, symbol=market_code)
-            if not hist_df.empty:
-                logging.info(f"成功从[新浪]获取债券 {bond_code} 历史行情。")
-                return self._clean_bond_history_data(hist_df)
         logging.warning(f"所有数据源均未能获取债券 {bond_code} 的历史行情。")
         return pd.DataFrame()
 
-    def get_stock_history_data(self, stock_code: str) -> pd.DataFrame:
-        stock_df = robust_akshare_call(ak.stock_zh_a_hist, symbol=stock_code, adjust="hfq")
-        if not stock_df.empty:
-            logging.info(f"成功从[东财]获取正股 {stock_code} 历史行情。")
+    def get_stock_history_data(self, stock_code: str, adjust: str = "hfq", start_date: Optional[str] = None) -> pd.DataFrame:
+        """start_date 形如 'YYYY-MM-DD'；后复权行情的历史价格不随除权变化，增量收集时只取水位线之后的部分即可。
+        缓存按 (stock_code, adjust, start_date) 共享，水位线相同的转债仍只请求一次"""
+        return self.stock_history_cache.get_or_load((stock_code, adjust, start_date),
+                                                    lambda: self._fetch_stock_history_data(stock_code, adjust, start_date))
+
+    def _fetch_stock_history_data(self, stock_code: str, adjust: str, start_date: Optional[str] = None) -> pd.DataFrame:
+        def from_eastmoney() -> pd.DataFrame:
+            return fetch_daily_bars(ak.stock_zh_a_hist, '日期', start_date, symbol=stock_code, adjust=adjust)
+
+        def from_tencent() -> pd.DataFrame:
+            market_code = self._get_market_code_for_stock_hist(stock_code)
+            return fetch_daily_bars(ak.stock_zh_a_hist_tx, 'date', start_date, symbol=market_code, adjust=adjust) if market_code else pd.DataFrame()
+
+        source, stock_df = self._fetch_first_available('stock_history', {'eastmoney': from_eastmoney, 'tencent': from_tencent})
+        if source is not None:
+            logging.info(f"成功从[{SOURCE_DISPLAY_NAMES[source]}]获取正股 {stock_code} 历史行情。")
             return self._clean_stock_history_data(stock_df)
-        market_code = self._get_market_code_for_stock_hist(stock_code)
-        if market_code:
-            stock_df = robust_akshare_call(ak.stock_zh_a_hist_tx, symbol=market_code, adjust="hfq")
-            if not stock_df.empty:
-                logging.info(f"成功从[腾讯]获取正股 {stock_code} 历史行情。")
-                return self._clean_stock_history_data(stock_df)
         logging.warning(f"所有数据源均未能获取正股 {stock_code} 的历史行情。")
         return pd.DataFrame()
 
+    def _fetch_first_available(self, kind: str, loaders: Dict[str, Callable[[], pd.DataFrame]]) -> Tuple[Optional[str], pd.DataFrame]:
+        """按路由器给出的顺序获取原始数据；启用对冲时首选来源过慢会并行请求备选来源。返回 (数据源, 原始数据)"""
+        router = get_source_router()
+        if self.fetch_mode == 'concurrent' and kind in CONCURRENT_SOURCE_PREFERENCE:
+            # 分流的目的是错开限流额度而非挑延迟最低的来源，按固定偏好排序，只剔除熔断中的数据源
+            order = [source for source in CONCURRENT_SOURCE_PREFERENCE[kind] if source in loaders and router.breaker(source).is_available()]
+        else:
+            order = router.order(list(loaders))
+        if self.hedger is not None and len(order) > 1:
+            return self.hedger.fetch(kind, [(source, loaders[source]) for source in order])
+        for source in order:
+            df = loaders[source]()
+            if not df.empty: return source, df
+        return None, pd.DataFrame()
+
     def _clean_value_analysis_data(self, df: pd.DataFrame) -> pd.DataFrame:
-        if df.empty: return df
-        df.rename(columns={'日期': 'trade_date', '收盘价': 'price_val', '纯债价值': 'pure_bond_value', '转股价值': 'conv_value',
-                           '纯债溢价率': 'pure_bond_premium_rate', '转股溢价率': 'premium_rate'}, inplace=True)
-        numeric_cols = ['price_val', 'pure_bond_value', 'conv_value', 'pure_bond_premium_rate', 'premium_rate']
-        for col in numeric_cols:
-            if col in df.columns: df[col] = pd.to_numeric(df[col], errors='coerce')
-        if 'trade_date' in df.columns:
-            df['trade_date'] = pd.to_datetime(df['trade_date']).dt.strftime('%Y-%m-%d')
-        return df
+        return normalize_frame(df, VALUE_ANALYSIS_SCHEMA, keep_unmapped=False)
 
-    # --- 核心修正：强化此函数对不同数据源的兼容性 ---
     def _clean_bond_history_data(self, df: pd.DataFrame) -> pd.DataFrame:
         if df.empty: return df
-        # 定义一个更宽容的列名映射，覆盖所有可能的名字
-        column_mapping = {
-            '日期': 'trade_date', 'date': 'trade_date',
-            '开盘': 'open_price', 'open': 'open_price',
-            '最高': 'high_price', 'high': 'high_price',
-            '最低': 'low_price', 'low': 'low_price',
-            '收盘': 'price', 'close': 'price',
-            '成交量': 'volume', 'volume': 'volume',
-            '成交额': 'turnover', 'amount': 'turnover',
-            '换手率': 'turnover_rate'
-        }
-        # 只重命名DataFrame中实际存在的列
-        df = df.rename(columns={k: v for k, v in column_mapping.items() if k in df.columns})
-
-        numeric_cols = ['open_price', 'high_price', 'low_price', 'price', 'volume', 'turnover', 'turnover_rate']
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-                # 单位转换逻辑，增加对空值的检查
-                if col == 'volume' and df[col].notna().any() and df[col][df[col].notna()].mean() < 1000000:
-                    df[col] = df[col] * 100
-        
-        # 确保 trade_date 列存在并格式化
-        if 'trade_date' in df.columns:
-            df['trade_date'] = pd.to_datetime(df['trade_date']).dt.strftime('%Y-%m-%d')
-        else:
-            # 如果万一没有任何日期列，则返回空，防止后续出错
-            logging.error(f"历史数据清洗失败：找不到日期列。原始列: {df.columns.tolist()}")
+        df = normalize_frame(df, BOND_HISTORY_SCHEMA, keep_unmapped=False)
+        # 如果万一没有任何日期列，则返回空，防止后续出错
+        if 'trade_date' not in df.columns:
+            logging.error(f"历史数据清洗失败：找不到日期列。清洗后列: {df.columns.tolist()}")
             return pd.DataFrame()
-            
         return df
 
     def _clean_stock_history_data(self, df: pd.DataFrame) -> pd.DataFrame:
         if df.empty: return pd.DataFrame()
-        column_mapping = {'日期': 'trade_date', 'date': 'trade_date', '收盘': 'stock_price', 'close': 'stock_price', '涨跌幅': 'stock_chg_pct'}
-        df = df.rename(columns={k: v for k, v in column_mapping.items() if k in df.columns})
-        numeric_cols = ['stock_price', 'stock_chg_pct']
-        for col in numeric_cols:
-            if col in df.columns: df[col] = pd.to_numeric(df[col], errors='coerce')
-        if 'trade_date' in df.columns:
-            df['trade_date'] = pd.to_datetime(df['trade_date']).dt.strftime('%Y-%m-%d')
-        required_cols = ['trade_date', 'stock_price', 'stock_chg_pct']
-        # 增加对列是否存在的检查
+        df = normalize_frame(df, STOCK_HISTORY_SCHEMA, keep_unmapped=False)
+        if 'stock_chg_pct' not in df.columns and 'stock_price' in df.columns:
+            # 腾讯接口不返回涨跌幅，按复权收盘价推算；增量抓取从水位线当天开始，首条新记录仍有前一交易日可比
+            df = df.sort_values('trade_date').reset_index(drop=True)
+            df['stock_chg_pct'] = df['stock_price'].pct_change() * 100
+        required_cols = schema_columns(STOCK_HISTORY_SCHEMA)
         if not all(c in df.columns for c in required_cols):
             return pd.DataFrame()
         return df[required_cols]
@@ -183,90 +349,280 @@ class EnhancedBondDataCollector:
         elif stock_code.startswith(('0', '3')): return f"sz{stock_code}"
         return None
         
-    def collect_comprehensive_bond_data(self, bond_info: Dict) -> pd.DataFrame:
+    def collect_comprehensive_bond_data(self, bond_info: Dict, since: Optional[str] = None) -> pd.DataFrame:
+        """收集单只债券的完整数据；指定 since 时只返回交易日晚于 since 的记录"""
+        frames = self.fetch_bond_frames(bond_info, since)
+        if frames is None: return pd.DataFrame()
         bond_code = bond_info.get('bond_code')
-        stock_code = bond_info.get('stock_code')
-        if not bond_code or not stock_code or pd.isna(stock_code): return pd.DataFrame()
-        logging.info(f"开始收集债券 {bond_code} (正股: {stock_code})")
-        hist_df = self.get_bond_history(bond_code)
-        value_df = self.get_bond_value_analysis(bond_code)
-        stock_df = self.get_stock_history_data(stock_code)
-        merged_df = self._merge_bond_data(hist_df, value_df, stock_df, bond_info)
+        merged_df = transform_bond_frames(*frames, self._bond_info_fields(bond_info), since)
         if not merged_df.empty:
             logging.debug(f"债券 {bond_code} 数据收集完成，共 {len(merged_df)} 条记录")
         else:
             logging.warning(f"债券 {bond_code} 数据合并后为空")
         return merged_df
 
+    def fetch_bond_frames(self, bond_info: Dict, since: Optional[str] = None) -> Optional[Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]]:
+        """只做网络抓取与清洗，返回 (债券行情, 价值分析, 正股行情)；缺少代码时返回 None"""
+        bond_code = bond_info.get('bond_code')
+        stock_code = bond_info.get('stock_code')
+        if not bond_code or not stock_code or pd.isna(stock_code): return None
+        logging.info(f"开始收集债券 {bond_code} (正股: {stock_code})" + (f"，增量起点 {since}" if since else ""))
+        if self.fetch_mode == 'concurrent':
+            return self._fetch_bond_frames_concurrently(bond_code, stock_code, since)
+        # 从水位线当天开始取，保证首条新记录的涨跌幅仍能基于前一交易日计算
+        hist_df = self.get_bond_history(bond_code, start_date=since)
+        # 价值分析接口不支持按日期截取，总是返回全量，由 transform_bond_frames 按 since 过滤
+        value_df = self.get_bond_value_analysis(bond_code)
+        stock_df = self.get_stock_history_data(stock_code, start_date=since)
+        return hist_df, value_df, stock_df
+
+    @staticmethod
+    def _bond_info_fields(bond_info: Dict) -> Dict:
+        return {key: bond_info[key] for key in BOND_INFO_COLUMNS if key in bond_info}
+
+    def _fetch_bond_frames_concurrently(self, bond_code: str, stock_code: str, since: Optional[str] = None) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """三路互不依赖的抓取同时发出，全部完成后再返回；各数据源的并发上限由 robust_akshare_call 控制"""
+        executor = self._get_fetch_executor()
+        hist_future = executor.submit(self.get_bond_history, bond_code, since)
+        value_future = executor.submit(self.get_bond_value_analysis, bond_code)
+        stock_future = executor.submit(self.get_stock_history_data, stock_code, start_date=since)
+        return hist_future.result(), value_future.result(), stock_future.result()
+
     def _merge_bond_data(self, hist_df: pd.DataFrame, value_df: pd.DataFrame, stock_df: pd.DataFrame, bond_info: Dict) -> pd.DataFrame:
-        if hist_df.empty and value_df.empty: return pd.DataFrame()
-        if not hist_df.empty:
-            merged_df = hist_df
-            if not value_df.empty:
-                merged_df = pd.merge(merged_df, value_df, on='trade_date', how='left', suffixes=('', '_val'))
-                if 'price' in merged_df.columns and 'price_val' in merged_df.columns:
-                    merged_df['price'] = merged_df['price'].fillna(merged_df['price_val'])
-                    merged_df.drop(columns=['price_val'], inplace=True)
-        else:
-            merged_df = value_df.rename(columns={'price_val': 'price'})
-        for key, value in bond_info.items(): merged_df[key] = value
-        if not stock_df.empty:
-            merged_df = pd.merge(merged_df, stock_df, on='trade_date', how='left')
-        return self._calculate_derived_metrics(merged_df)
+        return merge_bond_frames(hist_df, value_df, stock_df, bond_info)
 
     def _calculate_derived_metrics(self, df: pd.DataFrame) -> pd.DataFrame:
-        if df.empty: return df
-        df = df.sort_values(by='trade_date').reset_index(drop=True)
-        if 'price' in df.columns:
-            df['price_chg_pct'] = df['price'].pct_change() * 100
-        if 'price' in df.columns and 'premium_rate' in df.columns:
-            df['double_low'] = df['price'] + df['premium_rate']
-        return df
+        return calculate_derived_metrics(df)
+
+    def _get_table_columns(self, table_name: str) -> List[str]:
+        """表结构只读取一次并缓存，避免每次写入都做反射"""
+        if table_name not in self._table_columns_cache:
+            with self.engine.connect() as connection:
+                self._table_columns_cache[table_name] = [row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table_name})").fetchall()]
+        return self._table_columns_cache[table_name]
 
     def save_to_database(self, df: pd.DataFrame, table_name: str) -> int:
         if df.empty: return 0
         try:
-            for col in df.select_dtypes(include=['object']).columns:
-                df[col] = df[col].astype(str).apply(lambda x: x.encode('utf-8', 'ignore').decode('utf-8', 'ignore'))
+            columns_to_save, rows = frame_to_rows(df, self._get_table_columns(table_name))
+            if not rows: return 0
             with self.engine.connect() as connection:
                 with connection.begin():
-                    table_info = pd.read_sql(f"SELECT * FROM {table_name} LIMIT 0", connection)
-                    existing_columns = table_info.columns.tolist()
-                    columns_to_save = [col for col in df.columns if col in existing_columns]
-                    df_to_save = df[columns_to_save]
-                    records_to_insert = df_to_save.to_dict(orient='records')
-                    if not records_to_insert: return 0
-                    metadata = MetaData()
-                    table = Table(table_name, metadata, autoload_with=connection)
-                    stmt = sqlite.insert(table).values(records_to_insert)
-                    stmt = stmt.on_conflict_do_nothing(index_elements=['trade_date', 'bond_code'])
-                    result = connection.execute(stmt)
+                    # 以 executemany 方式执行预编译语句，避免多债券批量写入时单条语句超出 SQLite 的变量个数上限
+                    normalized = connection.exec_driver_sql(IS_NORMALIZED_SQL).scalar() > 0
+                    for sql, params in history_insert_statements(table_name, columns_to_save, rows, normalized):
+                        result = connection.exec_driver_sql(sql, params)
                     return result.rowcount
         except Exception as e:
             logging.error(f"保存数据到数据库失败: {e}", exc_info=True)
             return 0
-            
-    def run_comprehensive_collection(self, max_workers: int = 5) -> None:
-        logging.info("开始运行增强版可转债历史数据收集（基于全量列表）")
+
+    def _open_history_writer(self, ledger: Optional[CollectionLedger] = None) -> HistoryWriter:
+        def on_written(bond_code: str, saved_count: int) -> None:
+            logging.info(f"债券 {bond_code} 数据保存完成，新增/更新 {saved_count} 条记录")
+            if ledger is not None: ledger.mark_done(bond_code, saved_count)
+
+        def on_failed(bond_code: str, error: str) -> None:
+            if ledger is not None: ledger.mark_failed(bond_code, f"写入失败: {error}")
+        return HistoryWriter(self.engine.url.database, HISTORY_TABLE_NAME, batch_rows=self.write_batch_rows,
+                             batch_interval_ms=self.write_batch_ms, on_written=on_written, on_failed=on_failed)
+
+    def collect_bonds_for_dates(self, bond_list: pd.DataFrame, trade_dates: List[str], max_workers: int = 5,
+                                since: Optional[str] = None) -> pd.DataFrame:
+        """每只债券只抓取一次，一次性切出所有指定交易日的记录并合并返回"""
+        if bond_list.empty or not trade_dates: return pd.DataFrame()
+        tasks = bond_list.to_dict('records')
+        date_set = set(trade_dates)
+        frames = []
+        completed_count = 0
+        self._size_fetch_executor(max_workers)
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                future_to_bond = {executor.submit(self.collect_comprehensive_bond_data, bond_info, since): bond_info['bond_code'] for bond_info in tasks}
+                for future in as_completed(future_to_bond):
+                    bond_code = future_to_bond[future]
+                    try:
+                        bond_data = future.result()
+                        if not bond_data.empty:
+                            date_specific_data = bond_data[bond_data['trade_date'].isin(date_set)]
+                            if not date_specific_data.empty:
+                                frames.append(date_specific_data)
+                    except Exception as exc:
+                        logging.error(f"债券 {bond_code} 回补数据抓取失败: {exc}", exc_info=True)
+                    completed_count += 1
+                    if completed_count % 50 == 0 or completed_count == len(tasks):
+                        logging.info(f"回补进度: {completed_count}/{len(tasks)}")
+        finally:
+            self.shutdown_fetch_executor()
+        if not frames: return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def get_history_watermarks(self) -> Dict[str, str]:
+        """一次查询取出每只债券已入库的最新交易日"""
+        try:
+            with self.engine.connect() as connection:
+                # 规范化存储下按 (bond_id, day) 覆盖索引取每只债券的最大 day，不经过兼容视图逐行换算日期
+                normalized = connection.exec_driver_sql(IS_NORMALIZED_SQL).scalar() > 0
+                watermark_sql = BOND_WATERMARKS_SQL if normalized else f"SELECT bond_code, MAX(trade_date) FROM {HISTORY_TABLE_NAME} GROUP BY bond_code"
+                rows = connection.exec_driver_sql(watermark_sql).fetchall()
+            return {bond_code: max_date for bond_code, max_date in rows if max_date}
+        except Exception as e:
+            logging.error(f"读取历史数据水位线失败: {e}", exc_info=True)
+            return {}
+
+    def _plan_incremental_tasks(self, tasks: List[Dict]) -> List[Tuple[Dict, Optional[str]]]:
+        """为每只债券确定增量起点，并跳过到期日早于水位线（已无新数据）的债券"""
+        watermarks = self.get_history_watermarks()
+        today_str = datetime.now().strftime('%Y-%m-%d')
+        planned, skipped = [], 0
+        for bond_info in tasks:
+            watermark = watermarks.get(bond_info['bond_code'])
+            maturity_date = bond_info.get('maturity_date')
+            if watermark and (watermark >= today_str or (isinstance(maturity_date, str) and maturity_date <= watermark)):
+                skipped += 1
+                continue
+            planned.append((bond_info, watermark))
+        logging.info(f"增量模式: 已有水位线 {len(watermarks)} 只，跳过 {skipped} 只无新数据的债券，待更新 {len(planned)} 只")
+        return planned
+
+    def _fetch_with_ledger(self, ledger: CollectionLedger, bond_info: Dict, since: Optional[str]):
+        ledger.mark_running(bond_info['bond_code'])
+        controller = get_concurrency_controller()
+        if controller is None:
+            return self.fetch_bond_frames(bond_info, since)
+        # 占用债券窗口名额，使窗口能判断自身是否被用满
+        with controller.bonds:
+            started = time.perf_counter()
+            frames = self.fetch_bond_frames(bond_info, since)
+        if frames is not None:
+            controller.on_bond_done(time.perf_counter() - started)
+        return frames
+
+    def _open_transform_executor(self) -> Optional[ProcessPoolExecutor]:
+        """CPU 密集的合并与指标计算放到进程池；使用 spawn 避免在已有多线程时 fork"""
+        if self.process_workers <= 0: return None
+        return ProcessPoolExecutor(max_workers=self.process_workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def run_comprehensive_collection(self, max_workers: int = 5, incremental: bool = False, resume: bool = False) -> None:
+        """分阶段流水线：抓取线程池 -> 合并计算（进程池或线程内） -> 单写线程，各阶段之间有界，在途债券数固定"""
+        logging.info("开始运行增强版可转债历史数据收集（基于全量列表）" + ("，增量模式" if incremental else "") + ("，断点续跑" if resume else ""))
         bond_list = self.get_all_bonds_list()
         if bond_list.empty:
             logging.error("无法获取全量债券列表，程序退出")
             return
         tasks = bond_list.to_dict('records')
-        total_tasks = len(tasks)
+        if incremental:
+            planned_tasks = self._plan_incremental_tasks(tasks)
+        else:
+            planned_tasks = [(bond_info, None) for bond_info in tasks]
+        ledger = CollectionLedger(self.engine.url.database, stage='historical')
+        planned_codes = [bond_info['bond_code'] for bond_info, _ in planned_tasks]
+        if resume:
+            scheduled_codes = ledger.plan_resume(planned_codes)
+            task_by_code = {bond_info['bond_code']: (bond_info, since) for bond_info, since in planned_tasks}
+            planned_tasks = [task_by_code[code] for code in scheduled_codes]
+            logging.info(f"断点续跑: 账本中已完成 {len(planned_codes) - len(scheduled_codes)} 只，本次安排 {len(scheduled_codes)} 只")
+        else:
+            ledger.start_run(planned_codes)
+        since_by_code = {bond_info['bond_code']: since for bond_info, since in planned_tasks}
+        total_tasks = len(planned_tasks)
         completed_count = 0
-        logging.info(f"共找到 {total_tasks} 只历史可转债，开始并行收集...")
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_bond = {executor.submit(self.collect_comprehensive_bond_data, bond_info): bond_info['bond_code'] for bond_info in tasks}
-            for future in as_completed(future_to_bond):
-                bond_code = future_to_bond[future]
-                try:
-                    bond_data = future.result()
-                    if not bond_data.empty:
-                        saved_count = self.save_to_database(bond_data, HISTORY_TABLE_NAME)
-                        logging.info(f"债券 {bond_code} 数据保存完成，新增/更新 {saved_count} 条记录")
-                except Exception as exc:
-                    logging.error(f"债券 {bond_code} 数据处理失败: {exc}", exc_info=True)
-                completed_count += 1
-                logging.info(f"进度: {completed_count}/{total_tasks} ({(completed_count/total_tasks)*100:.2f}%)")
-        logging.info("增强版可转债历史数据收集完成")
\ No newline at end of file
+        # 同时在途（抓取中或计算中）的债券数上限，内存占用与债券总数无关
+        # 自适应模式下 max_workers 只是上限，实际在途债券数由 AIMD 窗口决定
+        max_in_flight = max_workers * 2 + max(self.process_workers, 0) * 2
+        controller = get_concurrency_controller()
+        in_flight_limit = (lambda: controller.bond_window()) if controller is not None else (lambda: max_in_flight)
+        logging.info(f"共找到 {total_tasks} 只历史可转债，开始并行收集 (抓取模式: {self.fetch_mode}，计算进程: {self.process_workers}，"
+                     f"在途上限: {'自适应 (初始 ' + str(in_flight_limit()) + ')' if controller is not None else max_in_flight})...")
+        self._size_fetch_executor(max_workers)
+        task_iter = iter(planned_tasks)
+        transform_executor = self._open_transform_executor()
+        try:
+            with self._open_history_writer(ledger) as writer, ThreadPoolExecutor(max_workers=max_workers) as fetch_executor:
+                fetch_futures: Dict = {}
+                transform_futures: Dict = {}
+
+                def refill() -> None:
+                    while len(fetch_futures) + len(transform_futures) < in_flight_limit():
+                        task = next(task_iter, None)
+                        if task is None: return
+                        bond_info, since = task
+                        fetch_futures[fetch_executor.submit(self._fetch_with_ledger, ledger, bond_info, since)] = bond_info
+
+                def finish(bond_code: str, bond_data: Optional[pd.DataFrame], error: Optional[Exception] = None) -> None:
+                    nonlocal completed_count
+                    if error is not None:
+                        logging.error(f"债券 {bond_code} 数据处理失败: {error}", exc_info=error)
+                        ledger.mark_failed(bond_code, str(error))
+                    elif bond_data is not None and not bond_data.empty and not writer.is_alive():
+                        ledger.mark_failed(bond_code, f"写线程已停止: {writer.fatal_error}")
+                    elif bond_data is not None and not bond_data.empty:
+                        logging.debug(f"债券 {bond_code} 数据收集完成，共 {len(bond_data)} 条记录")
+                        # 写线程队列已满时在此阻塞，背压会一直传导到抓取阶段
+                        writer.submit(bond_data, bond_code)
+                    elif since_by_code.get(bond_code):
+                        # 增量模式下没有新于水位线的数据属于正常情况
+                        ledger.mark_done(bond_code, 0)
+                    else:
+                        logging.warning(f"债券 {bond_code} 数据合并后为空")
+                        ledger.mark_failed(bond_code, "未获取到任何数据")
+                    completed_count += 1
+                    logging.info(f"进度: {completed_count}/{total_tasks} ({(completed_count/total_tasks)*100:.2f}%)，{ledger.format_progress()}")
+
+                refill()
+                while fetch_futures or transform_futures:
+                    done, _ = wait(list(fetch_futures) + list(transform_futures), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future in fetch_futures:
+                            bond_info = fetch_futures.pop(future)
+                            bond_code = bond_info['bond_code']
+                            try:
+                                frames = future.result()
+                            except Exception as exc:
+                                finish(bond_code, None, exc)
+                                continue
+                            if frames is None:
+                                finish(bond_code, None)
+                            elif transform_executor is not None:
+                                transform_futures[transform_executor.submit(
+                                    transform_bond_frames, *frames, self._bond_info_fields(bond_info), since_by_code.get(bond_code))] = bond_code
+                            else:
+                                try:
+                                    finish(bond_code, transform_bond_frames(*frames, self._bond_info_fields(bond_info), since_by_code.get(bond_code)))
+                                except Exception as exc:
+                                    finish(bond_code, None, exc)
+                        else:
+                            bond_code = transform_futures.pop(future)
+                            try:
+                                finish(bond_code, future.result())
+                            except Exception as exc:
+                                finish(bond_code, None, exc)
+                    if not writer.is_alive():
+                        # 写线程已异常退出：不再安排新债券，取消尚未开始的任务；账本中仍为待处理或处理中的债券留给 --resume 续跑
+                        in_flight = list(fetch_futures) + list(transform_futures)
+                        cancelled = sum(future.cancel() for future in in_flight)
+                        logging.error(f"历史数据写线程已停止 ({writer.fatal_error})，中止收集: 已处理 {completed_count}/{total_tasks}，"
+                                      f"取消在途 {cancelled}/{len(in_flight)} 只，可使用 --resume 续跑")
+                        break
+                    refill()
+        finally:
+            if transform_executor is not None:
+                transform_executor.shutdown(wait=True, cancel_futures=True)
+        self.last_write_stats = writer.stats
+        self.last_ledger_summary = ledger.get_summary()
+        ledger.close()
+        logging.info(f"历史数据写入: {writer.stats['batches']} 批，新增 {writer.stats['rows_written']} 条记录，写入耗时 {writer.stats['write_seconds']:.2f} 秒")
+        logging.info(f"收集账本: {self.last_ledger_summary}")
+        if controller is not None:
+            controller.log_summary()
+            self.last_concurrency_stats = controller.get_stats()
+        self.shutdown_fetch_executor()
+        if self.hedger is not None:
+            hedge_stats = self.hedger.get_stats()
+            logging.info(f"对冲请求: 首发 {hedge_stats['primary_requests']}，补发 {hedge_stats['hedges_fired']} "
+                         f"({hedge_stats['hedge_ratio']:.1%})，补发胜出 {hedge_stats['hedge_wins']}，预算拒绝 {hedge_stats['budget_denied']}")
+        cache_stats = self.stock_history_cache.get_stats()
+        logging.info(f"正股行情缓存: 命中 {cache_stats['hits']}，合并等待 {cache_stats['coalesced']}，未命中 {cache_stats['misses']}")
+        if writer.fatal_error is not None:
+            raise RuntimeError(f"历史数据写线程异常退出，收集未完成: {writer.fatal_error}") from writer.fatal_error
+        logging.info("增强版可转债历史数据收集完成")
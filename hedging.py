@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+对冲请求
+同一份数据有两个可互换来源时，首选来源超过其历史 p90 延迟仍未返回，就向备选来源补发一次请求，
+取先返回有效数据的一方。补发次数受预算约束（默认不超过首发请求数的 10%），避免放大上游压力
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from lazy_import import lazy_module
+
+pd = lazy_module('pandas')
+
+# 样本不足时不对冲：p90 需要一定数量的观测才有意义
+MIN_LATENCY_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+Loader = Callable[[], 'pd.DataFrame']
+
+
+class HedgedFetcher:
+    """按 (数据类别, 数据源) 统计延迟分位数，并在预算内对慢请求补发备选请求"""
+
+    def __init__(self, budget_ratio: float = 0.1, max_workers: int = 16):
+        self.budget_ratio = budget_ratio
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+        self._lock = threading.Lock()
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {}
+        self.stats = {'primary_requests': 0, 'hedges_fired': 0, 'hedge_wins': 0, 'budget_denied': 0, 'fallbacks': 0}
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    def resize(self, max_workers: int) -> None:
+        """按采集的并发度重建线程池；池子小于同时在途的请求数时，首发请求会在队列中排队并被误判为慢请求"""
+        old_executor = self._executor
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+        old_executor.shutdown(wait=False)
+
+    def _record_latency(self, kind: str, source: str, seconds: float) -> None:
+        with self._lock:
+            window = self._latencies.setdefault((kind, source), deque(maxlen=LATENCY_WINDOW))
+            window.append(seconds)
+
+    def hedge_delay(self, kind: str, source: str) -> Optional[float]:
+        """首选来源的 p90 延迟；样本不足时返回 None（不对冲）"""
+        with self._lock:
+            window = self._latencies.get((kind, source))
+            if window is None or len(window) < MIN_LATENCY_SAMPLES: return None
+            ordered = sorted(window)
+        return ordered[int(0.9 * (len(ordered) - 1))]
+
+    def _take_hedge_budget(self) -> bool:
+        with self._lock:
+            if self.stats['hedges_fired'] + 1 > self.budget_ratio * self.stats['primary_requests']:
+                self.stats['budget_denied'] += 1
+                return False
+            self.stats['hedges_fired'] += 1
+            return True
+
+    def _bump(self, counter: str) -> None:
+        with self._lock:
+            self.stats[counter] += 1
+
+    def _timed(self, kind: str, source: str, loader: Loader) -> pd.DataFrame:
+        started = time.perf_counter()
+        result = loader()
+        # 只有返回有效数据的请求才计入延迟分布，代码不存在等快速空返回会压低 p90
+        if isinstance(result, pd.DataFrame) and not result.empty:
+            self._record_latency(kind, source, time.perf_counter() - started)
+        return result
+
+    def fetch(self, kind: str, candidates: Sequence[Tuple[str, Loader]]) -> Tuple[Optional[str], pd.DataFrame]:
+        """按候选顺序获取数据，返回 (命中的数据源, 原始数据)；都没有数据时返回 (None, 空表)"""
+        if not candidates: return None, pd.DataFrame()
+        primary_source, primary_loader = candidates[0]
+        self._bump('primary_requests')
+        primary_started = threading.Event()
+        primary_started_at = [0.0]
+
+        def run_primary() -> pd.DataFrame:
+            primary_started_at[0] = time.monotonic()
+            primary_started.set()
+            return self._timed(kind, primary_source, primary_loader)
+
+        futures: Dict[Future, str] = {self._executor.submit(run_primary): primary_source}
+        remaining: List[Tuple[str, Loader]] = list(candidates[1:])
+
+        delay = self.hedge_delay(kind, primary_source)
+        if delay is not None and remaining:
+            # p90 是请求本身的耗时，计时从首发请求真正开始执行算起，不包含在线程池队列中等待的时间
+            primary_started.wait()
+            done, _ = wait(list(futures), timeout=max(0.0, delay - (time.monotonic() - primary_started_at[0])))
+            if not done and self._take_hedge_budget():
+                hedge_source, hedge_loader = remaining.pop(0)
+                logging.debug(f"{kind}: {primary_source} 超过 p90 ({delay * 1000:.0f} ms) 未返回，对冲请求 {hedge_source}")
+                futures[self._executor.submit(self._timed, kind, hedge_source, hedge_loader)] = hedge_source
+
+        # 取先返回有效数据的一方；落后的请求不取消，其结果被丢弃
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                source = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logging.warning(f"{kind}: 从 {source} 获取数据异常: {e}")
+                    continue
+                if not result.empty:
+                    if source != primary_source and len(futures) > 1:
+                        self._bump('hedge_wins')
+                    return source, result
+
+        # 已发出的请求都没有数据时，按原有顺序依次降级到剩余来源
+        for source, loader in remaining:
+            self._bump('fallbacks')
+            result = self._timed(kind, source, loader)
+            if not result.empty: return source, result
+        return None, pd.DataFrame()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+            p90 = {f"{kind}:{source}": round(sorted(window)[int(0.9 * (len(window) - 1))], 3)
+                   for (kind, source), window in self._latencies.items() if window}
+        stats['hedge_ratio'] = round(stats['hedges_fired'] / stats['primary_requests'], 4) if stats['primary_requests'] else 0.0
+        stats['p90_seconds'] = p90
+        return stats
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行期共享的历史行情缓存
+同一次运行中多只可转债共用一只正股时，只向上游请求一次正股历史行情
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable
+
+from lazy_import import lazy_module
+
+pd = lazy_module('pandas')
+
+
+class _InFlight:
+    """正在加载中的请求，后到的线程在此等待同一个结果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlightFrameCache:
+    """线程安全、单飞 (single-flight) 语义、按内存占用做 LRU 淘汰的 DataFrame 缓存"""
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[Hashable, pd.DataFrame]' = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._in_flight: Dict[Hashable, _InFlight] = {}
+        self._current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """命中则直接返回；未命中时只有第一个线程调用 loader，其余线程等待其结果"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None:
+                self.coalesced += 1
+                is_leader = False
+            else:
+                in_flight = _InFlight()
+                self._in_flight[key] = in_flight
+                self.misses += 1
+                is_leader = True
+
+        if not is_leader:
+            in_flight.event.wait()
+            if in_flight.error is not None:
+                raise in_flight.error
+            return in_flight.result
+
+        try:
+            result = loader()
+        except Exception as e:
+            in_flight.error = e
+            with self._lock:
+                del self._in_flight[key]
+            in_flight.event.set()
+            raise
+
+        in_flight.result = result
+        with self._lock:
+            del self._in_flight[key]
+            self._store(key, result)
+        in_flight.event.set()
+        return result
+
+    def _store(self, key: Hashable, df: pd.DataFrame) -> None:
+        # 空结果多为上游限流或临时故障，只与同时在等的线程共享，不缓存，后续请求重新加载
+        if df.empty:
+            return
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        self._entries[key] = df
+        self._sizes[key] = size
+        self._current_bytes += size
+        while self._current_bytes > self.max_bytes and self._entries:
+            old_key, _ = self._entries.popitem(last=False)
+            self._current_bytes -= self._sizes.pop(old_key)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._current_bytes = 0
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._current_bytes,
+                'max_bytes': self.max_bytes,
+                'hit_rate': round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史表的增量统计
+history_date_stats 按交易日记录行数（即当日债券数）和各字段的空值数，history_bond_stats 按债券记录行数和首末交易日，
+两张表都由 cb_daily_history（规范化存储后为事实表 cb_daily_fact）上的触发器在同一事务内维护。总记录数、债券数、交易日数、日期范围和空值统计
+只需读取这两张小表，不再对历史表做 COUNT(DISTINCT) 全表扫描；已有数据库可用 rebuild 按历史表重建
+"""
+
+import logging
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from stock_app.history_storage import BOND_TABLE_NAME, DIMENSION_COLUMNS, FACT_TABLE_NAME, date_sql, is_normalized
+
+HISTORY_TABLE_NAME = 'cb_daily_history'
+DATE_STATS_TABLE = 'history_date_stats'
+BOND_STATS_TABLE = 'history_bond_stats'
+
+# 统计空值数的字段；trade_date 和 bond_code 是主键，不会为空
+NULL_TRACKED_COLUMNS = (
+    'bond_name', 'price', 'price_chg_pct', 'open_price', 'high_price', 'low_price', 'volume', 'turnover', 'turnover_rate',
+    'stock_code', 'stock_name', 'stock_price', 'stock_chg_pct', 'stock_pb', 'conv_price', 'conv_value', 'premium_rate',
+    'pure_bond_value', 'pure_bond_premium_rate', 'double_low', 'bond_rating', 'put_trigger_price',
+    'force_redeem_trigger_price', 'conv_proportion', 'maturity_date', 'remaining_years', 'remaining_size',
+    'ytm_before_tax', 'created_at', 'updated_at',
+)
+
+
+def _null_column(column: str) -> str:
+    return f"null_{column}"
+
+
+@dataclass(frozen=True)
+class _StatsSource:
+    """统计触发器所在的表：旧的宽表，或规范化存储中的事实表（日期和债券代码都需由整数键换算）"""
+    table: str
+    key_columns: Tuple[str, str]
+    tracked_columns: Tuple[str, ...]
+    date_template: str
+    code_template: str
+    bond_filter_template: str
+    date_group: str
+    min_date: str
+    max_date: str
+    bond_from: str
+    bond_group: str
+
+    def date_of(self, row: str) -> str:
+        return self.date_template.format(row=row)
+
+    def code_of(self, row: str) -> str:
+        return self.code_template.format(row=row)
+
+    def bond_filter(self, row: str) -> str:
+        return self.bond_filter_template.format(row=row)
+
+
+_LEGACY_SOURCE = _StatsSource(
+    table=HISTORY_TABLE_NAME, key_columns=('trade_date', 'bond_code'), tracked_columns=NULL_TRACKED_COLUMNS,
+    date_template='{row}.trade_date', code_template='{row}.bond_code', bond_filter_template='bond_code = {row}.bond_code',
+    date_group='trade_date', min_date='MIN(trade_date)', max_date='MAX(trade_date)',
+    bond_from=HISTORY_TABLE_NAME, bond_group='bond_code')
+# 债券属性只存于 bond_info，事实表上只统计逐日字段的空值；属性字段的空值数由按债券统计与 bond_info 关联得出
+_NORMALIZED_SOURCE = _StatsSource(
+    table=FACT_TABLE_NAME, key_columns=('day', 'bond_id'),
+    tracked_columns=tuple(col for col in NULL_TRACKED_COLUMNS if col not in DIMENSION_COLUMNS),
+    date_template=date_sql('{row}.day'), code_template=f"(SELECT bond_code FROM {BOND_TABLE_NAME} WHERE bond_id = {{row}}.bond_id)",
+    bond_filter_template='bond_id = {row}.bond_id', date_group=date_sql('day'), min_date=date_sql('MIN(day)'), max_date=date_sql('MAX(day)'),
+    bond_from=f"{FACT_TABLE_NAME} f JOIN {BOND_TABLE_NAME} b ON b.bond_id = f.bond_id", bond_group='b.bond_code')
+
+
+def _insert_body(source: _StatsSource, row: str) -> str:
+    """把 row（NEW 或 OLD）所代表的一行计入统计"""
+    null_columns = ', '.join(_null_column(col) for col in source.tracked_columns)
+    null_values = ', '.join(f"{row}.{col} IS NULL" for col in source.tracked_columns)
+    null_updates = ', '.join(f"{_null_column(col)} = {_null_column(col)} + excluded.{_null_column(col)}" for col in source.tracked_columns)
+    trade_date, bond_code = source.date_of(row), source.code_of(row)
+    return f"""
+    INSERT INTO {DATE_STATS_TABLE} (trade_date, row_count, {null_columns}) VALUES ({trade_date}, 1, {null_values})
+    ON CONFLICT(trade_date) DO UPDATE SET row_count = row_count + 1, {null_updates};
+    INSERT INTO {BOND_STATS_TABLE} (bond_code, row_count, first_date, last_date) VALUES ({bond_code}, 1, {trade_date}, {trade_date})
+    ON CONFLICT(bond_code) DO UPDATE SET row_count = row_count + 1, first_date = MIN(first_date, excluded.first_date),
+        last_date = MAX(last_date, excluded.last_date);
+    """
+
+
+def _delete_body(source: _StatsSource, row: str) -> str:
+    """从统计中扣除 row 所代表的一行；债券的首末交易日借助按债券、日期的索引重新取得"""
+    null_updates = ', '.join(f"{_null_column(col)} = {_null_column(col)} - ({row}.{col} IS NULL)" for col in source.tracked_columns)
+    trade_date, bond_code, bond_filter = source.date_of(row), source.code_of(row), source.bond_filter(row)
+    return f"""
+    UPDATE {DATE_STATS_TABLE} SET row_count = row_count - 1, {null_updates} WHERE trade_date = {trade_date};
+    DELETE FROM {DATE_STATS_TABLE} WHERE trade_date = {trade_date} AND row_count <= 0;
+    UPDATE {BOND_STATS_TABLE} SET row_count = row_count - 1,
+        first_date = (SELECT {source.min_date} FROM {source.table} WHERE {bond_filter}),
+        last_date = (SELECT {source.max_date} FROM {source.table} WHERE {bond_filter})
+    WHERE bond_code = {bond_code};
+    DELETE FROM {BOND_STATS_TABLE} WHERE bond_code = {bond_code} AND row_count <= 0;
+    """
+
+
+def stats_schema_statements(normalized: bool = False) -> List[str]:
+    """统计表与维护触发器的建表语句，供数据库迁移使用；normalized=True 时触发器建在规范化存储的事实表上"""
+    source = _NORMALIZED_SOURCE if normalized else _LEGACY_SOURCE
+    null_columns = ', '.join(f"{_null_column(col)} INTEGER NOT NULL DEFAULT 0" for col in NULL_TRACKED_COLUMNS)
+    null_deltas = ', '.join(f"{_null_column(col)} = {_null_column(col)} + (NEW.{col} IS NULL) - (OLD.{col} IS NULL)"
+                            for col in source.tracked_columns)
+    same_key = ' AND '.join(f"OLD.{col} = NEW.{col}" for col in source.key_columns)
+    return [
+        f"CREATE TABLE IF NOT EXISTS {DATE_STATS_TABLE} (trade_date TEXT PRIMARY KEY, row_count INTEGER NOT NULL DEFAULT 0, {null_columns})",
+        f"CREATE TABLE IF NOT EXISTS {BOND_STATS_TABLE} (bond_code TEXT PRIMARY KEY, row_count INTEGER NOT NULL DEFAULT 0, "
+        f"first_date TEXT, last_date TEXT)",
+        f"CREATE TRIGGER IF NOT EXISTS trg_history_stats_insert AFTER INSERT ON {source.table} BEGIN {_insert_body(source, 'NEW')} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_history_stats_delete AFTER DELETE ON {source.table} BEGIN {_delete_body(source, 'OLD')} END",
+        # 常见的更新（回填静态字段、刷新行情）不改主键，只需调整当日的空值数
+        f"CREATE TRIGGER IF NOT EXISTS trg_history_stats_update AFTER UPDATE ON {source.table} WHEN {same_key} BEGIN "
+        f"UPDATE {DATE_STATS_TABLE} SET {null_deltas} WHERE trade_date = {source.date_of('NEW')}; END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_history_stats_rekey AFTER UPDATE ON {source.table} WHEN NOT ({same_key}) BEGIN "
+        f"{_delete_body(source, 'OLD')} {_insert_body(source, 'NEW')} END",
+    ]
+
+
+def rebuild_history_stats(conn: sqlite3.Connection) -> Dict[str, int]:
+    """按历史数据全量重建统计，用于升级已有数据库或核对统计；调用方负责事务"""
+    source = _NORMALIZED_SOURCE if is_normalized(conn) else _LEGACY_SOURCE
+    null_columns = ', '.join(_null_column(col) for col in source.tracked_columns)
+    null_sums = ', '.join(f"SUM({col} IS NULL)" for col in source.tracked_columns)
+    conn.execute(f"DELETE FROM {DATE_STATS_TABLE}")
+    conn.execute(f"DELETE FROM {BOND_STATS_TABLE}")
+    conn.execute(f"INSERT INTO {DATE_STATS_TABLE} (trade_date, row_count, {null_columns}) "
+                 f"SELECT {source.date_group}, COUNT(*), {null_sums} FROM {source.table} GROUP BY {source.key_columns[0]}")
+    conn.execute(f"INSERT INTO {BOND_STATS_TABLE} (bond_code, row_count, first_date, last_date) "
+                 f"SELECT {source.bond_group}, COUNT(*), {source.min_date}, {source.max_date} FROM {source.bond_from} GROUP BY {source.bond_group}")
+    days = conn.execute(f"SELECT COUNT(*) FROM {DATE_STATS_TABLE}").fetchone()[0]
+    bonds = conn.execute(f"SELECT COUNT(*) FROM {BOND_STATS_TABLE}").fetchone()[0]
+    return {'trading_days': days, 'bonds': bonds}
+
+
+class HistoryStats:
+    """读取历史表的统计；统计表不存在（尚未迁移的数据库）时退回对历史表的直接统计"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def _has_stats(conn: sqlite3.Connection) -> bool:
+        return conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN (?, ?)",
+                            (DATE_STATS_TABLE, BOND_STATS_TABLE)).fetchone()[0] == 2
+
+    def summary(self) -> Dict:
+        """总记录数、债券数、交易日数与日期范围"""
+        conn = self._connect()
+        try:
+            if self._has_stats(conn):
+                total_records, trading_days, start_date, end_date = conn.execute(
+                    f"SELECT COALESCE(SUM(row_count), 0), COUNT(*), MIN(trade_date), MAX(trade_date) FROM {DATE_STATS_TABLE}").fetchone()
+                total_bonds = conn.execute(f"SELECT COUNT(*) FROM {BOND_STATS_TABLE}").fetchone()[0]
+            else:
+                total_records, trading_days, start_date, end_date = conn.execute(
+                    f"SELECT COUNT(*), COUNT(DISTINCT trade_date), MIN(trade_date), MAX(trade_date) FROM {HISTORY_TABLE_NAME}").fetchone()
+                total_bonds = conn.execute(f"SELECT COUNT(DISTINCT bond_code) FROM {HISTORY_TABLE_NAME}").fetchone()[0]
+        finally:
+            conn.close()
+        return {'total_records': total_records, 'total_bonds': total_bonds, 'trading_days': trading_days,
+                'start_date': start_date, 'end_date': end_date}
+
+    def null_counts(self, columns: Optional[List[str]] = None) -> Dict[str, int]:
+        """各字段的空值数；未被统计表跟踪的字段（如迁移之后新增的列）直接计数"""
+        conn = self._connect()
+        try:
+            if columns is None:
+                columns = [row[1] for row in conn.execute(f"PRAGMA table_info({HISTORY_TABLE_NAME})").fetchall()]
+            has_stats = self._has_stats(conn)
+            source = _NORMALIZED_SOURCE if is_normalized(conn) else _LEGACY_SOURCE
+            tracked = [col for col in columns if col in source.tracked_columns] if has_stats else []
+            counts: Dict[str, int] = {}
+            if tracked:
+                sums = conn.execute(f"SELECT {', '.join(f'COALESCE(SUM({_null_column(col)}), 0)' for col in tracked)} "
+                                    f"FROM {DATE_STATS_TABLE}").fetchone()
+                counts.update(zip(tracked, sums))
+            if has_stats and source is _NORMALIZED_SOURCE:
+                # 属性为空的债券在历史中的全部行都为空，按债券统计的行数求和即可
+                for col in columns:
+                    if col in DIMENSION_COLUMNS:
+                        counts[col] = conn.execute(f"SELECT COALESCE(SUM(s.row_count), 0) FROM {BOND_STATS_TABLE} s "
+                                                   f"JOIN {BOND_TABLE_NAME} b ON b.bond_code = s.bond_code WHERE b.{col} IS NULL").fetchone()[0]
+            for col in columns:
+                if col in counts: continue
+                if col in ('trade_date', 'bond_code'):
+                    counts[col] = 0
+                else:
+                    counts[col] = conn.execute(f'SELECT COUNT(*) FROM {HISTORY_TABLE_NAME} WHERE "{col}" IS NULL').fetchone()[0]
+        finally:
+            conn.close()
+        return counts
+
+    def rebuild(self) -> Dict:
+        """在单个事务内按历史表重建统计"""
+        started = time.perf_counter()
+        conn = self._connect()
+        try:
+            with conn:
+                result = rebuild_history_stats(conn)
+        finally:
+            conn.close()
+        result['seconds'] = round(time.perf_counter() - started, 3)
+        logging.info(f"历史统计重建完成: {result['trading_days']} 个交易日，{result['bonds']} 只债券，耗时 {result['seconds']} 秒")
+        return result
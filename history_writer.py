@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史数据单写线程
+由一个线程独占 SQLite 连接，从有界队列中取出各债券的数据批量提交，抓取线程不再阻塞在数据库写入上
+"""
+
+from __future__ import annotations
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from column_schema import sanitize_text_columns
+from lazy_import import lazy_module
+from stock_app.history_storage import HISTORY_VIEW_NAME, HistoryRowSplitter, is_normalized
+
+pd = lazy_module('pandas')
+
+# 写线程收到该对象即提交剩余数据并退出
+_STOP = object()
+
+# 开启或提交事务遇到锁冲突时整批重试的次数，两次重试之间按次数线性退避的秒数
+WRITE_ATTEMPTS = 3
+WRITE_RETRY_DELAY = 1.0
+
+
+def get_table_columns(conn: sqlite3.Connection, table_name: str) -> List[str]:
+    """通过 PRAGMA 读取表的列名"""
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})").fetchall()]
+
+
+def build_insert_sql(table_name: str, columns: Sequence[str], conflict_columns: Sequence[str] = ('trade_date', 'bond_code')) -> str:
+    column_list = ', '.join(f'"{col}"' for col in columns)
+    placeholders = ', '.join('?' for _ in columns)
+    return (f"INSERT INTO {table_name} ({column_list}) VALUES ({placeholders}) "
+            f"ON CONFLICT({', '.join(conflict_columns)}) DO NOTHING")
+
+
+def history_insert_statements(table_name: str, columns: Sequence[str], rows: List[tuple],
+                              normalized: bool = False) -> List[Tuple[str, List[tuple]]]:
+    """写入历史数据需依次执行的 (SQL, 参数行)，最后一条语句的影响行数即新增记录数。
+    规范化存储下 cb_daily_history 是视图，不能 UPSERT；先写入 bond_info，再直接写入事实表，不逐行经过视图触发器"""
+    if not (normalized and table_name == HISTORY_VIEW_NAME):
+        return [(build_insert_sql(table_name, columns), rows)]
+    splitter = HistoryRowSplitter(list(columns))
+    bond_rows, fact_rows = splitter.split(rows)
+    return [(splitter.bond_sql, bond_rows), (splitter.fact_sql, fact_rows)]
+
+
+def frame_to_rows(df: pd.DataFrame, table_columns: Sequence[str]) -> Tuple[List[str], List[tuple]]:
+    """只保留表中存在的列，清理文本编码，并把 NaN 转为 None、numpy 标量转为 Python 对象，便于 executemany 绑定"""
+    columns = [col for col in df.columns if col in table_columns]
+    if not columns or df.empty: return columns, []
+    values = sanitize_text_columns(df[columns].copy()).astype(object)
+    values = values.where(values.notna(), None)
+    return columns, list(values.itertuples(index=False, name=None))
+
+
+class HistoryWriter:
+    """cb_daily_history 的单写线程，按行数或时间间隔批量提交"""
+
+    def __init__(self, db_path: str, table_name: str = 'cb_daily_history', batch_rows: int = 5000,
+                 batch_interval_ms: int = 1000, queue_size: int = 64,
+                 on_written: Optional[Callable[[str, int], None]] = None,
+                 on_failed: Optional[Callable[[str, str], None]] = None):
+        self.db_path = db_path
+        self.table_name = table_name
+        self.batch_rows = batch_rows
+        self.batch_interval = batch_interval_ms / 1000.0
+        self.on_written = on_written
+        self.on_failed = on_failed
+        self._queue: 'queue.Queue' = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._table_columns: List[str] = []
+        self._normalized = False
+        self._fatal_error: Optional[BaseException] = None
+        self.stats = {'frames': 0, 'rows_submitted': 0, 'rows_written': 0, 'batches': 0, 'failed_frames': 0,
+                      'write_seconds': 0.0, 'submit_wait_seconds': 0.0}
+
+    def __enter__(self) -> 'HistoryWriter':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def start(self) -> None:
+        if self._thread is not None: return
+        self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+        self._thread.start()
+
+    def is_alive(self) -> bool:
+        """写线程是否仍在运行；异常退出后 fatal_error 记录原因"""
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def fatal_error(self) -> Optional[BaseException]:
+        return self._fatal_error
+
+    def submit(self, df: pd.DataFrame, tag: str = '') -> None:
+        """提交一只债券的数据；队列已满时阻塞，以此对抓取线程形成背压"""
+        if df.empty: return
+        started = time.perf_counter()
+        self._put((tag, df))
+        self.stats['submit_wait_seconds'] += time.perf_counter() - started
+
+    def _put(self, item) -> None:
+        while True:
+            if self._thread is None or not self._thread.is_alive():
+                raise RuntimeError(f"历史数据写线程未运行: {self._fatal_error}" if self._fatal_error else "历史数据写线程未运行")
+            try:
+                self._queue.put(item, timeout=1.0)
+                return
+            except queue.Full:
+                continue
+
+    def close(self) -> Dict:
+        """提交剩余数据并等待写线程退出，返回写入统计；写线程异常退出时把仍在队列中的数据报告为失败"""
+        if self._thread is not None:
+            if self._thread.is_alive():
+                try:
+                    self._put(_STOP)
+                except RuntimeError:
+                    pass
+            self._thread.join()
+            self._thread = None
+            if self._fatal_error is not None:
+                self._fail_queued(f"写线程异常退出: {self._fatal_error}")
+        return dict(self.stats)
+
+    def _connect(self) -> sqlite3.Connection:
+        # 关闭驱动的隐式事务，由 _write_batch 显式控制：整批一个事务，每只债券一个保存点
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _run(self) -> None:
+        conn = None
+        pending: List[Tuple[str, pd.DataFrame]] = []
+        try:
+            conn = self._connect()
+            self._table_columns = get_table_columns(conn, self.table_name)
+            self._normalized = is_normalized(conn)
+            pending_rows = 0
+            batch_started = None
+            stopping = False
+            while not stopping:
+                timeout = None if batch_started is None else max(0.0, self.batch_interval - (time.monotonic() - batch_started))
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+                if item is _STOP:
+                    stopping = True
+                elif item is not None:
+                    pending.append(item)
+                    pending_rows += len(item[1])
+                    if batch_started is None: batch_started = time.monotonic()
+                batch_due = batch_started is not None and time.monotonic() - batch_started >= self.batch_interval
+                if pending and (stopping or pending_rows >= self.batch_rows or batch_due):
+                    self._flush(conn, pending)
+                    pending, pending_rows, batch_started = [], 0, None
+        except Exception as e:
+            # 已取出和仍在队列中的数据都报告为失败，台账不会停留在 running；之后的 submit 带上异常原因抛出
+            self._fatal_error = e
+            logging.error(f"历史数据写线程异常退出: {e}", exc_info=True)
+            self.stats['failed_frames'] += len(pending)
+            self._report([], [(tag, f"写线程异常退出: {e}") for tag, _ in pending])
+            self._fail_queued(f"写线程异常退出: {e}")
+        finally:
+            if conn is not None: conn.close()
+
+    def _fail_queued(self, error: str) -> None:
+        failed = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                failed.append((item[0], error))
+        self.stats['failed_frames'] += len(failed)
+        self._report([], failed)
+
+    def _report(self, written: List[Tuple[str, int]], failed: List[Tuple[str, str]]) -> None:
+        if self.on_written is not None:
+            for tag, count in written:
+                self.on_written(tag, count)
+        if self.on_failed is not None:
+            for tag, error in failed:
+                self.on_failed(tag, error)
+
+    def _flush(self, conn: sqlite3.Connection, pending: List[Tuple[str, pd.DataFrame]]) -> None:
+        started = time.perf_counter()
+        self.stats['frames'] += len(pending)
+        self.stats['rows_submitted'] += sum(len(df) for _, df in pending)
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                written, failed = self._write_batch(conn, pending)
+                break
+            except sqlite3.OperationalError as e:
+                # 开启或提交事务时数据库被其他连接锁住，整批回滚后重试
+                if attempt < WRITE_ATTEMPTS:
+                    logging.warning(f"批量提交失败，第 {attempt} 次重试: {e}")
+                    time.sleep(WRITE_RETRY_DELAY * attempt)
+                    continue
+                logging.error(f"批量提交 {len(pending)} 只债券失败: {e}")
+                written, failed = [], [(tag, str(e)) for tag, _ in pending]
+            except Exception as e:
+                logging.error(f"批量提交 {len(pending)} 只债券失败: {e}", exc_info=True)
+                written, failed = [], [(tag, str(e)) for tag, _ in pending]
+                break
+        elapsed = time.perf_counter() - started
+        self.stats['batches'] += 1
+        self.stats['write_seconds'] += elapsed
+        self.stats['failed_frames'] += len(failed)
+        batch_written = sum(count for _, count in written)
+        self.stats['rows_written'] += batch_written
+        logging.debug(f"批量提交 {len(pending)} 只债券，新增 {batch_written} 条记录，耗时 {elapsed * 1000:.1f} ms")
+        self._report(written, failed)
+
+    def _write_batch(self, conn: sqlite3.Connection,
+                     pending: List[Tuple[str, pd.DataFrame]]) -> Tuple[List[Tuple[str, int]], List[Tuple[str, str]]]:
+        """在一个事务中写入整批数据；单只债券失败时回滚到它的保存点，不留下部分写入的 bond_info 或逐日记录"""
+        written = []
+        failed = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for tag, df in pending:
+                conn.execute("SAVEPOINT history_frame")
+                try:
+                    columns, rows = frame_to_rows(df, self._table_columns)
+                    count = 0
+                    # 影响行数取自语句本身，不包含统计触发器等附带的改动
+                    for sql, params in (history_insert_statements(self.table_name, columns, rows, self._normalized) if rows else []):
+                        count = conn.executemany(sql, params).rowcount
+                except Exception as e:
+                    conn.execute("ROLLBACK TO history_frame")
+                    conn.execute("RELEASE history_frame")
+                    logging.error(f"写入 {tag} 数据失败: {e}")
+                    failed.append((tag, str(e)))
+                    continue
+                conn.execute("RELEASE history_frame")
+                written.append((tag, count))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction: conn.execute("ROLLBACK")
+            raise
+        return written, failed
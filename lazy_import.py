@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+延迟导入
+akshare、pandas、requests 等重量级依赖改为首次访问属性时才真正导入，
+仅查看帮助或只做数据质量检查的调用不必为用不到的网络库付出导入时间
+"""
+
+import importlib
+import threading
+import types
+
+_import_lock = threading.Lock()
+
+
+class LazyModule(types.ModuleType):
+    """模块占位对象：首次访问属性时导入真实模块，并把其属性复制到自身，之后的访问与普通模块一样快"""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__['_lazy_target'] = None
+
+    def _load(self) -> types.ModuleType:
+        target = self.__dict__['_lazy_target']
+        if target is None:
+            with _import_lock:
+                target = self.__dict__['_lazy_target']
+                if target is None:
+                    target = importlib.import_module(self.__name__)
+                    self.__dict__.update({key: value for key, value in target.__dict__.items() if not key.startswith('__')})
+                    self.__dict__['_lazy_target'] = target
+        return target
+
+    def __getattr__(self, attr: str):
+        # 只有自身字典中没有的属性才会进入这里（首次访问，或真实模块之后才加载的子模块）
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_module(name: str) -> LazyModule:
+    """返回模块的延迟导入占位对象，用法与 import name 一致"""
+    return LazyModule(name)
@@ -4,90 +4,67 @@
 主数据收集器 V3.5 (最终完整版)
 """
 
+from __future__ import annotations
+
 import os
 import sys
 import logging
 import argparse
-import pandas as pd
 from datetime import datetime, timedelta
 from typing import Dict, List
 import json
-from sqlalchemy import create_engine, text
-import akshare as ak
 
-# 导入自定义模块
-from enhanced_history_pipeline import EnhancedBondDataCollector
+# 导入自定义模块（akshare、pandas、SQLAlchemy 均延迟到首次使用时导入）
+from lazy_import import lazy_module
+from db_engine import get_engine, text
+from enhanced_history_pipeline import EnhancedBondDataCollector, FETCH_MODES, SOURCE_MAX_CONCURRENCY, robust_akshare_call
 from data_quality_validator import DataQualityValidator
 from data_source_manager import DataSourceManager
+from response_cache import configure_response_cache, get_response_cache
+from api_metrics import get_api_metrics
+from concurrency_controller import configure_concurrency_controller
+from rate_limiter import configure_rate_limits, parse_rate_limit
+from trading_calendar import TradingCalendar
+from schema_migrations import BACKFILL_NULL_FIELDS, apply_migrations
+from parquet_mirror import ParquetMirror
+from history_stats import HistoryStats
+from stock_app.history_storage import (BOND_TABLE_NAME, DIMENSION_COLUMNS, FACT_TABLE_NAME, LATEST_TRADE_DATE_SQL, day_sql,
+                                       upsert_bond_sql)
+
+ak = lazy_module('akshare')
+pd = lazy_module('pandas')
 
 # 配置
+# 用最新快照回填历史记录时涉及的静态字段（每个字段都有只包含空值行的部分索引）
+STATIC_BACKFILL_FIELDS = list(BACKFILL_NULL_FIELDS)
 DB_FOLDER = 'data'
 DB_FILE = 'cb_data.db'
 DB_PATH = os.path.join(DB_FOLDER, DB_FILE)
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
-
 
 class MasterDataCollector:
     """主数据收集器"""
     
-    def __init__(self):
+    def __init__(self, fetch_mode: str = 'sequential', write_batch_rows: int = 5000, write_batch_ms: int = 1000,
+                 process_workers: int = 0, hedge_budget: float = 0.0):
         self.engine = None
         self.data_source_manager = DataSourceManager()
         self.quality_validator = DataQualityValidator()
-        self.bond_collector = EnhancedBondDataCollector()
-        self.trade_calendar = None
-
-    def _get_trade_calendar(self):
-        """获取并缓存交易日历"""
-        if self.trade_calendar is None:
-            try:
-                self.trade_calendar = ak.tool_trade_date_hist_sina()
-                self.trade_calendar['trade_date'] = pd.to_datetime(self.trade_calendar['trade_date']).dt.strftime('%Y-%m-%d')
-            except Exception as e:
-                logging.error(f"获取交易日历失败: {e}")
-                self.trade_calendar = pd.DataFrame()
-        return self.trade_calendar
+        self.bond_collector = EnhancedBondDataCollector(fetch_mode=fetch_mode, write_batch_rows=write_batch_rows,
+                                                        write_batch_ms=write_batch_ms, process_workers=process_workers,
+                                                        hedge_budget=hedge_budget)
+        # 交易日历保存在数据库中，只在过期时才重新下载
+        self.trade_calendar = TradingCalendar(DB_PATH, fetcher=lambda: robust_akshare_call(ak.tool_trade_date_hist_sina))
+        self.last_backfill_counts: Dict[str, int] = {}
+        self.history_stats = HistoryStats(DB_PATH)
 
     def initialize_database(self):
         """初始化数据库"""
         logging.info("初始化数据库...")
         os.makedirs(DB_FOLDER, exist_ok=True)
-        self.engine = create_engine(f'sqlite:///{DB_PATH}')
-        with self.engine.connect() as connection:
-            with connection.begin():
-                # 创建历史数据表
-                create_history_table_sql = """
-                CREATE TABLE IF NOT EXISTS cb_daily_history (
-                    trade_date TEXT NOT NULL, bond_code TEXT NOT NULL, bond_name TEXT, price REAL, price_chg_pct REAL, open_price REAL,
-                    high_price REAL, low_price REAL, volume REAL, turnover REAL, turnover_rate REAL, stock_code TEXT, stock_name TEXT,
-                    stock_price REAL, stock_chg_pct REAL, stock_pb REAL, conv_price REAL, conv_value REAL, premium_rate REAL,
-                    pure_bond_value REAL, pure_bond_premium_rate REAL, double_low REAL, bond_rating TEXT, put_trigger_price REAL,
-                    force_redeem_trigger_price REAL, conv_proportion REAL, maturity_date TEXT, remaining_years REAL,
-                    remaining_size REAL, ytm_before_tax REAL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (trade_date, bond_code)
-                );
-                """
-                connection.execute(text(create_history_table_sql))
-                # 创建最新数据表
-                create_latest_table_sql = """
-                CREATE TABLE IF NOT EXISTS convertible_bond_data (
-                    bond_code TEXT PRIMARY KEY, bond_name TEXT, price REAL, price_chg_pct REAL, stock_code TEXT, stock_name TEXT,
-                    stock_price REAL, stock_chg_pct REAL, stock_pb REAL, conv_price REAL, conv_value REAL, premium_rate REAL,
-                    bond_rating TEXT, put_trigger_price REAL, force_redeem_trigger_price REAL, conv_proportion REAL,
-                    maturity_date TEXT, remaining_years REAL, remaining_size REAL, turnover REAL, turnover_rate REAL,
-                    ytm_before_tax REAL, double_low REAL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-                """
-                connection.execute(text(create_latest_table_sql))
-                # 创建债券信息表
-                create_info_table_sql = """
-                CREATE TABLE IF NOT EXISTS bond_info (
-                    bond_code TEXT PRIMARY KEY, bond_name TEXT, stock_code TEXT, stock_name TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-                """
-                connection.execute(text(create_info_table_sql))
+        # 表结构与索引由版本化迁移维护，已有数据库会补齐缺少的迁移
+        apply_migrations(DB_PATH)
+        self.engine = get_engine(DB_PATH)
         logging.info("数据库初始化完成")
 
     # --- 核心修正：恢复被遗漏的方法 ---
@@ -115,8 +92,12 @@ class MasterDataCollector:
     def _save_bond_info(self, bond_list: pd.DataFrame):
         if bond_list.empty: return
         try:
-            info_df = bond_list[['bond_code', 'bond_name', 'stock_code', 'stock_name']].drop_duplicates(subset=['bond_code'])
-            info_df.to_sql('bond_info', con=self.engine, if_exists='replace', index=False)
+            # bond_info 是历史数据的债券维表，bond_id 被事实表引用，只能按 bond_code 增量更新，不能整表替换
+            columns = ['bond_code'] + [col for col in DIMENSION_COLUMNS if col in bond_list.columns]
+            info_df = bond_list[columns].drop_duplicates(subset=['bond_code'])
+            info_df = info_df.astype(object).where(info_df.notna(), None)
+            with self.engine.begin() as connection:
+                connection.exec_driver_sql(upsert_bond_sql(columns[1:]), list(info_df.itertuples(index=False, name=None)))
             logging.info(f"债券信息保存完成，共 {len(info_df)} 只债券")
         except Exception as e:
             logging.error(f"保存债券信息失败: {e}", exc_info=True)
@@ -131,35 +112,30 @@ class MasterDataCollector:
 
     def get_missing_dates(self) -> List[str]:
         with self.engine.connect() as connection:
-            latest_date_in_db = connection.execute(text("SELECT MAX(trade_date) FROM cb_daily_history")).scalar_one_or_none()
+            latest_date_in_db = connection.execute(text(LATEST_TRADE_DATE_SQL)).scalar_one_or_none()
 
         if latest_date_in_db is None:
             logging.warning("历史数据表为空，将不会进行断点回补。请先运行一次 'historical' 或 'full' 模式。")
             return []
 
-        start_date = (datetime.strptime(latest_date_in_db, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
-        today_str = datetime.now().strftime('%Y-%m-%d')
-        
-        trade_calendar = self._get_trade_calendar()
-        if trade_calendar.empty:
+        if not self.trade_calendar.ensure_loaded():
             logging.error("无法获取交易日历，跳过断点回补。")
             return []
 
-        trade_dates_series = trade_calendar['trade_date']
-        mask = (trade_dates_series >= start_date) & (trade_dates_series <= today_str)
-        missing_dates = trade_dates_series[mask].tolist()
-        return missing_dates
+        start_date = (datetime.strptime(latest_date_in_db, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        today_str = datetime.now().strftime('%Y-%m-%d')
+        return self.trade_calendar.trading_days_between(start_date, today_str)
             
-    def _archive_latest_to_history_and_backfill(self):
+    def _archive_latest_to_history_and_backfill(self, max_workers: int = 5):
         if self.engine is None: self.initialize_database()
 
-        trade_calendar = self._get_trade_calendar()
-        if trade_calendar.empty:
+        trade_calendar = self.trade_calendar
+        if not trade_calendar.ensure_loaded():
             logging.error("无法获取交易日历，无法执行存档任务。")
             return
         
         today_str = datetime.now().strftime('%Y-%m-%d')
-        latest_trade_date = trade_calendar[trade_calendar['trade_date'] <= today_str]['trade_date'].max()
+        latest_trade_date = trade_calendar.prev_trading_day(today_str, inclusive=True)
         
         if not latest_trade_date:
             logging.error("无法确定最新的交易日。")
@@ -175,14 +151,14 @@ class MasterDataCollector:
             logging.info(f"发现缺失的历史交易日: {missing_dates}，开始进行数据回补...")
             bond_list = self.bond_collector.get_all_bonds_list()
             if not bond_list.empty:
-                for trade_date in missing_dates:
-                    logging.info(f"正在为日期 {trade_date} 回补数据...")
-                    for _, bond_info in bond_list.iterrows():
-                        bond_data = self.bond_collector.collect_comprehensive_bond_data(bond_info)
-                        if not bond_data.empty:
-                            date_specific_data = bond_data[bond_data['trade_date'] == trade_date]
-                            if not date_specific_data.empty:
-                                self.bond_collector.save_to_database(date_specific_data, 'cb_daily_history')
+                # 每只债券只抓取一次，从首个缺失日的前一交易日起取数，保证涨跌幅计算有前值
+                since = trade_calendar.prev_trading_day(min(missing_dates))
+                backfill_df = self.bond_collector.collect_bonds_for_dates(bond_list, missing_dates, max_workers=max_workers, since=since)
+                if not backfill_df.empty:
+                    saved_count = self.bond_collector.save_to_database(backfill_df, 'cb_daily_history')
+                    logging.info(f"缺失交易日回补完成，共写入 {saved_count} 条记录")
+                else:
+                    logging.warning("缺失交易日回补未获取到任何数据。")
             else:
                 logging.error("无法获取债券列表，跳过历史数据回补。")
 
@@ -206,36 +182,65 @@ class MasterDataCollector:
                     columns_to_save = [col for col in latest_df.columns if col in existing_columns]
                     df_to_save = latest_df[columns_to_save]
                     
-                    connection.execute(text(f"DELETE FROM cb_daily_history WHERE trade_date = :date"), {'date': latest_trade_date})
+                    # 直接按主键的 day 删除事实表中的当日数据，兼容视图上的日期条件无法使用索引
+                    connection.execute(text(f"DELETE FROM {FACT_TABLE_NAME} WHERE day = {day_sql(':date')}"), {'date': latest_trade_date})
                     df_to_save.to_sql('cb_daily_history', con=connection, if_exists='append', index=False)
                     logging.info(f"成功将 {len(df_to_save)} 条最新数据存档到日期 {latest_trade_date}")
 
                     logging.info("开始用最新静态数据回填历史记录...")
-                    backfill_fields = ['bond_rating', 'put_trigger_price', 'force_redeem_trigger_price', 'conv_price', 'maturity_date', 'stock_pb']
-                    backfill_data = latest_df[['bond_code'] + [col for col in backfill_fields if col in latest_df.columns]]
-                    
-                    for field in backfill_fields:
-                        if field not in backfill_data.columns: continue
-                        logging.info(f"正在回填字段: {field}...")
-                        for _, row in backfill_data.iterrows():
-                            bond_code, value_to_fill = row['bond_code'], row[field]
-                            if pd.notna(value_to_fill):
-                                update_sql = text(f"UPDATE cb_daily_history SET {field} = :value WHERE bond_code = :bond_code AND {field} IS NULL")
-                                connection.execute(update_sql, {'value': value_to_fill, 'bond_code': bond_code})
-                    logging.info(f"历史回填完成。")
+                    self.last_backfill_counts = self._backfill_static_fields(connection, latest_df)
+                    logging.info(f"历史回填完成，各字段回填行数: {self.last_backfill_counts}")
         except Exception as e:
             logging.error(f"存档与回填过程失败: {e}", exc_info=True)
             
-    def run_full_collection(self, max_workers: int = 5) -> Dict:
+    def _backfill_static_fields(self, connection, latest_df: pd.DataFrame) -> Dict[str, int]:
+        """把最新快照中的静态字段一次性写入临时表，再按字段做集合式更新，只填补历史记录中的空值；
+        评级、到期日等债券属性在 bond_info 中回填，其计数为更新的债券数"""
+        fields = [field for field in STATIC_BACKFILL_FIELDS if field in latest_df.columns]
+        if not fields: return {}
+        static_df = latest_df[['bond_code'] + fields].drop_duplicates(subset=['bond_code'])
+        static_df = static_df.astype(object).where(static_df.notna(), None)
+        column_list = ', '.join(fields)
+        placeholders = ', '.join('?' for _ in range(len(fields) + 1))
+        connection.exec_driver_sql("DROP TABLE IF EXISTS temp.latest_static")
+        connection.exec_driver_sql(f"CREATE TEMP TABLE latest_static (bond_code TEXT PRIMARY KEY, {column_list})")
+        connection.exec_driver_sql(f"INSERT INTO temp.latest_static (bond_code, {column_list}) VALUES ({placeholders})",
+                                   list(static_df.itertuples(index=False, name=None)))
+        touched = {}
+        for field in fields:
+            if field in DIMENSION_COLUMNS:
+                # 债券属性只存于 bond_info，每只债券一行；事实表 updated_at 由 bond_info 上的触发器刷新
+                result = connection.exec_driver_sql(
+                    f"UPDATE {BOND_TABLE_NAME} "
+                    f"SET {field} = (SELECT s.{field} FROM temp.latest_static s WHERE s.bond_code = {BOND_TABLE_NAME}.bond_code), "
+                    f"updated_at = CURRENT_TIMESTAMP "
+                    f"WHERE {field} IS NULL AND bond_code IN (SELECT bond_code FROM temp.latest_static WHERE {field} IS NOT NULL)")
+            else:
+                result = connection.exec_driver_sql(
+                    f"UPDATE {FACT_TABLE_NAME} "
+                    f"SET {field} = (SELECT s.{field} FROM temp.latest_static s JOIN {BOND_TABLE_NAME} b ON b.bond_code = s.bond_code "
+                    f"WHERE b.bond_id = {FACT_TABLE_NAME}.bond_id), updated_at = CURRENT_TIMESTAMP "
+                    f"WHERE {field} IS NULL AND bond_id IN (SELECT b.bond_id FROM {BOND_TABLE_NAME} b "
+                    f"JOIN temp.latest_static s ON s.bond_code = b.bond_code WHERE s.{field} IS NOT NULL)")
+            touched[field] = result.rowcount
+        connection.exec_driver_sql("DROP TABLE temp.latest_static")
+        return touched
+
+    def run_full_collection(self, max_workers: int = 5, incremental: bool = False, resume: bool = False) -> Dict:
         logging.info("====== 开始完整数据收集流程 ======")
         results = {'timestamp': datetime.now().isoformat(), 'latest_data': {}, 'historical_data': {}, 
                    'quality_validation': {}, 'statistics': {}, 'overall_success': False}
         try:
             self.initialize_database()
-            results['historical_data'] = self.collect_historical_data(max_workers)
-            self._archive_latest_to_history_and_backfill()
+            results['historical_data'] = self.collect_historical_data(max_workers, incremental, resume)
+            self._archive_latest_to_history_and_backfill(max_workers)
+            results['static_backfill'] = self.last_backfill_counts
             results['quality_validation'] = self.validate_data_quality()
             results['statistics'] = self.get_data_statistics()
+            results['stock_history_cache'] = self.bond_collector.stock_history_cache.get_stats()
+            response_cache = get_response_cache()
+            results['response_cache'] = response_cache.get_stats() if response_cache is not None else {}
+            results['api_metrics'] = get_api_metrics().snapshot()
             self.data_source_manager.save_source_status_report()
             results['overall_success'] = results['historical_data'].get('success', False)
             logging.info("====== 完整数据收集流程完成 ======")
@@ -247,18 +252,26 @@ class MasterDataCollector:
         self._save_collection_report(results)
         return results
 
-    def collect_historical_data(self, max_workers: int = 5) -> Dict:
+    def collect_historical_data(self, max_workers: int = 5, incremental: bool = False, resume: bool = False) -> Dict:
         logging.info("开始收集历史数据...")
         result = {'success': False, 'bonds_processed': 0, 'total_records': 0, 'errors': []}
         try:
             if self.engine is None: self.initialize_database()
-            self.bond_collector.run_comprehensive_collection(max_workers=max_workers)
-            with self.engine.connect() as connection:
-                bonds_in_db = connection.execute(text("SELECT COUNT(DISTINCT bond_code) FROM cb_daily_history")).scalar_one_or_none() or 0
-                total_records = connection.execute(text("SELECT COUNT(*) FROM cb_daily_history")).scalar_one_or_none() or 0
+            self.bond_collector.run_comprehensive_collection(max_workers=max_workers, incremental=incremental, resume=resume)
+            summary = self.history_stats.summary()
+            bonds_in_db, total_records = summary['total_bonds'], summary['total_records']
             result['success'] = True
             result['bonds_processed'] = bonds_in_db
             result['total_records'] = total_records
+            result['stock_history_cache'] = self.bond_collector.stock_history_cache.get_stats()
+            result['write_stats'] = self.bond_collector.last_write_stats
+            result['ledger'] = self.bond_collector.last_ledger_summary
+            result['api_metrics'] = get_api_metrics().snapshot()
+            if self.bond_collector.hedger is not None:
+                result['hedging'] = self.bond_collector.hedger.get_stats()
+            if self.bond_collector.last_concurrency_stats:
+                result['concurrency'] = self.bond_collector.last_concurrency_stats
+            self.data_source_manager.save_source_status_report()
             logging.info(f"历史数据收集完成，数据库中现有 {bonds_in_db} 只债券，{total_records} 条记录")
         except Exception as e:
             error_msg = f"收集历史数据失败: {e}"
@@ -278,17 +291,31 @@ class MasterDataCollector:
             logging.error(error_msg, exc_info=True)
             return {'error': error_msg}
     
+    def sync_parquet_mirror(self, full: bool = False) -> Dict:
+        """把历史表同步到按月分区的 Parquet 镜像，只重写有变化的月份"""
+        logging.info("开始同步 Parquet 镜像...")
+        try:
+            if self.engine is None: self.initialize_database()
+            return ParquetMirror(DB_PATH).sync(full=full)
+        except ImportError as e:
+            logging.warning(f"未安装 pyarrow，跳过 Parquet 镜像同步: {e}")
+            return {'error': f"未安装 pyarrow: {e}"}
+        except Exception as e:
+            error_msg = f"Parquet 镜像同步失败: {e}"
+            logging.error(error_msg, exc_info=True)
+            return {'error': error_msg}
+
     def get_data_statistics(self) -> Dict:
         logging.info("获取数据统计信息...")
         stats = {'total_bonds': 0, 'total_records': 0, 'date_range': {}, 'latest_update': None, 'data_sources': {}}
         try:
             if self.engine is None: self.initialize_database()
+            summary = self.history_stats.summary()
+            stats['total_bonds'] = summary['total_bonds']
+            stats['total_records'] = summary['total_records']
+            if summary['start_date']:
+                stats['date_range'] = {'start_date': summary['start_date'], 'end_date': summary['end_date'], 'trading_days': summary['trading_days']}
             with self.engine.connect() as connection:
-                stats['total_bonds'] = connection.execute(text("SELECT COUNT(DISTINCT bond_code) FROM cb_daily_history")).scalar_one_or_none() or 0
-                stats['total_records'] = connection.execute(text("SELECT COUNT(*) FROM cb_daily_history")).scalar_one_or_none() or 0
-                date_info = connection.execute(text("SELECT MIN(trade_date), MAX(trade_date), COUNT(DISTINCT trade_date) FROM cb_daily_history")).fetchone()
-                if date_info and date_info[0]:
-                    stats['date_range'] = {'start_date': date_info[0], 'end_date': date_info[1], 'trading_days': date_info[2]}
                 stats['latest_update'] = connection.execute(text("SELECT MAX(updated_at) FROM cb_daily_history")).scalar_one_or_none()
             stats['data_sources'] = self.data_source_manager.get_source_status_report()
             logging.info(f"数据统计信息获取完成")
@@ -309,30 +336,70 @@ class MasterDataCollector:
 
 def main():
     parser = argparse.ArgumentParser(description='可转债历史数据收集器')
-    parser.add_argument('--mode', choices=['latest', 'historical', 'quality', 'full', 'archive'], default='archive', help='运行模式: archive为日常模式，只采集并存档最新数据，并回补断点')
-    parser.add_argument('--workers', type=int, default=5, help='并发工作线程数 (主要用于 historical 和 full 模式)')
+    parser.add_argument('--mode', choices=['latest', 'historical', 'quality', 'full', 'archive', 'parquet', 'rebuild-stats'], default='archive',
+                        help='运行模式: archive为日常模式，只采集并存档最新数据，并回补断点；parquet只同步 Parquet 镜像；rebuild-stats按历史表重建统计表')
+    parser.add_argument('--workers', type=int, default=5, help='并发工作线程数 (用于 historical、full 模式及 archive 模式的断点回补)')
+    parser.add_argument('--fetch-mode', choices=FETCH_MODES, default='sequential', help='单只债券内部的抓取方式: concurrent 为行情/价值分析/正股三路并发 (用于 historical 和 full 模式)')
+    parser.add_argument('--incremental', action='store_true', help='增量模式: 按每只债券已入库的最新交易日只抓取并写入新数据 (用于 historical 和 full 模式)')
+    parser.add_argument('--resume', action='store_true', help='断点续跑: 按收集账本只处理上次未完成和失败的债券 (用于 historical 和 full 模式)')
+    parser.add_argument('--adaptive-concurrency', action='store_true', help='自适应并发: 按各数据源的延迟与限流情况自动增减并发，--workers 作为上限')
+    parser.add_argument('--hedge-budget', type=float, default=0.0, help='对冲请求预算: 首选来源超过 p90 延迟时补发备选来源，补发数不超过首发数的该比例，如 0.1；0 表示不对冲')
+    parser.add_argument('--source-rate', action='append', default=[], metavar='SOURCE=RATE[:BURST]',
+                        help='覆盖某个数据源的总请求速率 (次/秒) 和突发量，可重复，如 eastmoney=15:8；默认按单线程请求间隔乘以 --workers')
+    parser.add_argument('--process-workers', type=int, default=0, help='合并与指标计算使用的进程数，0 表示在主线程内完成 (用于 historical 和 full 模式)')
+    parser.add_argument('--write-batch-rows', type=int, default=5000, help='历史数据写线程每批最多提交的行数')
+    parser.add_argument('--write-batch-ms', type=int, default=1000, help='历史数据写线程每批最长等待的毫秒数')
+    parser.add_argument('--no-cache', action='store_true', help='不使用 akshare 响应的本地磁盘缓存')
+    parser.add_argument('--offline', action='store_true', help='离线回放: 只从本地缓存读取 akshare 数据，不访问网络')
+    parser.add_argument('--cache-max-mb', type=int, default=2048, help='响应缓存的最大占用空间 (MB)')
+    parser.add_argument('--parquet-sync', action='store_true', help='收集结束后把历史表增量同步到 data/parquet 下按月分区的 Parquet 镜像 (需要 pyarrow)')
+    parser.add_argument('--parquet-full', action='store_true', help='重写 Parquet 镜像的全部分区，而不只是有变化的月份')
+    parser.add_argument('--metrics-prom', help='运行结束后把 akshare 接口调用指标以 Prometheus 文本格式写入该文件')
     parser.add_argument('--verbose', action='store_true', help='详细输出')
     args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
     
     if args.verbose: logging.getLogger().setLevel(logging.DEBUG)
+    configure_concurrency_controller(args.adaptive_concurrency, max_workers=args.workers, initial_limits=SOURCE_MAX_CONCURRENCY)
+    try:
+        rate_overrides = dict(parse_rate_limit(item) for item in args.source_rate)
+    except ValueError as e:
+        parser.error(str(e))
+    configure_rate_limits(args.workers, rate_overrides)
+    configure_response_cache(enabled=not args.no_cache, offline=args.offline, max_bytes=args.cache_max_mb * 1024 * 1024)
     
-    collector = MasterDataCollector()
+    collector = MasterDataCollector(fetch_mode=args.fetch_mode, write_batch_rows=args.write_batch_rows,
+                                    write_batch_ms=args.write_batch_ms, process_workers=args.process_workers,
+                                    hedge_budget=args.hedge_budget)
     result = {}
     
     # 重新定义main函数体以正确调用方法
     if args.mode == 'latest':
         result = collector.collect_latest_data()
     elif args.mode == 'historical':
-        result = collector.collect_historical_data(args.workers)
+        result = collector.collect_historical_data(args.workers, args.incremental, args.resume)
     elif args.mode == 'quality':
         result = collector.validate_data_quality()
     elif args.mode == 'full':
-        result = collector.run_full_collection(args.workers)
+        result = collector.run_full_collection(args.workers, args.incremental, args.resume)
     elif args.mode == 'archive':
         collector.initialize_database()
-        collector._archive_latest_to_history_and_backfill()
-        result = {"status": "archive and backfill process completed."}
+        collector._archive_latest_to_history_and_backfill(args.workers)
+        collector.data_source_manager.save_source_status_report()
+        result = {"status": "archive and backfill process completed.", "static_backfill": collector.last_backfill_counts,
+                  "api_metrics": get_api_metrics().snapshot()}
+    elif args.mode == 'parquet':
+        result = collector.sync_parquet_mirror(full=args.parquet_full)
+    elif args.mode == 'rebuild-stats':
+        collector.initialize_database()
+        result = collector.history_stats.rebuild()
+
+    if args.parquet_sync and args.mode in ('historical', 'full', 'archive'):
+        result['parquet_mirror'] = collector.sync_parquet_mirror(full=args.parquet_full)
     
+    if args.metrics_prom:
+        get_api_metrics().write_prometheus(args.metrics_prom)
+        logging.info(f"接口调用指标已写入: {args.metrics_prom}")
     print(json.dumps(result, indent=2, ensure_ascii=False, default=str))
 
 if __name__ == '__main__':
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+cb_daily_history 的 Parquet 列式镜像
+按 year=YYYY/month=MM 分区保存，文本列字典编码、数值列在精度足够时使用 float32。
+同步时只重写自上次同步以来有变化的分区：依据 updated_at 水位线找出被写入或更新的月份，
+再对比各月行数找出发生删除的月份。研究类的全历史扫描直接读取镜像，支持列裁剪和 pyarrow 谓词下推
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from datetime import date
+from typing import Dict, List, Optional, Sequence
+
+from lazy_import import lazy_module
+from history_stats import DATE_STATS_TABLE
+from stock_app.history_storage import FACT_TABLE_NAME, date_sql, history_select_sql, is_normalized, to_day_number
+
+pd = lazy_module('pandas')
+pa = lazy_module('pyarrow')
+pq = lazy_module('pyarrow.parquet')
+
+HISTORY_TABLE_NAME = 'cb_daily_history'
+DEFAULT_MIRROR_ROOT = os.path.join('data', 'parquet', HISTORY_TABLE_NAME)
+SYNC_STATE_FILE = '_sync_state.json'
+# 镜像的列类型或分区方式变化时递增，下次同步会整体重写
+MIRROR_FORMAT_VERSION = 1
+WATERMARK_MARGIN_SECONDS = 60
+
+STRING_COLUMNS = ('bond_code', 'bond_name', 'stock_code', 'stock_name', 'bond_rating', 'maturity_date')
+# 成交量、成交额可达 1e10 量级，超出 float32 的 7 位有效数字，保留 float64；其余价格、比率类字段用 float32
+FLOAT64_COLUMNS = ('volume', 'turnover')
+FLOAT32_COLUMNS = ('price', 'price_chg_pct', 'open_price', 'high_price', 'low_price', 'turnover_rate', 'stock_price',
+                   'stock_chg_pct', 'stock_pb', 'conv_price', 'conv_value', 'premium_rate', 'pure_bond_value',
+                   'pure_bond_premium_rate', 'double_low', 'put_trigger_price', 'force_redeem_trigger_price',
+                   'conv_proportion', 'remaining_years', 'remaining_size', 'ytm_before_tax')
+MIRROR_COLUMNS = ('trade_date',) + STRING_COLUMNS + FLOAT64_COLUMNS + FLOAT32_COLUMNS
+
+
+def _mirror_schema():
+    fields = [pa.field('trade_date', pa.date32(), nullable=False)]
+    fields += [pa.field(name, pa.dictionary(pa.int32(), pa.string())) for name in STRING_COLUMNS]
+    fields += [pa.field(name, pa.float64()) for name in FLOAT64_COLUMNS]
+    fields += [pa.field(name, pa.float32()) for name in FLOAT32_COLUMNS]
+    return pa.schema(fields)
+
+
+def _partition_dir(root: str, year_month: str) -> str:
+    year, month = year_month.split('-')
+    return os.path.join(root, f'year={year}', f'month={month}')
+
+
+class ParquetMirror:
+    """把 SQLite 中的历史表增量同步为按月分区的 Parquet 数据集"""
+
+    def __init__(self, db_path: str, root: str = DEFAULT_MIRROR_ROOT):
+        self.db_path = db_path
+        self.root = root
+
+    def _load_state(self) -> Dict:
+        path = os.path.join(self.root, SYNC_STATE_FILE)
+        if not os.path.exists(path): return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except Exception as e:
+            logging.warning(f"读取 Parquet 镜像同步状态失败，将整体重写: {e}")
+            return {}
+        return state if state.get('format_version') == MIRROR_FORMAT_VERSION else {}
+
+    def _save_state(self, state: Dict) -> None:
+        path = os.path.join(self.root, SYNC_STATE_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def sync(self, full: bool = False) -> Dict:
+        """同步镜像，返回本次重写和删除的分区及耗时；full 为 True 时重写全部分区"""
+        started = time.perf_counter()
+        os.makedirs(self.root, exist_ok=True)
+        state = {} if full else self._load_state()
+        if not state:
+            # 没有可用的同步状态时整体重写，先清掉旧分区，避免残留已不存在的月份
+            for name in os.listdir(self.root):
+                if name.startswith('year='): shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+        old_counts: Dict[str, int] = state.get('partitions', {})
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            # 同一读事务内确定水位线、找出变化分区并导出，保证镜像与水位线对应同一份快照
+            conn.execute("BEGIN")
+            # 水位线取快照时刻（与 updated_at 同为 SQLite 的 UTC 时间），此前提交的写入都已包含在本次快照中
+            watermark = conn.execute(f"SELECT CURRENT_TIMESTAMP FROM {HISTORY_TABLE_NAME} LIMIT 1").fetchone()
+            watermark = watermark[0] if watermark else None
+            if is_normalized(conn):
+                # 规范化存储下各月行数由按交易日维护的统计表汇总，变化月份走事实表的 updated_at 索引，都不经过兼容视图
+                counts_sql = f"SELECT substr(trade_date, 1, 7), SUM(row_count) FROM {DATE_STATS_TABLE} WHERE row_count > 0 GROUP BY 1"
+                touched_sql = f"SELECT DISTINCT substr({date_sql('day')}, 1, 7) FROM {FACT_TABLE_NAME} WHERE updated_at >= datetime(?, ?)"
+            else:
+                counts_sql = f"SELECT substr(trade_date, 1, 7), COUNT(*) FROM {HISTORY_TABLE_NAME} GROUP BY 1"
+                touched_sql = f"SELECT DISTINCT substr(trade_date, 1, 7) FROM {HISTORY_TABLE_NAME} WHERE updated_at >= datetime(?, ?)"
+            counts = dict(conn.execute(counts_sql).fetchall())
+            touched = {ym for ym, count in counts.items() if old_counts.get(ym) != count}
+            if state.get('watermark'):
+                # updated_at 在语句执行时取值、事务提交时才可见，跨越上次快照的写事务时间戳可能略早于水位线，留出余量重新检查
+                touched |= {row[0] for row in conn.execute(touched_sql, (state['watermark'], f'-{WATERMARK_MARGIN_SECONDS} seconds'))}
+            else:
+                touched = set(counts)
+            removed = sorted(set(old_counts) - set(counts))
+            rows_written = 0
+            for year_month in sorted(touched):
+                rows_written += self._export_partition(conn, year_month)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        for year_month in removed:
+            shutil.rmtree(_partition_dir(self.root, year_month), ignore_errors=True)
+        self._save_state({'format_version': MIRROR_FORMAT_VERSION, 'watermark': watermark, 'partitions': counts,
+                          'synced_at': time.strftime('%Y-%m-%d %H:%M:%S')})
+        result = {'partitions_rewritten': sorted(touched), 'partitions_removed': removed, 'rows_written': rows_written,
+                  'total_partitions': len(counts), 'seconds': round(time.perf_counter() - started, 3)}
+        logging.info(f"Parquet 镜像同步完成: 重写 {len(touched)}/{len(counts)} 个月份分区，共 {rows_written} 行，"
+                     f"删除 {len(removed)} 个分区，耗时 {result['seconds']} 秒")
+        return result
+
+    def _export_partition(self, conn: sqlite3.Connection, year_month: str) -> int:
+        year, month = (int(part) for part in year_month.split('-'))
+        start = date(year, month, 1).isoformat()
+        end = (date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)).isoformat()
+        if is_normalized(conn):
+            # 规范化存储按事实表主键 (day, bond_id) 的范围扫描，兼容视图上的日期条件无法使用索引
+            df = pd.read_sql_query(f"SELECT {', '.join(MIRROR_COLUMNS)} FROM ({history_select_sql(with_keys=True)}) "
+                                   f"WHERE day >= ? AND day < ? ORDER BY day, bond_code", conn,
+                                   params=(to_day_number(start), to_day_number(end)))
+        else:
+            # 按主键 (trade_date, bond_code) 的范围扫描读取整月数据
+            df = pd.read_sql_query(f"SELECT {', '.join(MIRROR_COLUMNS)} FROM {HISTORY_TABLE_NAME} "
+                                   f"WHERE trade_date >= ? AND trade_date < ? ORDER BY trade_date, bond_code", conn, params=(start, end))
+        df['trade_date'] = pd.to_datetime(df['trade_date'], errors='coerce').dt.date
+        df = df.dropna(subset=['trade_date'])
+        for name in STRING_COLUMNS:
+            df[name] = df[name].astype(object).where(df[name].notna(), None)
+        table = pa.Table.from_pandas(df, schema=_mirror_schema(), preserve_index=False)
+
+        directory = _partition_dir(self.root, year_month)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, 'part-0.parquet')
+        tmp_path = f"{path}.tmp"
+        pq.write_table(table, tmp_path, compression='zstd', row_group_size=64 * 1024)
+        os.replace(tmp_path, path)
+        return table.num_rows
+
+
+def _date_filters(start_date: Optional[str], end_date: Optional[str]) -> List:
+    """日期范围同时转换为 year 分区条件（跳过整个目录）和 trade_date 条件（借助行组统计跳过数据）"""
+    filters = []
+    if start_date:
+        filters += [('year', '>=', int(start_date[:4])), ('trade_date', '>=', date.fromisoformat(start_date))]
+    if end_date:
+        filters += [('year', '<=', int(end_date[:4])), ('trade_date', '<=', date.fromisoformat(end_date))]
+    return filters
+
+
+def read_history(columns: Optional[Sequence[str]] = None, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                 bond_codes: Optional[Sequence[str]] = None, filters: Optional[List] = None,
+                 root: str = DEFAULT_MIRROR_ROOT, as_arrow: bool = False):
+    """
+    从 Parquet 镜像读取历史数据。
+    columns 只读取所需列；start_date / end_date / bond_codes 以及 filters（pyarrow 的 DNF 条件列表，
+    如 [('premium_rate', '<', 20)]）都会下推到文件扫描，as_arrow 为 True 时返回 pyarrow.Table
+    """
+    conditions = _date_filters(start_date, end_date) + list(filters or [])
+    if bond_codes:
+        conditions.append(('bond_code', 'in', list(bond_codes)))
+    table = pq.read_table(root, columns=list(columns) if columns else None, filters=conditions or None,
+                          partitioning='hive')
+    # 分区列只用于裁剪目录，不出现在结果中
+    table = table.drop_columns([name for name in ('year', 'month') if name in table.column_names and
+                                not (columns and name in columns)])
+    return table if as_arrow else table.to_pandas()
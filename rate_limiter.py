@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按数据源的令牌桶限流器
+所有工作线程共享同一组令牌桶，每个数据源按配置的请求速率和突发量放行请求。
+默认速率按工作线程数放大：原先每个线程每次请求后固定暂停 request_delay 秒，N 个线程合计每秒最多 N / request_delay 次，
+令牌桶保持这一总速率，只是把各线程的请求摊平，不再在线程数增加时反而成为瓶颈
+"""
+
+import math
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+
+@dataclass
+class RateLimit:
+    """单个数据源的限流配置"""
+    rate: float  # 每秒允许的请求数
+    burst: int  # 允许的突发请求数（令牌桶容量）
+
+
+# 单个工作线程的限流配置，东财/新浪/腾讯/集思录与 DataSourceConfig.request_delay 保持一致 (rate = 1 / request_delay)；
+# 实际令牌桶的速率为该值乘以工作线程数，突发量不小于工作线程数
+SOURCE_RATE_LIMITS = {
+    'jsl': RateLimit(rate=1 / 0.3, burst=2),
+    'eastmoney': RateLimit(rate=1 / 0.5, burst=4),
+    'sina': RateLimit(rate=1 / 0.2, burst=5),
+    'tencent': RateLimit(rate=1 / 0.4, burst=3),
+    'ths': RateLimit(rate=2.0, burst=2),
+}
+# 与收集器 --workers 的默认值一致
+DEFAULT_WORKERS = 5
+
+# 被判定为上游限流/拒绝连接的错误关键字
+THROTTLE_ERROR_MARKERS = ('remote end closed connection', 'connection aborted', 'too many requests', '频繁')
+# 错误信息中的 HTTP 429 状态码；只匹配紧跟 client error 或跟在 status 之后的 429，不会误中 113429 这类债券代码
+THROTTLE_STATUS_PATTERN = re.compile(r'\b429\b\s*client error|status(?:[ _]code)?\D{0,3}\b429\b')
+
+
+def is_throttle_error(error: Exception) -> bool:
+    response = getattr(error, 'response', None)
+    if getattr(response, 'status_code', None) == 429: return True
+    error_str = str(error).lower()
+    return any(marker in error_str for marker in THROTTLE_ERROR_MARKERS) or THROTTLE_STATUS_PATTERN.search(error_str) is not None
+
+
+class TokenBucket:
+    """线程安全的令牌桶"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self) -> float:
+        """阻塞直到取得一个令牌，返回等待的秒数"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds: float) -> None:
+        """上游限流时暂停整个数据源，并清空已积累的突发额度"""
+        with self._lock:
+            now = time.monotonic()
+            self._blocked_until = max(self._blocked_until, now + seconds)
+            self._tokens = 0.0
+            self._last_refill = max(now, self._blocked_until)
+
+
+def scaled_rate_limits(workers: int, overrides: Optional[Dict[str, RateLimit]] = None) -> Dict[str, RateLimit]:
+    """按工作线程数放大单线程限流配置得到各数据源的总限流；overrides 中的数据源直接使用给定的总速率和突发量"""
+    workers = max(1, workers)
+    limits = {source: RateLimit(rate=limit.rate * workers, burst=max(limit.burst, workers)) for source, limit in SOURCE_RATE_LIMITS.items()}
+    limits.update(overrides or {})
+    return limits
+
+
+def parse_rate_limit(text: str) -> Tuple[str, RateLimit]:
+    """解析命令行的 SOURCE=RATE[:BURST]，RATE 为每秒请求数，省略 BURST 时取 RATE 向上取整"""
+    source, _, value = text.partition('=')
+    rate_text, _, burst_text = value.partition(':')
+    if not source or not rate_text:
+        raise ValueError(f"限流配置格式应为 SOURCE=RATE[:BURST]: {text}")
+    rate = float(rate_text)
+    if rate <= 0:
+        raise ValueError(f"限流速率必须大于 0: {text}")
+    return source, RateLimit(rate=rate, burst=int(burst_text) if burst_text else max(1, math.ceil(rate)))
+
+
+class SourceRateLimiter:
+    """按数据源分组的令牌桶集合，未配置的数据源不限流"""
+
+    def __init__(self, limits: Optional[Dict[str, RateLimit]] = None):
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.configure_all(limits or scaled_rate_limits(DEFAULT_WORKERS))
+
+    def configure_all(self, limits: Dict[str, RateLimit]) -> None:
+        for source, limit in limits.items():
+            self.configure(source, limit.rate, limit.burst)
+
+    def configure(self, source: str, rate: float, burst: int) -> None:
+        with self._lock:
+            self._buckets[source] = TokenBucket(rate, burst)
+
+    def acquire(self, source: Optional[str]) -> float:
+        bucket = self._buckets.get(source)
+        return bucket.acquire() if bucket is not None else 0.0
+
+    def backoff_delay(self, source: Optional[str], attempt: int, initial_delay: float, throttled: bool) -> float:
+        """计算带抖动的退避时间；若为限流错误，同时暂停该数据源，避免其他线程继续冲击"""
+        delay = initial_delay * (2 ** attempt)
+        delay = random.uniform(delay / 2, delay)
+        bucket = self._buckets.get(source)
+        if throttled and bucket is not None:
+            bucket.pause(delay)
+        return delay
+
+
+_rate_limiter = SourceRateLimiter()
+
+
+def get_rate_limiter() -> SourceRateLimiter:
+    """获取进程内共享的限流器"""
+    return _rate_limiter
+
+
+def configure_rate_limits(workers: int = DEFAULT_WORKERS, overrides: Optional[Dict[str, RateLimit]] = None) -> Dict[str, RateLimit]:
+    """按本次运行的工作线程数重新配置共享限流器，返回生效的各数据源限流"""
+    limits = scaled_rate_limits(workers, overrides)
+    _rate_limiter.configure_all(limits)
+    return limits
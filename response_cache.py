@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+akshare 原始返回数据的本地磁盘缓存
+按接口名和参数内容寻址，压缩存储为 Parquet 文件（缺少 pyarrow 时退化为 gzip pickle），
+支持按接口设置有效期、按总大小淘汰，以及只读缓存的离线回放模式
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, time as dtime, timedelta
+from typing import Callable, Dict, Optional
+
+from lazy_import import lazy_module
+
+pd = lazy_module('pandas')
+
+DEFAULT_CACHE_FOLDER = os.path.join('data', 'akshare_cache')
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# 各接口的缓存有效期（秒）；0 表示不缓存，None 表示永不过期
+API_CACHE_TTL = {
+    'tool_trade_date_hist_sina': 7 * 24 * 3600,
+    'bond_zh_cov_info_ths': 12 * 3600,
+    'bond_zh_cov_value_analysis': 12 * 3600,
+    'stock_zh_a_hist': 12 * 3600,
+    'stock_zh_a_hist_tx': 12 * 3600,
+    'bond_zh_hs_cov_daily': 12 * 3600,
+    'bond_cb_jsl': 10 * 60,
+    'bond_zh_cov': 10 * 60,
+}
+DEFAULT_TTL = 3600
+
+# 参与缓存键计算时忽略的参数（不影响返回内容）
+_IGNORED_KWARGS = ('timeout',)
+_FILE_SUFFIXES = ('.parquet', '.pkl.gz')
+
+
+# 返回逐日行情的接口：范围包含当天的响应在收盘前仍在变化，收盘结算后即失效
+DAILY_BAR_APIS = ('stock_zh_a_hist', 'stock_zh_a_hist_tx', 'bond_zh_hs_cov_daily', 'bond_zh_cov_value_analysis')
+# 开盘前当天没有日线；收盘后留出半小时，等数据源完成当日结算
+MARKET_OPEN = dtime(9, 30)
+DAILY_BAR_SETTLED = dtime(15, 30)
+
+
+def _resolve_ttl(func_name: str, kwargs: Dict) -> Optional[float]:
+    """截止日期早于今天的日线请求内容不会再变化，永久有效"""
+    end_date = kwargs.get('end_date')
+    if end_date and str(end_date).replace('-', '') < datetime.now().strftime('%Y%m%d'):
+        return None
+    return API_CACHE_TTL.get(func_name, DEFAULT_TTL)
+
+
+def last_settlement(now: datetime) -> datetime:
+    """最近一次日线结算的时刻（不区分交易日，非交易日多失效一次不影响正确性）"""
+    settled = datetime.combine(now.date(), DAILY_BAR_SETTLED)
+    return settled if now >= settled else settled - timedelta(days=1)
+
+
+def may_have_today_bar(now: datetime) -> bool:
+    """当天是否可能已有日线：周末和开盘前不会有"""
+    return now.weekday() < 5 and now.time() >= MARKET_OPEN
+
+
+def _settled_since(func_name: str, kwargs: Dict, fetched_at: float) -> bool:
+    """范围包含当天的日线响应，抓取之后又经过一次收盘结算即过期"""
+    if func_name not in DAILY_BAR_APIS or _resolve_ttl(func_name, kwargs) is None: return False
+    return fetched_at < last_settlement(datetime.now()).timestamp()
+
+
+def make_cache_key(func_name: str, kwargs: Dict) -> str:
+    payload = {k: v for k, v in kwargs.items() if k not in _IGNORED_KWARGS}
+    raw = json.dumps({'func': func_name, 'kwargs': payload}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """akshare 返回数据的磁盘缓存"""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_FOLDER, max_bytes: int = DEFAULT_MAX_BYTES, offline: bool = False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'stores': 0, 'evictions': 0, 'offline_misses': 0}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._total_bytes = sum(os.path.getsize(path) for path in self._iter_files())
+
+    def _iter_files(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(_FILE_SUFFIXES):
+                    yield os.path.join(root, name)
+
+    def _base_path(self, func_name: str, key: str) -> str:
+        return os.path.join(self.cache_dir, func_name, key)
+
+    def get(self, func_name: str, kwargs: Dict) -> Optional[pd.DataFrame]:
+        """命中且未过期时返回缓存数据；离线模式下忽略有效期"""
+        base_path = self._base_path(func_name, make_cache_key(func_name, kwargs))
+        ttl = _resolve_ttl(func_name, kwargs)
+        for suffix in _FILE_SUFFIXES:
+            path = base_path + suffix
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if not self.offline and ((ttl is not None and time.time() - stat.st_mtime > ttl) or _settled_since(func_name, kwargs, stat.st_mtime)):
+                self._bump('stale')
+                return None
+            try:
+                df = pd.read_parquet(path) if suffix == '.parquet' else pd.read_pickle(path, compression='gzip')
+            except Exception as e:
+                logging.warning(f"读取缓存文件失败，将重新请求: {path}. 错误: {e}")
+                return None
+            # 用访问时间记录最近使用，修改时间仍代表抓取时间
+            os.utime(path, (time.time(), stat.st_mtime))
+            self._bump('hits')
+            return df
+        self._bump('misses')
+        return None
+
+    def put(self, func_name: str, kwargs: Dict, df: pd.DataFrame) -> None:
+        if _resolve_ttl(func_name, kwargs) == 0 or not isinstance(df, pd.DataFrame) or df.empty: return
+        base_path = self._base_path(func_name, make_cache_key(func_name, kwargs))
+        os.makedirs(os.path.dirname(base_path), exist_ok=True)
+        tmp_path = f"{base_path}.{threading.get_ident()}.tmp"
+        try:
+            try:
+                df.to_parquet(tmp_path, compression='zstd', index=False)
+                path = base_path + '.parquet'
+            except Exception:
+                # 无 pyarrow 或列类型无法写入 Parquet 时退化为压缩 pickle
+                df.to_pickle(tmp_path, compression='gzip')
+                path = base_path + '.pkl.gz'
+            with self._lock:
+                # 覆盖已有条目时先扣除旧文件的大小，并删除另一种格式的旧文件，避免 get 读到过时的兄弟文件
+                replaced_bytes = 0
+                for suffix in _FILE_SUFFIXES:
+                    existing = base_path + suffix
+                    try:
+                        replaced_bytes += os.path.getsize(existing)
+                    except FileNotFoundError:
+                        continue
+                    if existing != path: os.remove(existing)
+                os.replace(tmp_path, path)
+                self._total_bytes += os.path.getsize(path) - replaced_bytes
+                self.stats['stores'] += 1
+                over_limit = self._total_bytes > self.max_bytes
+        except Exception as e:
+            logging.warning(f"写入缓存失败: {func_name}. 错误: {e}")
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            return
+        if over_limit:
+            self._evict()
+
+    def fetch(self, func_name: str, kwargs: Dict, loader: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """先查缓存，未命中时调用 loader 并写回；离线模式下未命中直接返回空表"""
+        cached = self.get(func_name, kwargs)
+        if cached is not None: return cached
+        if self.offline:
+            self._bump('offline_misses')
+            logging.warning(f"离线模式下缓存未命中: {func_name} {kwargs.get('symbol', '')}")
+            return pd.DataFrame()
+        result = loader()
+        self.put(func_name, kwargs, result)
+        return result
+
+    def _evict(self) -> None:
+        """按最近访问时间从旧到新删除，直到总大小降到上限的 90% 以下"""
+        with self._lock:
+            files = []
+            for path in self._iter_files():
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_atime, stat.st_size, path))
+            self._total_bytes = sum(size for _, size, _ in files)
+            target = self.max_bytes * 0.9
+            for _, size, path in sorted(files):
+                if self._total_bytes <= target: break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                self._total_bytes -= size
+                self.stats['evictions'] += 1
+
+    def _bump(self, counter: str) -> None:
+        with self._lock:
+            self.stats[counter] += 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self.stats, bytes=self._total_bytes, max_bytes=self.max_bytes, offline=self.offline)
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def configure_response_cache(enabled: bool = True, offline: bool = False, cache_dir: str = DEFAULT_CACHE_FOLDER,
+                             max_bytes: int = DEFAULT_MAX_BYTES) -> Optional[ResponseCache]:
+    """设置进程内共享的响应缓存；离线模式必须启用缓存"""
+    global _response_cache
+    _response_cache = ResponseCache(cache_dir, max_bytes, offline) if (enabled or offline) else None
+    return _response_cache
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    return _response_cache
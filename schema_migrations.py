@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库结构版本迁移
+schema_version 表记录已执行的迁移，启动时按版本号顺序执行尚未执行的迁移，每个迁移在独立事务中完成，
+已有的数据库因此可以随代码一起演进，而不只依赖 CREATE TABLE IF NOT EXISTS。
+历史表保留 rowid 表而不用 WITHOUT ROWID，对比数据见 README 中的查询计划检查一节
+"""
+
+import logging
+import os
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence
+
+from collection_ledger import CREATE_LEDGER_TABLE_SQL
+from history_stats import rebuild_history_stats, stats_schema_statements
+from stock_app.column_profiler import CREATE_PROFILE_CACHE_TABLE_SQL
+from stock_app.history_storage import fact_index_statements, normalize_history_storage
+from trading_calendar import CREATE_CALENDAR_META_TABLE_SQL, CREATE_CALENDAR_TABLE_SQL
+
+SCHEMA_VERSION_TABLE = 'schema_version'
+HISTORY_TABLE_NAME = 'cb_daily_history'
+# 每次启动时近似 ANALYZE 的每索引采样行数，百万行的表也只需几毫秒
+ANALYSIS_LIMIT = 1000
+# 用最新快照回填历史记录时涉及的静态字段，每个字段一个只包含空值行的部分索引
+BACKFILL_NULL_FIELDS = ('bond_rating', 'put_trigger_price', 'force_redeem_trigger_price', 'conv_price', 'maturity_date', 'stock_pb')
+
+CREATE_HISTORY_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {HISTORY_TABLE_NAME} (
+    trade_date TEXT NOT NULL, bond_code TEXT NOT NULL, bond_name TEXT, price REAL, price_chg_pct REAL, open_price REAL,
+    high_price REAL, low_price REAL, volume REAL, turnover REAL, turnover_rate REAL, stock_code TEXT, stock_name TEXT,
+    stock_price REAL, stock_chg_pct REAL, stock_pb REAL, conv_price REAL, conv_value REAL, premium_rate REAL,
+    pure_bond_value REAL, pure_bond_premium_rate REAL, double_low REAL, bond_rating TEXT, put_trigger_price REAL,
+    force_redeem_trigger_price REAL, conv_proportion REAL, maturity_date TEXT, remaining_years REAL,
+    remaining_size REAL, ytm_before_tax REAL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (trade_date, bond_code)
+)
+"""
+
+CREATE_LATEST_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS convertible_bond_data (
+    bond_code TEXT PRIMARY KEY, bond_name TEXT, price REAL, price_chg_pct REAL, stock_code TEXT, stock_name TEXT,
+    stock_price REAL, stock_chg_pct REAL, stock_pb REAL, conv_price REAL, conv_value REAL, premium_rate REAL,
+    bond_rating TEXT, put_trigger_price REAL, force_redeem_trigger_price REAL, conv_proportion REAL,
+    maturity_date TEXT, remaining_years REAL, remaining_size REAL, turnover REAL, turnover_rate REAL,
+    ytm_before_tax REAL, double_low REAL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+CREATE_INFO_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS bond_info (
+    bond_code TEXT PRIMARY KEY, bond_name TEXT, stock_code TEXT, stock_name TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+def _normalize_history_storage(conn: sqlite3.Connection) -> None:
+    """历史表拆分为 bond_info 与事实表 cb_daily_fact，原表名改为兼容视图；统计触发器改建在事实表上并重建统计"""
+    result = normalize_history_storage(conn)
+    for statement in fact_index_statements(BACKFILL_NULL_FIELDS) + stats_schema_statements(normalized=True):
+        conn.execute(statement)
+    rebuild_history_stats(conn)
+    logging.info(f"历史数据已规范化: {result['bonds']} 只债券，{result['rows']} 条记录，"
+                 f"{result['changed_rows']} 条记录的债券属性统一为最新值")
+
+
+@dataclass
+class Migration:
+    """一次结构迁移：按顺序执行 statements，或调用 apply(conn) 完成更复杂的变更"""
+    version: int
+    name: str
+    statements: Sequence[str] = ()
+    apply: Optional[Callable[[sqlite3.Connection], None]] = None
+    # ANALYZE 等不适合放在事务中的语句
+    transactional: bool = True
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'base_tables', [CREATE_HISTORY_TABLE_SQL, CREATE_LATEST_TABLE_SQL, CREATE_INFO_TABLE_SQL]),
+    # 按债券查询历史、取每只债券最新交易日的增量水位线
+    Migration(2, 'history_bond_date_index',
+              [f"CREATE INDEX IF NOT EXISTS idx_history_bond_date ON {HISTORY_TABLE_NAME} (bond_code, trade_date)"]),
+    # 评级下拉框的 SELECT DISTINCT bond_rating，以及回填 UPDATE 只需访问仍为空值的行
+    Migration(3, 'history_partial_indexes',
+              [f"CREATE INDEX IF NOT EXISTS idx_history_rating ON {HISTORY_TABLE_NAME} (bond_rating) WHERE bond_rating IS NOT NULL"]
+              + [f"CREATE INDEX IF NOT EXISTS idx_history_null_{field} ON {HISTORY_TABLE_NAME} (bond_code) WHERE {field} IS NULL"
+                 for field in BACKFILL_NULL_FIELDS]),
+    Migration(4, 'ledger_and_calendar_tables', [CREATE_LEDGER_TABLE_SQL, CREATE_CALENDAR_TABLE_SQL, CREATE_CALENDAR_META_TABLE_SQL]),
+    Migration(5, 'analyze', ['ANALYZE'], transactional=False),
+    # Parquet 镜像按 updated_at 水位线找出有变化的月份
+    Migration(6, 'history_updated_at_index',
+              [f"CREATE INDEX IF NOT EXISTS idx_history_updated_at ON {HISTORY_TABLE_NAME} (updated_at)"]),
+    # 按交易日和按债券的统计表及其触发器，建好后按已有数据重建一次
+    Migration(7, 'history_stats', stats_schema_statements(), apply=rebuild_history_stats),
+    # 字段质量画像按数据版本持久化，看板打开时直接读取
+    Migration(8, 'column_profile_cache', [CREATE_PROFILE_CACHE_TABLE_SQL]),
+    # 债券属性归入 bond_info、交易日存为整数，cb_daily_history 成为兼容视图
+    Migration(9, 'normalize_history_storage', apply=_normalize_history_storage),
+    # 释放旧宽表的空闲页，文件体积随之缩小；VACUUM 不能在事务中执行
+    Migration(10, 'vacuum_after_normalize', ['VACUUM'], transactional=False),
+]
+
+
+def _ensure_version_table(conn: sqlite3.Connection) -> None:
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMP NOT NULL)")
+    conn.commit()
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """当前数据库已执行到的迁移版本，未执行过任何迁移时为 0"""
+    _ensure_version_table(conn)
+    return conn.execute(f"SELECT COALESCE(MAX(version), 0) FROM {SCHEMA_VERSION_TABLE}").fetchone()[0]
+
+
+def _run_migration(conn: sqlite3.Connection, migration: Migration) -> None:
+    record_sql = f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, name, applied_at) VALUES (?, ?, ?)"
+    record_args = (migration.version, migration.name, datetime.now().isoformat(timespec='seconds'))
+    if not migration.transactional:
+        for statement in migration.statements:
+            conn.execute(statement)
+        conn.execute(record_sql, record_args)
+        conn.commit()
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for statement in migration.statements:
+            conn.execute(statement)
+        if migration.apply is not None:
+            migration.apply(conn)
+        conn.execute(record_sql, record_args)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def apply_migrations(db_path: str, migrations: Sequence[Migration] = MIGRATIONS) -> List[int]:
+    """执行所有尚未执行的迁移，返回本次执行的版本号；结束时刷新查询计划统计"""
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    # isolation_level=None：由本模块显式控制事务边界
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    applied = []
+    try:
+        # WAL 是数据库文件的持久设置；看板以只读方式打开，无法自行切换，由收集器启动时确保，读写互不阻塞
+        conn.execute("PRAGMA journal_mode = WAL")
+        current = get_schema_version(conn)
+        for migration in sorted(migrations, key=lambda m: m.version):
+            if migration.version <= current: continue
+            logging.info(f"执行数据库迁移 {migration.version:03d}_{migration.name}")
+            _run_migration(conn, migration)
+            applied.append(migration.version)
+        # 首次建库时表是空的，迁移中的 ANALYZE 得不到有效统计；每次启动按采样刷新，数据增长后索引选择仍然准确
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    if applied:
+        logging.info(f"数据库结构已升级到版本 {applied[-1]}")
+    return applied
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+字段质量画像
+一次分块扫描同时统计每个字段的空值数、唯一值数、最小/最大值和零值数：行数不超过阈值时唯一值精确计数，
+超过阈值时用 HyperLogLog 估算（误差约 1%），内存占用与表大小无关。
+结果按数据版本（行数 + 最近更新时间 + 列结构）缓存在内存和 column_profile_cache 表中，
+数据没有变化时看板和质量检查直接读取缓存；收集器做质量检查时顺带刷新缓存，看板打开时通常无需扫描
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+PROFILE_CACHE_TABLE = 'column_profile_cache'
+# 行数不超过该值时整表读入内存精确计算唯一值数
+EXACT_DISTINCT_MAX_ROWS = 200_000
+CHUNK_ROWS = 100_000
+HLL_PRECISION = 14
+
+CREATE_PROFILE_CACHE_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {PROFILE_CACHE_TABLE} (
+    table_name TEXT PRIMARY KEY,
+    data_version TEXT NOT NULL,
+    computed_at TIMESTAMP NOT NULL,
+    profile TEXT NOT NULL
+)
+"""
+
+_memory_cache: Dict[Tuple[str, str], Tuple[str, Dict]] = {}
+_memory_cache_lock = threading.Lock()
+
+
+class HyperLogLog:
+    """基于 numpy 的 HyperLogLog，按批加入 64 位哈希值"""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        import numpy as np
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def add_hashes(self, hashes) -> None:
+        import numpy as np
+        if len(hashes) == 0: return
+        hashes = hashes.astype(np.uint64, copy=False)
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        # 剩余位左移到高位，末尾补 1 保证前导零个数有上界
+        rest = (hashes << np.uint64(self.p)) | np.uint64(1 << (self.p - 1))
+        # 分高低 32 位用 float64 精确求最高位位置，得到前导零个数
+        high = (rest >> np.uint64(32)).astype(np.float64)
+        low = (rest & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        leading_zeros = np.where(high > 0, 31 - np.floor(np.log2(np.maximum(high, 1))),
+                                 63 - np.floor(np.log2(np.maximum(low, 1))))
+        np.maximum.at(self.registers, index, (leading_zeros + 1).astype(np.uint8))
+
+    def estimate(self) -> int:
+        import numpy as np
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        raw = alpha * self.m * self.m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * self.m and zeros:
+            return int(round(self.m * np.log(self.m / zeros)))
+        return int(round(raw))
+
+
+class _ColumnAccumulator:
+    """单个字段在分块扫描中的累计统计"""
+
+    def __init__(self, name: str, declared_type: str, exact: bool):
+        self.name = name
+        self.declared_type = declared_type
+        self.null_count = 0
+        self.zero_count = 0
+        self.minimum = None
+        self.maximum = None
+        self.exact = exact
+        self.distinct = 0
+        self.hll = None if exact else HyperLogLog()
+
+    def update(self, values) -> None:
+        import pandas as pd
+        self.null_count += int(values.isna().sum())
+        present = values.dropna()
+        if present.empty: return
+        if pd.api.types.is_numeric_dtype(present):
+            self.zero_count += int((present == 0).sum())
+        try:
+            low, high = present.min(), present.max()
+            self.minimum = low if self.minimum is None else min(self.minimum, low)
+            self.maximum = high if self.maximum is None else max(self.maximum, high)
+        except TypeError:
+            # 同一列混有文本和数值时不比较大小
+            pass
+        if self.exact:
+            self.distinct = int(present.nunique())
+        else:
+            self.hll.add_hashes(pd.util.hash_array(present.to_numpy()))
+
+    def result(self) -> Dict:
+        distinct = self.distinct if self.exact else self.hll.estimate()
+        return {'column': self.name, 'type': self.declared_type, 'null_count': self.null_count,
+                'distinct_count': distinct, 'distinct_exact': self.exact, 'zero_count': self.zero_count,
+                'min': _plain(self.minimum), 'max': _plain(self.maximum)}
+
+
+def _plain(value):
+    """numpy 标量转为可 JSON 序列化的 Python 对象"""
+    return value.item() if hasattr(value, 'item') else value
+
+
+class ColumnProfiler:
+    """对一张表做字段质量画像，并按数据版本缓存结果"""
+
+    def __init__(self, db_path: str, table_name: str = 'cb_daily_history', chunk_rows: int = CHUNK_ROWS,
+                 exact_distinct_max_rows: int = EXACT_DISTINCT_MAX_ROWS):
+        self.db_path = db_path
+        self.table_name = table_name
+        self.chunk_rows = chunk_rows
+        self.exact_distinct_max_rows = exact_distinct_max_rows
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _columns(self, conn: sqlite3.Connection) -> List[Tuple[str, str]]:
+        return [(row[1], row[2]) for row in conn.execute(f"PRAGMA table_info({self.table_name})").fetchall()]
+
+    def _row_count(self, conn: sqlite3.Connection) -> int:
+        if self.table_name == 'cb_daily_history':
+            try:
+                # 收集器维护的按交易日统计表，避免为了取版本号而数一遍整表
+                return conn.execute("SELECT COALESCE(SUM(row_count), 0) FROM history_date_stats").fetchone()[0]
+            except sqlite3.OperationalError:
+                pass
+        return conn.execute(f"SELECT COUNT(*) FROM {self.table_name}").fetchone()[0]
+
+    def data_version(self, conn: Optional[sqlite3.Connection] = None) -> str:
+        """数据版本：行数、最近更新时间和列结构，任何写入、删除、回填或加列都会改变它"""
+        own = conn is None
+        conn = conn or self._connect()
+        try:
+            columns = self._columns(conn)
+            names = [name for name, _ in columns]
+            latest = conn.execute(f"SELECT MAX(updated_at) FROM {self.table_name}").fetchone()[0] if 'updated_at' in names else None
+            signature = zlib.crc32(','.join(f"{name}:{kind}" for name, kind in columns).encode('utf-8'))
+            return f"rows={self._row_count(conn)};updated={latest};columns={signature:08x}"
+        finally:
+            if own: conn.close()
+
+    def profile(self, use_cache: bool = True) -> Dict:
+        """返回 {'data_version', 'total_rows', 'computed_at', 'seconds', 'columns': [...]}，数据未变化时直接返回缓存"""
+        conn = self._connect()
+        try:
+            version = self.data_version(conn)
+            key = (self.db_path, self.table_name)
+            if use_cache:
+                with _memory_cache_lock:
+                    cached = _memory_cache.get(key)
+                if cached and cached[0] == version: return cached[1]
+                stored = self._load_cached(conn, version)
+                if stored is not None:
+                    with _memory_cache_lock:
+                        _memory_cache[key] = (version, stored)
+                    return stored
+            result = self._scan(conn)
+            result['data_version'] = version
+            self._store_cached(conn, version, result)
+        finally:
+            conn.close()
+        with _memory_cache_lock:
+            _memory_cache[key] = (version, result)
+        return result
+
+    def _scan(self, conn: sqlite3.Connection) -> Dict:
+        import pandas as pd
+        started = time.perf_counter()
+        columns = self._columns(conn)
+        if not columns:
+            raise sqlite3.OperationalError(f"表 {self.table_name} 不存在")
+        total_rows = self._row_count(conn)
+        exact = total_rows <= self.exact_distinct_max_rows
+        accumulators = [_ColumnAccumulator(name, kind, exact) for name, kind in columns]
+        column_list = ', '.join(f'"{name}"' for name, _ in columns)
+        # 精确模式下整表一次读入，唯一值数可直接 nunique；估算模式下分块读取，每块更新 HLL
+        chunksize = None if exact else self.chunk_rows
+        chunks = pd.read_sql_query(f"SELECT {column_list} FROM {self.table_name}", conn, chunksize=chunksize)
+        scanned = 0
+        for chunk in ([chunks] if chunksize is None else chunks):
+            scanned += len(chunk)
+            for accumulator in accumulators:
+                accumulator.update(chunk[accumulator.name])
+        return {'total_rows': scanned, 'computed_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'seconds': round(time.perf_counter() - started, 3), 'distinct_method': 'exact' if exact else 'hyperloglog',
+                'columns': [accumulator.result() for accumulator in accumulators]}
+
+    def _load_cached(self, conn: sqlite3.Connection, version: str) -> Optional[Dict]:
+        try:
+            row = conn.execute(f"SELECT profile FROM {PROFILE_CACHE_TABLE} WHERE table_name = ? AND data_version = ?",
+                               (self.table_name, version)).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return json.loads(row[0]) if row else None
+
+    def _store_cached(self, conn: sqlite3.Connection, version: str, result: Dict) -> None:
+        """尽力写入持久化缓存；缓存表尚未建立、只读连接或数据库被锁时只保留内存缓存"""
+        try:
+            with conn:
+                conn.execute(f"INSERT OR REPLACE INTO {PROFILE_CACHE_TABLE} (table_name, data_version, computed_at, profile) VALUES (?, ?, ?, ?)",
+                             (self.table_name, version, result['computed_at'], json.dumps(result, ensure_ascii=False, default=str)))
+        except sqlite3.Error:
+            pass
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+看板的只读连接池
+连接以只读 URI 模式打开并设置 query_only、mmap_size、cache_size、busy_timeout，用完归还而不是关闭：
+页缓存和 sqlite3 的预编译语句缓存（cached_statements）在多次查询、多个会话之间复用。
+收集器启动时把数据库切换为 WAL 模式，只读连接不会被写事务阻塞；偶发的检查点锁由 busy_timeout 等待。
+stats() 返回借出次数、复用命中、新建连接、等待次数与耗时、占用耗时等指标
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_ACQUIRE_TIMEOUT = 10.0
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+DEFAULT_CACHE_SIZE_KIB = 16 * 1024
+DEFAULT_CACHED_STATEMENTS = 256
+
+
+class _Waiter:
+    """排队等待连接的请求；conn 为 None 表示转交的是一个空出的名额，由等待者自行新建连接"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.conn: Optional[sqlite3.Connection] = None
+
+
+class ReadConnectionPool:
+    """线程安全的只读 SQLite 连接池；连接按需创建，最多 size 个，空闲连接后进先出，使常用的少数连接保持页缓存温热"""
+
+    def __init__(self, db_path: str, size: int = DEFAULT_POOL_SIZE, acquire_timeout: float = DEFAULT_ACQUIRE_TIMEOUT,
+                 busy_timeout_ms: int = DEFAULT_BUSY_TIMEOUT_MS, mmap_size: int = DEFAULT_MMAP_SIZE,
+                 cache_size_kib: int = DEFAULT_CACHE_SIZE_KIB, cached_statements: int = DEFAULT_CACHED_STATEMENTS):
+        self.db_path = db_path
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.cached_statements = cached_statements
+        # 空闲连接按后进先出取用
+        self._idle: List[sqlite3.Connection] = []
+        # 等待者按先来先得排队
+        self._waiters: Deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._acquisitions = 0
+        self._hits = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._hold_seconds = 0.0
+        self._max_hold_seconds = 0.0
+
+    def _open(self) -> sqlite3.Connection:
+        uri = f"{Path(os.path.abspath(self.db_path)).as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=self.busy_timeout_ms / 1000, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        # 负值表示以 KiB 为单位
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kib)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        started = time.perf_counter()
+        waiter = None
+        conn = None
+        with self._lock:
+            self._acquisitions += 1
+            if self._idle:
+                conn = self._idle.pop()
+                self._hits += 1
+            elif self._created < self.size:
+                # 先占住名额，在锁外打开连接
+                self._created += 1
+            else:
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+                self._waits += 1
+        if waiter is not None:
+            waiter.event.wait(self.acquire_timeout)
+            with self._lock:
+                if not waiter.event.is_set():
+                    self._waiters.remove(waiter)
+                    self._timeouts += 1
+                    raise TimeoutError(f"等待数据库连接超时 ({self.acquire_timeout} 秒)，连接池大小 {self.size}")
+                conn = waiter.conn
+                if conn is not None:
+                    self._hits += 1
+        if conn is None:
+            try:
+                conn = self._open()
+            except Exception:
+                self._release_slot()
+                raise
+        wait = time.perf_counter() - started
+        with self._lock:
+            self._in_use += 1
+            self._wait_seconds += wait
+            self._max_wait_seconds = max(self._max_wait_seconds, wait)
+        return conn
+
+    def _release_slot(self) -> None:
+        """归还一个连接名额：有等待者时转交给最早的等待者，由它自行新建连接"""
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft().event.set()
+            else:
+                self._created -= 1
+
+    def _release(self, conn: sqlite3.Connection, hold: float, broken: bool) -> None:
+        if broken:
+            conn.close()
+        elif conn.in_transaction:
+            # 结束可能残留的读事务，避免长期持有 WAL 快照阻止检查点
+            conn.rollback()
+        with self._lock:
+            self._in_use -= 1
+            self._hold_seconds += hold
+            self._max_hold_seconds = max(self._max_hold_seconds, hold)
+            if broken:
+                self._discarded += 1
+            elif self._waiters:
+                # 直接交给最早的等待者，避免新来的请求插队导致等待者长时间饥饿
+                waiter = self._waiters.popleft()
+                waiter.conn = conn
+                waiter.event.set()
+                return
+            else:
+                self._idle.append(conn)
+                return
+        self._release_slot()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """借出一个连接，退出时归还；连接损坏（非锁等待类的数据库错误）时关闭丢弃"""
+        conn = self._acquire()
+        started = time.perf_counter()
+        broken = False
+        try:
+            yield conn
+        except sqlite3.DatabaseError as e:
+            broken = not isinstance(e, sqlite3.OperationalError)
+            raise
+        finally:
+            self._release(conn, time.perf_counter() - started, broken)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            acquisitions = self._acquisitions
+            return {
+                'size': self.size, 'created': self._created, 'in_use': self._in_use, 'idle': len(self._idle),
+                'acquisitions': acquisitions, 'hits': self._hits, 'hit_rate': round(self._hits / acquisitions, 4) if acquisitions else 0.0,
+                'waits': self._waits, 'timeouts': self._timeouts, 'discarded': self._discarded,
+                'avg_wait_ms': round(self._wait_seconds / acquisitions * 1000, 3) if acquisitions else 0.0,
+                'max_wait_ms': round(self._max_wait_seconds * 1000, 3),
+                'avg_hold_ms': round(self._hold_seconds / acquisitions * 1000, 3) if acquisitions else 0.0,
+                'max_hold_ms': round(self._max_hold_seconds * 1000, 3),
+            }
+
+    def close(self) -> None:
+        """关闭所有空闲连接；借出中的连接归还后仍会进入池中"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for conn in idle:
+            conn.close()
@@ -5,7 +5,6 @@
 """
 
 import streamlit as st
-import pandas as pd
 from datetime import datetime
 from database import BondDatabase
 
@@ -33,9 +32,9 @@ def get_available_dates():
 def get_bond_ratings():
     return db.get_bond_ratings()
 
-@st.cache_data
-def get_quality_report():
-    """获取并缓存数据质量报告"""
+@st.cache_data(max_entries=4)
+def get_quality_report(data_version: str):
+    """获取并缓存数据质量报告；以数据版本为键，数据更新后自动重新生成"""
     return db.get_column_quality_stats()
 
 available_dates = get_available_dates()
@@ -90,10 +89,10 @@ if selected_date:
     
     with st.spinner("加载数据中..."):
         try:
-            df = db.search_bonds(filters, sort_column='double_low', sort_direction='ASC')
+            # 返回的列已是压缩后的数值、分类和日期类型，成交量、成交额已在 SQL 中换算为手和万元
+            df = db.search_bonds(filters, sort_column='double_low', sort_direction='ASC', display_units=True)
             
             if not df.empty:
-                display_df = df.copy()
                 column_mapping = {
                     'bond_code': '债券代码', 'bond_name': '债券名称', 'price': '转债价格', 'premium_rate': '溢价率%',
                     'double_low': '双低值', 'conv_value': '转股价值', 'stock_code': '正股代码', 'stock_name': '正股名称',
@@ -104,22 +103,7 @@ if selected_date:
                     'conv_proportion': '转债占比%', 'price_chg_pct': '涨跌幅%', 'stock_chg_pct': '正股涨跌%',
                     'open_price': '开盘价', 'high_price': '最高价', 'low_price': '最低价', 'volume': '成交量(手)', 'turnover': '成交额(万)'
                 }
-                display_df = display_df.rename(columns=column_mapping)
-                
-                numeric_cols = [
-                    '转债价格', '溢价率%', '双低值', '转股价值', '正股价格', '正股PB', '转股价', '剩余年限',
-                    '剩余规模(亿)', '税前收益%', '换手率%', '回售触发价', '强赎触发价', '纯债价值',
-                    '纯债溢价率%', '转债占比%', '涨跌幅%', '正股涨跌%', '开盘价', '最高价', '最低价'
-                ]
-                for col in numeric_cols:
-                    if col in display_df.columns:
-                        display_df[col] = pd.to_numeric(display_df[col], errors='coerce')
-
-                if '成交量(手)' in display_df.columns:
-                    display_df['成交量(手)'] = display_df['成交量(手)'] / 100
-                
-                if '成交额(万)' in display_df.columns:
-                    display_df['成交额(万)'] = display_df['成交额(万)'] / 10000
+                display_df = df.rename(columns=column_mapping)
                 
                 if search_term:
                     mask = (display_df['债券名称'].str.contains(search_term, case=False, na=False) |
@@ -182,13 +166,18 @@ with st.expander("📊 数据统计与质量看板", expanded=False):
     try:
         stats = db.get_database_stats()
         st.info(f"📊 **{stats['total_records']:,}** 条记录 | **{stats['total_bonds']}** 只转债 | **{stats['trading_days']}** 个交易日 | {stats['date_range']}")
+        pool = db.get_pool_stats()
+        st.caption(f"连接池: {pool['in_use']}/{pool['created']} 使用中 | 复用率 {pool['hit_rate']:.1%} | "
+                   f"平均等待 {pool['avg_wait_ms']:.2f} ms | 最长等待 {pool['max_wait_ms']:.1f} ms | 超时 {pool['timeouts']} 次")
     except Exception as e:
         st.error(f"统计信息获取失败: {str(e)}")
     
     st.subheader("字段质量详情")
     with st.spinner("正在生成质量报告..."):
-        quality_df = get_quality_report()
+        quality_df = get_quality_report(db.get_data_version())
         if not quality_df.empty:
+            if quality_df.attrs.get('distinct_method') == 'hyperloglog':
+                st.caption(f"唯一值数量为 HyperLogLog 估算值（误差约 1%），统计时间 {quality_df.attrs.get('computed_at')}")
             quality_df['完整度'] = (100 - quality_df['缺失比例(%)']) / 100
             st.dataframe(
                 quality_df,
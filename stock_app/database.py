@@ -7,23 +7,74 @@
 import sqlite3
 import pandas as pd
 from typing import Dict, List, Optional, Tuple
-import streamlit as st
+
+from column_profiler import ColumnProfiler
+from connection_pool import DEFAULT_POOL_SIZE, ReadConnectionPool
+from history_storage import FACT_TABLE_NAME, date_sql, history_select_sql, is_normalized, to_day_number
+
+QUALITY_STATS_COLUMNS = ["字段名", "中文含义", "数据类型", "缺失数量", "缺失比例(%)", "唯一值数量", "最小值", "最大值", "零值数量"]
+# search_bonds 结果的列类型：价格、比率用 float32（约 7 位有效数字足够），成交量、成交额数值跨度大保留 float64；
+# 重复度高的名称和评级用 category；代码列用可空的 string 类型；日期解析为 datetime64
+SEARCH_RESULT_DTYPES = {
+    'trade_date': 'datetime64', 'bond_code': 'string', 'bond_name': 'category', 'price': 'float32', 'price_chg_pct': 'float32',
+    'open_price': 'float32', 'high_price': 'float32', 'low_price': 'float32', 'volume': 'float64', 'turnover': 'float64',
+    'turnover_rate': 'float32', 'stock_code': 'string', 'stock_name': 'category', 'stock_price': 'float32', 'stock_chg_pct': 'float32',
+    'stock_pb': 'float32', 'conv_price': 'float32', 'conv_value': 'float32', 'premium_rate': 'float32', 'pure_bond_value': 'float32',
+    'pure_bond_premium_rate': 'float32', 'double_low': 'float32', 'bond_rating': 'category', 'put_trigger_price': 'float32',
+    'force_redeem_trigger_price': 'float32', 'conv_proportion': 'float32', 'maturity_date': 'datetime64',
+    'remaining_years': 'float32', 'remaining_size': 'float32', 'ytm_before_tax': 'float32',
+}
+READ_CHUNK_ROWS = 50_000
+
+def read_compact_frame(query: str, conn, params: List, dtypes: Dict[str, str] = SEARCH_RESULT_DTYPES,
+                       chunk_rows: int = READ_CHUNK_ROWS) -> pd.DataFrame:
+    """按 dtypes 读取压缩类型的 DataFrame。分块读取，每块读出后立即转换数值列，多日或全历史查询的内存峰值
+    不再是整份 float64 结果；category 和日期列在拼接后统一转换，避免各块类别不一致"""
+    frames = []
+    for chunk in pd.read_sql_query(query, conn, params=params, chunksize=chunk_rows):
+        frames.append(chunk.astype({col: dtype for col, dtype in dtypes.items() if col in chunk.columns and dtype.startswith('float')}))
+    if not frames:
+        return pd.DataFrame(columns=list(dtypes))
+    df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    for col, dtype in dtypes.items():
+        if col not in df.columns: continue
+        if dtype in ('category', 'string'):
+            df[col] = df[col].astype(dtype)
+        elif dtype.startswith('datetime64'):
+            df[col] = pd.to_datetime(df[col], format='%Y-%m-%d', errors='coerce')
+    return df
+
+def _display_value(value) -> str:
+    """最小/最大值可能是文本或数值，统一转为文本便于表格展示"""
+    if value is None: return ''
+    return f"{value:.4f}" if isinstance(value, float) else str(value)
 
 class BondDatabase:
     """可转债数据库操作类"""
     
-    def __init__(self, db_path: str = '../data/cb_data.db'):
+    def __init__(self, db_path: str = '../data/cb_data.db', pool_size: int = DEFAULT_POOL_SIZE):
         self.db_path = db_path
+        self.pool = ReadConnectionPool(db_path, size=pool_size)
+        self.column_profiler = ColumnProfiler(db_path)
     
     def get_connection(self):
-        """获取数据库连接"""
-        return sqlite3.connect(self.db_path)
+        """从只读连接池借出连接，需配合 with 使用，退出时归还"""
+        return self.pool.connection()
+
+    def get_pool_stats(self) -> Dict:
+        """连接池的借出、复用命中、等待与占用耗时指标"""
+        return self.pool.stats()
     
     def get_available_dates(self) -> List[str]:
         """获取可用的交易日期列表"""
         try:
             with self.get_connection() as conn:
-                query = "SELECT DISTINCT trade_date FROM cb_daily_history ORDER BY trade_date DESC"
+                if is_normalized(conn):
+                    # 只读事实表主键索引中的 day，最后才换算为日期文本
+                    query = (f"SELECT {date_sql('day')} AS trade_date FROM (SELECT DISTINCT day FROM {FACT_TABLE_NAME}) "
+                             f"ORDER BY day DESC")
+                else:
+                    query = "SELECT DISTINCT trade_date FROM cb_daily_history ORDER BY trade_date DESC"
                 df = pd.read_sql_query(query, conn)
                 return df['trade_date'].tolist()
         except Exception:
@@ -33,7 +84,12 @@ class BondDatabase:
         """获取所有债券评级"""
         try:
             with self.get_connection() as conn:
-                query = "SELECT DISTINCT bond_rating FROM cb_daily_history WHERE bond_rating IS NOT NULL ORDER BY bond_rating"
+                if is_normalized(conn):
+                    # 评级只存于 bond_info，限定为在历史中出现过的债券
+                    query = (f"SELECT DISTINCT bond_rating FROM bond_info b WHERE bond_rating IS NOT NULL "
+                             f"AND EXISTS (SELECT 1 FROM {FACT_TABLE_NAME} f WHERE f.bond_id = b.bond_id) ORDER BY bond_rating")
+                else:
+                    query = "SELECT DISTINCT bond_rating FROM cb_daily_history WHERE bond_rating IS NOT NULL ORDER BY bond_rating"
                 df = pd.read_sql_query(query, conn)
                 return df['bond_rating'].tolist()
         except Exception:
@@ -41,7 +97,7 @@ class BondDatabase:
 
     # --- 核心新增：获取包含中文描述的数据质量统计 ---
     def get_column_quality_stats(self) -> pd.DataFrame:
-        """获取 cb_daily_history 表中每个字段的数据质量统计，并附带中文描述"""
+        """获取 cb_daily_history 表中每个字段的数据质量统计，并附带中文描述；统计来自按数据版本缓存的单次扫描画像"""
         
         # 定义字段的中文描述字典
         field_descriptions = {
@@ -57,46 +113,45 @@ class BondDatabase:
             'created_at': '创建时间', 'updated_at': '更新时间'
         }
 
-        with self.get_connection() as conn:
-            table_info_query = "PRAGMA table_info(cb_daily_history);"
-            columns_df = pd.read_sql_query(table_info_query, conn)
-            
-            total_records_query = "SELECT COUNT(*) FROM cb_daily_history;"
-            total_records = pd.read_sql_query(total_records_query, conn).iloc[0, 0]
-
-            if total_records == 0:
-                return pd.DataFrame(columns=["字段名", "中文含义", "数据类型", "缺失数量", "缺失比例(%)", "唯一值数量"])
-
-            stats_list = []
-            for _, row in columns_df.iterrows():
-                col_name = row['name']
-                col_type = row['type']
+        profile = self.column_profiler.profile()
+        total_records = profile['total_rows']
+        if total_records == 0:
+            return pd.DataFrame(columns=QUALITY_STATS_COLUMNS)
 
-                missing_count_query = f"SELECT COUNT(*) FROM cb_daily_history WHERE \"{col_name}\" IS NULL;"
-                missing_count = pd.read_sql_query(missing_count_query, conn).iloc[0, 0]
+        stats_list = []
+        for column in profile['columns']:
+            missing_count = column['null_count']
+            stats_list.append({
+                "字段名": column['column'],
+                "中文含义": field_descriptions.get(column['column'], "未知字段"), # 从字典中获取中文名
+                "数据类型": column['type'],
+                "缺失数量": missing_count,
+                "缺失比例(%)": round(missing_count / total_records * 100, 2),
+                "唯一值数量": column['distinct_count'],
+                "最小值": _display_value(column['min']),
+                "最大值": _display_value(column['max']),
+                "零值数量": column['zero_count'],
+            })
+        quality_df = pd.DataFrame(stats_list, columns=QUALITY_STATS_COLUMNS)
+        quality_df.attrs['distinct_method'] = profile['distinct_method']
+        quality_df.attrs['computed_at'] = profile['computed_at']
+        return quality_df
 
-                unique_count_query = f"SELECT COUNT(DISTINCT \"{col_name}\") FROM cb_daily_history;"
-                unique_count = pd.read_sql_query(unique_count_query, conn).iloc[0, 0]
-                
-                missing_ratio = (missing_count / total_records) * 100 if total_records > 0 else 0
+    def get_data_version(self) -> str:
+        """历史表的数据版本，数据变化时改变，可作为看板缓存的键"""
+        return self.column_profiler.data_version()
 
-                stats_list.append({
-                    "字段名": col_name,
-                    "中文含义": field_descriptions.get(col_name, "未知字段"), # 从字典中获取中文名
-                    "数据类型": col_type,
-                    "缺失数量": missing_count,
-                    "缺失比例(%)": round(missing_ratio, 2),
-                    "唯一值数量": unique_count
-                })
-            
-            return pd.DataFrame(stats_list)
-            
-    def build_where_conditions(self, filters: Dict) -> Tuple[str, List]:
+    def build_where_conditions(self, filters: Dict, normalized: bool = False) -> Tuple[str, List]:
+        """normalized=True 时日期条件改用事实表的整数 day，可走主键索引"""
         conditions = []
         params = []
         if filters.get('date'):
-            conditions.append("trade_date = ?")
-            params.append(filters['date'])
+            if normalized:
+                conditions.append("day = ?")
+                params.append(to_day_number(filters['date']))
+            else:
+                conditions.append("trade_date = ?")
+                params.append(filters['date'])
         if filters.get('bond_name'):
             conditions.append("(bond_name LIKE ? OR bond_code LIKE ?)")
             search_term = f"%{filters['bond_name']}%"
@@ -105,39 +160,53 @@ class BondDatabase:
         return where_clause, params
     
     def search_bonds(self, filters: Dict, sort_column: str = 'double_low', 
-                    sort_direction: str = 'ASC', limit: Optional[int] = None) -> pd.DataFrame:
-        where_clause, params = self.build_where_conditions(filters)
-        query = f"""
-        SELECT 
-            trade_date, bond_code, bond_name,
-            COALESCE(price, 0) as price, COALESCE(price_chg_pct, 0) as price_chg_pct, COALESCE(open_price, 0) as open_price,
-            COALESCE(high_price, 0) as high_price, COALESCE(low_price, 0) as low_price, COALESCE(volume, 0) as volume,
-            COALESCE(turnover, 0) as turnover, COALESCE(turnover_rate, 0) as turnover_rate, stock_code, stock_name,
-            COALESCE(stock_price, 0) as stock_price, COALESCE(stock_chg_pct, 0) as stock_chg_pct, COALESCE(stock_pb, 0) as stock_pb,
-            COALESCE(conv_price, 0) as conv_price, COALESCE(conv_value, 0) as conv_value, COALESCE(premium_rate, 0) as premium_rate,
-            COALESCE(pure_bond_value, 0) as pure_bond_value, COALESCE(pure_bond_premium_rate, 0) as pure_bond_premium_rate,
-            COALESCE(double_low, 0) as double_low, bond_rating, COALESCE(put_trigger_price, 0) as put_trigger_price,
-            COALESCE(force_redeem_trigger_price, 0) as force_redeem_trigger_price, COALESCE(conv_proportion, 0) as conv_proportion,
-            maturity_date, COALESCE(remaining_years, 0) as remaining_years, COALESCE(remaining_size, 0) as remaining_size,
-            COALESCE(ytm_before_tax, 0) as ytm_before_tax
-        FROM cb_daily_history 
-        WHERE {where_clause} ORDER BY {sort_column} {sort_direction}
-        """
-        if limit: query += f" LIMIT {limit}"
+                    sort_direction: str = 'ASC', limit: Optional[int] = None, display_units: bool = False) -> pd.DataFrame:
+        """按条件查询行情，返回按 SEARCH_RESULT_DTYPES 压缩类型的 DataFrame；
+        display_units=True 时成交量换算为手、成交额换算为万元（在 SQL 中完成），供看板直接展示"""
         with self.get_connection() as conn:
-            return pd.read_sql_query(query, conn, params=params)
+            normalized = is_normalized(conn)
+            # 规范化存储读取带 day、bond_id 的同一 SELECT，SQLite 会把子查询展开为事实表与 bond_info 的连接
+            source = f"({history_select_sql(with_keys=True)})" if normalized else "cb_daily_history"
+            where_clause, params = self.build_where_conditions(filters, normalized)
+            volume_expr, turnover_expr = ("COALESCE(volume, 0) / 100.0", "COALESCE(turnover, 0) / 10000.0") if display_units \
+                else ("COALESCE(volume, 0)", "COALESCE(turnover, 0)")
+            query = f"""
+            SELECT 
+                trade_date, bond_code, bond_name,
+                COALESCE(price, 0) as price, COALESCE(price_chg_pct, 0) as price_chg_pct, COALESCE(open_price, 0) as open_price,
+                COALESCE(high_price, 0) as high_price, COALESCE(low_price, 0) as low_price, {volume_expr} as volume,
+                {turnover_expr} as turnover, COALESCE(turnover_rate, 0) as turnover_rate, stock_code, stock_name,
+                COALESCE(stock_price, 0) as stock_price, COALESCE(stock_chg_pct, 0) as stock_chg_pct, COALESCE(stock_pb, 0) as stock_pb,
+                COALESCE(conv_price, 0) as conv_price, COALESCE(conv_value, 0) as conv_value, COALESCE(premium_rate, 0) as premium_rate,
+                COALESCE(pure_bond_value, 0) as pure_bond_value, COALESCE(pure_bond_premium_rate, 0) as pure_bond_premium_rate,
+                COALESCE(double_low, 0) as double_low, bond_rating, COALESCE(put_trigger_price, 0) as put_trigger_price,
+                COALESCE(force_redeem_trigger_price, 0) as force_redeem_trigger_price, COALESCE(conv_proportion, 0) as conv_proportion,
+                maturity_date, COALESCE(remaining_years, 0) as remaining_years, COALESCE(remaining_size, 0) as remaining_size,
+                COALESCE(ytm_before_tax, 0) as ytm_before_tax
+            FROM {source}
+            WHERE {where_clause} ORDER BY {sort_column} {sort_direction}
+            """
+            # LIMIT 用参数传入，不同条数共用同一条预编译语句
+            if limit:
+                query += " LIMIT ?"
+                params = params + [int(limit)]
+            return read_compact_frame(query, conn, params)
     
     def get_database_stats(self) -> Dict:
         with self.get_connection() as conn:
             stats = {}
             cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM cb_daily_history")
-            stats['total_records'] = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(DISTINCT bond_code) FROM cb_daily_history")
-            stats['total_bonds'] = cursor.fetchone()[0]
-            cursor.execute("SELECT COUNT(DISTINCT trade_date) FROM cb_daily_history")
-            stats['trading_days'] = cursor.fetchone()[0]
-            cursor.execute("SELECT MIN(trade_date), MAX(trade_date) FROM cb_daily_history")
-            date_range = cursor.fetchone()
+            try:
+                # 收集器用触发器维护的按交易日、按债券统计表，只需读取小表
+                cursor.execute("SELECT COALESCE(SUM(row_count), 0), COUNT(*), MIN(trade_date), MAX(trade_date) FROM history_date_stats")
+                stats['total_records'], stats['trading_days'], *date_range = cursor.fetchone()
+                cursor.execute("SELECT COUNT(*) FROM history_bond_stats")
+                stats['total_bonds'] = cursor.fetchone()[0]
+            except sqlite3.OperationalError:
+                # 尚未执行统计表迁移的数据库
+                cursor.execute("SELECT COUNT(*), COUNT(DISTINCT trade_date), MIN(trade_date), MAX(trade_date) FROM cb_daily_history")
+                stats['total_records'], stats['trading_days'], *date_range = cursor.fetchone()
+                cursor.execute("SELECT COUNT(DISTINCT bond_code) FROM cb_daily_history")
+                stats['total_bonds'] = cursor.fetchone()[0]
             stats['date_range'] = f"{date_range[0]} 到 {date_range[1]}" if date_range and date_range[0] else "N/A"
             return stats
\ No newline at end of file
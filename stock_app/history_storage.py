@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史行情的规范化存储
+债券名称、正股、评级、到期日等静态属性只在 bond_info 中保存一份，以整数 bond_id 为键；行情事实表 cb_daily_fact
+以 (day, bond_id) 为主键，day 为距 1970-01-01 的天数（与交易日历的 datetime64[D] 相同），不再逐行重复文本。
+原表名 cb_daily_history 改为同名视图，保持原有列布局，并用 INSTEAD OF 触发器接受写入，看板、校验器等只读方和
+旧的写入方式无需改动；批量写入和热点查询直接按整数键访问事实表
+"""
+
+import sqlite3
+from datetime import date
+from typing import Dict, List, Sequence, Tuple
+
+HISTORY_VIEW_NAME = 'cb_daily_history'
+FACT_TABLE_NAME = 'cb_daily_fact'
+BOND_TABLE_NAME = 'bond_info'
+# 1970-01-01 的儒略日，day 与 SQLite 日期函数之间的换算基准
+EPOCH_JULIAN_DAY = 2440587.5
+_EPOCH = date(1970, 1, 1)
+
+# 每只债券只保存一份的属性
+DIMENSION_COLUMNS = ('bond_name', 'stock_code', 'stock_name', 'bond_rating', 'maturity_date')
+# 事实表中逐日变化的字段
+MEASURE_COLUMNS = (
+    'price', 'price_chg_pct', 'open_price', 'high_price', 'low_price', 'volume', 'turnover', 'turnover_rate',
+    'stock_price', 'stock_chg_pct', 'stock_pb', 'conv_price', 'conv_value', 'premium_rate', 'pure_bond_value',
+    'pure_bond_premium_rate', 'double_low', 'put_trigger_price', 'force_redeem_trigger_price', 'conv_proportion',
+    'remaining_years', 'remaining_size', 'ytm_before_tax',
+)
+TIMESTAMP_COLUMNS = ('created_at', 'updated_at')
+# 原历史表的列顺序，兼容视图按此顺序输出
+HISTORY_COLUMNS = (
+    'trade_date', 'bond_code', 'bond_name', 'price', 'price_chg_pct', 'open_price', 'high_price', 'low_price', 'volume',
+    'turnover', 'turnover_rate', 'stock_code', 'stock_name', 'stock_price', 'stock_chg_pct', 'stock_pb', 'conv_price',
+    'conv_value', 'premium_rate', 'pure_bond_value', 'pure_bond_premium_rate', 'double_low', 'bond_rating',
+    'put_trigger_price', 'force_redeem_trigger_price', 'conv_proportion', 'maturity_date', 'remaining_years',
+    'remaining_size', 'ytm_before_tax', 'created_at', 'updated_at',
+)
+
+CREATE_BOND_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {BOND_TABLE_NAME} (
+    bond_id INTEGER PRIMARY KEY, bond_code TEXT NOT NULL UNIQUE, bond_name TEXT, stock_code TEXT, stock_name TEXT,
+    bond_rating TEXT, maturity_date TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+CREATE_FACT_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {FACT_TABLE_NAME} (
+    day INTEGER NOT NULL, bond_id INTEGER NOT NULL REFERENCES {BOND_TABLE_NAME} (bond_id),
+    {', '.join(f'{col} REAL' for col in MEASURE_COLUMNS)},
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (day, bond_id)
+)
+"""
+
+IS_NORMALIZED_SQL = f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'view' AND name = '{HISTORY_VIEW_NAME}'"
+# 每只债券已入库的最新交易日，走 (bond_id, day) 覆盖索引
+BOND_WATERMARKS_SQL = (f"SELECT b.bond_code, date(MAX(f.day) + {EPOCH_JULIAN_DAY}) FROM {FACT_TABLE_NAME} f "
+                       f"JOIN {BOND_TABLE_NAME} b ON b.bond_id = f.bond_id GROUP BY f.bond_id")
+LATEST_TRADE_DATE_SQL = f"SELECT date(MAX(day) + {EPOCH_JULIAN_DAY}) FROM {FACT_TABLE_NAME}"
+
+
+def day_sql(expr: str) -> str:
+    """把 'YYYY-MM-DD' 文本表达式换算为 day 的 SQL"""
+    return f"CAST(julianday({expr}) - {EPOCH_JULIAN_DAY} AS INTEGER)"
+
+
+def date_sql(expr: str) -> str:
+    """把 day 表达式换算为 'YYYY-MM-DD' 文本的 SQL"""
+    return f"date({expr} + {EPOCH_JULIAN_DAY})"
+
+
+def to_day_number(value) -> int:
+    """'YYYY-MM-DD'（或 date）换算为 day"""
+    parsed = value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+    return (parsed - _EPOCH).days
+
+
+def is_normalized(conn: sqlite3.Connection) -> bool:
+    """cb_daily_history 是否已是规范化存储上的兼容视图"""
+    return conn.execute(IS_NORMALIZED_SQL).fetchone()[0] > 0
+
+
+def history_select_sql(with_keys: bool = False) -> str:
+    """按原历史表列布局读取的 SELECT；with_keys=True 时另外输出 day 和 bond_id，供按整数键过滤的热点查询使用"""
+    expressions = []
+    for col in HISTORY_COLUMNS:
+        if col == 'trade_date':
+            expressions.append(f"{date_sql('f.day')} AS trade_date")
+        elif col == 'bond_code' or col in DIMENSION_COLUMNS:
+            expressions.append(f"b.{col} AS {col}")
+        else:
+            expressions.append(f"f.{col} AS {col}")
+    if with_keys:
+        expressions += ['f.day AS day', 'f.bond_id AS bond_id']
+    return f"SELECT {', '.join(expressions)} FROM {FACT_TABLE_NAME} f JOIN {BOND_TABLE_NAME} b ON b.bond_id = f.bond_id"
+
+
+def upsert_bond_sql(dimension_columns: Sequence[str]) -> str:
+    """按 bond_code 写入 bond_info：新债券插入，已有债券只用非空且有变化的值更新，避免无谓地改动 updated_at"""
+    columns = [col for col in dimension_columns if col in DIMENSION_COLUMNS]
+    column_list = ', '.join(['bond_code'] + columns)
+    placeholders = ', '.join('?' for _ in range(len(columns) + 1))
+    sql = f"INSERT INTO {BOND_TABLE_NAME} ({column_list}) VALUES ({placeholders}) ON CONFLICT(bond_code) DO "
+    if not columns:
+        return sql + "NOTHING"
+    updates = ', '.join(f"{col} = COALESCE(excluded.{col}, {col})" for col in columns)
+    changed = ' OR '.join(f"(excluded.{col} IS NOT NULL AND excluded.{col} IS NOT {col})" for col in columns)
+    return sql + f"UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP WHERE {changed}"
+
+
+class HistoryRowSplitter:
+    """把按历史表列排列的行拆成 bond_info 的 upsert 参数和事实表的插入参数，批量写入时不再逐行经过 INSTEAD OF 触发器"""
+
+    def __init__(self, columns: Sequence[str]):
+        if 'trade_date' not in columns or 'bond_code' not in columns:
+            raise ValueError("写入历史数据必须包含 trade_date 和 bond_code")
+        self._date_index = columns.index('trade_date')
+        self._code_index = columns.index('bond_code')
+        dimension_columns = [col for col in columns if col in DIMENSION_COLUMNS]
+        fact_columns = [col for col in columns if col in MEASURE_COLUMNS or col in TIMESTAMP_COLUMNS]
+        self._dimension_indexes = [columns.index(col) for col in dimension_columns]
+        self._fact_indexes = [columns.index(col) for col in fact_columns]
+        self.bond_sql = upsert_bond_sql(dimension_columns)
+        fact_list = ', '.join(['day', 'bond_id'] + fact_columns)
+        placeholders = ', '.join([day_sql('?'), f"(SELECT bond_id FROM {BOND_TABLE_NAME} WHERE bond_code = ?)"] + ['?'] * len(fact_columns))
+        self.fact_sql = (f"INSERT INTO {FACT_TABLE_NAME} ({fact_list}) VALUES ({placeholders}) "
+                         f"ON CONFLICT(day, bond_id) DO NOTHING")
+
+    def split(self, rows: Sequence[tuple]) -> Tuple[List[tuple], List[tuple]]:
+        """返回 (bond_rows, fact_rows)；同一只债券的属性取最后一行"""
+        bond_rows: Dict[str, tuple] = {}
+        fact_rows = []
+        for row in rows:
+            code = row[self._code_index]
+            bond_rows[code] = (code,) + tuple(row[i] for i in self._dimension_indexes)
+            fact_rows.append((row[self._date_index], code) + tuple(row[i] for i in self._fact_indexes))
+        return list(bond_rows.values()), fact_rows
+
+
+def _bond_id_sql(code_expr: str) -> str:
+    return f"(SELECT bond_id FROM {BOND_TABLE_NAME} WHERE bond_code = {code_expr})"
+
+
+def _ensure_bond_sql(code_expr: str) -> str:
+    return f"INSERT INTO {BOND_TABLE_NAME} (bond_code) SELECT {code_expr} WHERE NOT EXISTS (SELECT 1 FROM {BOND_TABLE_NAME} WHERE bond_code = {code_expr});"
+
+
+def view_statements() -> List[str]:
+    """兼容视图及其 INSTEAD OF 触发器，以及债券属性变化时刷新事实表 updated_at 的触发器"""
+    fact_columns = MEASURE_COLUMNS + TIMESTAMP_COLUMNS
+    fact_list = ', '.join(fact_columns)
+    # 旧表的 created_at/updated_at 有默认值，经视图写入时未给出则取当前时间
+    insert_values = ', '.join(f"COALESCE(NEW.{col}, CURRENT_TIMESTAMP)" if col in TIMESTAMP_COLUMNS else f"NEW.{col}"
+                              for col in fact_columns)
+    insert_bond_updates = ', '.join(f"{col} = COALESCE(NEW.{col}, {col})" for col in DIMENSION_COLUMNS)
+    insert_bond_changed = ' OR '.join(f"(NEW.{col} IS NOT NULL AND NEW.{col} IS NOT {col})" for col in DIMENSION_COLUMNS)
+    # 经视图的 UPDATE 只把语句实际改动的属性写回 bond_info
+    update_bond_updates = ', '.join(f"{col} = CASE WHEN NEW.{col} IS NOT OLD.{col} THEN NEW.{col} ELSE {col} END"
+                                    for col in DIMENSION_COLUMNS)
+    update_bond_changed = ' OR '.join(f"NEW.{col} IS NOT OLD.{col}" for col in DIMENSION_COLUMNS)
+    fact_updates = ', '.join(f"{col} = NEW.{col}" for col in fact_columns)
+    old_key = f"day = {day_sql('OLD.trade_date')} AND bond_id = {_bond_id_sql('OLD.bond_code')}"
+    bond_changed = ' OR '.join(f"NEW.{col} IS NOT OLD.{col}" for col in ('bond_code',) + DIMENSION_COLUMNS)
+    return [
+        f"CREATE VIEW IF NOT EXISTS {HISTORY_VIEW_NAME} AS {history_select_sql()}",
+        f"CREATE TRIGGER IF NOT EXISTS trg_history_view_insert INSTEAD OF INSERT ON {HISTORY_VIEW_NAME} BEGIN "
+        f"{_ensure_bond_sql('NEW.bond_code')} "
+        f"UPDATE {BOND_TABLE_NAME} SET {insert_bond_updates}, updated_at = CURRENT_TIMESTAMP "
+        f"WHERE bond_code = NEW.bond_code AND ({insert_bond_changed}); "
+        f"INSERT INTO {FACT_TABLE_NAME} (day, bond_id, {fact_list}) "
+        f"VALUES ({day_sql('NEW.trade_date')}, {_bond_id_sql('NEW.bond_code')}, {insert_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_history_view_update INSTEAD OF UPDATE ON {HISTORY_VIEW_NAME} BEGIN "
+        f"{_ensure_bond_sql('NEW.bond_code')} "
+        f"UPDATE {BOND_TABLE_NAME} SET {update_bond_updates}, updated_at = CURRENT_TIMESTAMP "
+        f"WHERE bond_code = NEW.bond_code AND ({update_bond_changed}); "
+        f"UPDATE {FACT_TABLE_NAME} SET day = {day_sql('NEW.trade_date')}, bond_id = {_bond_id_sql('NEW.bond_code')}, {fact_updates} "
+        f"WHERE {old_key}; END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_history_view_delete INSTEAD OF DELETE ON {HISTORY_VIEW_NAME} BEGIN "
+        f"DELETE FROM {FACT_TABLE_NAME} WHERE {old_key}; END",
+        # 属性改在 bond_info 一处，视图中该债券的所有行随之变化；刷新 updated_at，Parquet 镜像和字段画像的数据版本才能感知
+        f"CREATE TRIGGER IF NOT EXISTS trg_bond_info_touch_history AFTER UPDATE ON {BOND_TABLE_NAME} WHEN {bond_changed} BEGIN "
+        f"UPDATE {FACT_TABLE_NAME} SET updated_at = CURRENT_TIMESTAMP WHERE bond_id = NEW.bond_id; END",
+    ]
+
+
+def fact_index_statements(null_fields: Sequence[str] = ()) -> List[str]:
+    """事实表的二级索引：按债券取历史与水位线、按 updated_at 找变化，以及回填字段只含空值行的部分索引"""
+    return [
+        f"CREATE INDEX IF NOT EXISTS idx_fact_bond_day ON {FACT_TABLE_NAME} (bond_id, day)",
+        f"CREATE INDEX IF NOT EXISTS idx_fact_updated_at ON {FACT_TABLE_NAME} (updated_at)",
+    ] + [f"CREATE INDEX IF NOT EXISTS idx_fact_null_{field} ON {FACT_TABLE_NAME} (bond_id) WHERE {field} IS NULL"
+         for field in null_fields if field in MEASURE_COLUMNS]
+
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def normalize_history_storage(conn: sqlite3.Connection) -> Dict[str, int]:
+    """把旧的宽表 cb_daily_history 一次性拆分为 bond_info 与 cb_daily_fact，并把原表名换成兼容视图；调用方负责事务。
+
+    每只债券的属性取其最近一条非空值，再用原 bond_info（最新债券列表）中的非空值覆盖；属性与此不同的历史行
+    刷新 updated_at，下游按 updated_at 增量同步的镜像会重新导出这些行"""
+    if is_normalized(conn):
+        return {'bonds': 0, 'rows': 0, 'changed_rows': 0}
+    legacy_columns = _table_columns(conn, HISTORY_VIEW_NAME)
+    unknown = [col for col in legacy_columns if col not in HISTORY_COLUMNS]
+    if unknown:
+        raise RuntimeError(f"历史表包含未知字段 {unknown}，规范化存储无法保留这些字段")
+    bad_dates = conn.execute(f"SELECT COUNT(*) FROM {HISTORY_VIEW_NAME} WHERE date(trade_date) IS NOT trade_date").fetchone()[0]
+    if bad_dates:
+        raise RuntimeError(f"历史表有 {bad_dates} 行 trade_date 不是 YYYY-MM-DD 格式，无法换算为整数日期")
+
+    legacy_info_columns = _table_columns(conn, BOND_TABLE_NAME)
+    if legacy_info_columns:
+        conn.execute(f"ALTER TABLE {BOND_TABLE_NAME} RENAME TO {BOND_TABLE_NAME}_legacy")
+    conn.execute(CREATE_BOND_TABLE_SQL)
+    # 借助 (bond_code, trade_date) 索引从最新一天往前找第一条非空值
+    latest_values = ', '.join(
+        f"(SELECT h.{col} FROM {HISTORY_VIEW_NAME} h WHERE h.bond_code = c.bond_code AND h.{col} IS NOT NULL "
+        f"ORDER BY h.trade_date DESC LIMIT 1)" for col in DIMENSION_COLUMNS)
+    conn.execute(f"INSERT INTO {BOND_TABLE_NAME} (bond_code, {', '.join(DIMENSION_COLUMNS)}) "
+                 f"SELECT c.bond_code, {latest_values} FROM (SELECT DISTINCT bond_code FROM {HISTORY_VIEW_NAME}) c")
+    overrides = [col for col in DIMENSION_COLUMNS if col in legacy_info_columns]
+    if 'bond_code' in legacy_info_columns:
+        column_list = ', '.join(['bond_code'] + overrides)
+        conflict = (f"DO UPDATE SET {', '.join(f'{col} = COALESCE(excluded.{col}, {col})' for col in overrides)}"
+                    if overrides else "DO NOTHING")
+        conn.execute(f"INSERT INTO {BOND_TABLE_NAME} ({column_list}) SELECT {column_list} FROM {BOND_TABLE_NAME}_legacy "
+                     f"WHERE bond_code IS NOT NULL ON CONFLICT(bond_code) {conflict}")
+    if legacy_info_columns:
+        conn.execute(f"DROP TABLE {BOND_TABLE_NAME}_legacy")
+
+    conn.execute(CREATE_FACT_TABLE_SQL)
+    fact_columns = MEASURE_COLUMNS + TIMESTAMP_COLUMNS
+    changed = ' OR '.join(f"h.{col} IS NOT b.{col}" for col in DIMENSION_COLUMNS)
+    values = ', '.join(f"CASE WHEN {changed} THEN CURRENT_TIMESTAMP ELSE h.updated_at END" if col == 'updated_at' else f"h.{col}"
+                       for col in fact_columns)
+    conn.execute(f"INSERT INTO {FACT_TABLE_NAME} (day, bond_id, {', '.join(fact_columns)}) "
+                 f"SELECT {day_sql('h.trade_date')}, b.bond_id, {values} FROM {HISTORY_VIEW_NAME} h "
+                 f"JOIN {BOND_TABLE_NAME} b ON b.bond_code = h.bond_code ORDER BY 1, 2")
+    rows = conn.execute(f"SELECT COUNT(*) FROM {FACT_TABLE_NAME}").fetchone()[0]
+    changed_rows = conn.execute(f"SELECT COUNT(*) FROM {HISTORY_VIEW_NAME} h JOIN {BOND_TABLE_NAME} b "
+                                f"ON b.bond_code = h.bond_code WHERE {changed}").fetchone()[0]
+    bonds = conn.execute(f"SELECT COUNT(*) FROM {BOND_TABLE_NAME}").fetchone()[0]
+
+    # 旧表上的索引和统计触发器随表一起删除
+    conn.execute(f"DROP TABLE {HISTORY_VIEW_NAME}")
+    for statement in view_statements():
+        conn.execute(statement)
+    return {'bonds': bonds, 'rows': rows, 'changed_rows': changed_rows}
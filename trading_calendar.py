@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地交易日历
+交易日持久化在 SQLite 中，只在过期（超过有效期或已越过日历最后一天）时才重新下载；下载失败时继续使用已保存的旧日历。
+内存中以排好序的 int32 天数数组（距 1970-01-01 的天数）表示，下一/上一交易日、区间交易日数和是否为交易日
+均通过二分查找批量计算
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from typing import Callable, List, Optional
+
+from lazy_import import lazy_module
+
+np = lazy_module('numpy')
+pd = lazy_module('pandas')
+
+CALENDAR_TABLE_NAME = 'trading_calendar'
+CALENDAR_META_TABLE_NAME = 'trading_calendar_meta'
+# 交易所年内也可能调整休市安排，保存超过该天数即重新下载
+DEFAULT_MAX_AGE_DAYS = 7
+
+CREATE_CALENDAR_TABLE_SQL = f"CREATE TABLE IF NOT EXISTS {CALENDAR_TABLE_NAME} (trade_date TEXT PRIMARY KEY)"
+CREATE_CALENDAR_META_TABLE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {CALENDAR_META_TABLE_NAME} (
+    id INTEGER PRIMARY KEY CHECK (id = 1), refreshed_at TIMESTAMP NOT NULL, first_date TEXT, last_date TEXT, day_count INTEGER
+)
+"""
+
+
+def _to_days(values):
+    """日期（字符串、date、datetime64 或其数组）转换为距 1970-01-01 的天数"""
+    return np.asarray(values, dtype='datetime64[D]').astype(np.int32)
+
+
+def _to_strings(days, valid):
+    """天数数组转回 'YYYY-MM-DD'；越出日历范围的位置为 None"""
+    strings = np.datetime_as_string(days.astype('datetime64[D]'), unit='D').astype(object)
+    strings[~valid] = None
+    return strings
+
+
+class TradingCalendar:
+    """交易日历服务；fetcher 为空时只读取已保存的日历，不访问网络"""
+
+    def __init__(self, db_path: str, fetcher: Optional[Callable[[], 'pd.DataFrame']] = None,
+                 max_age_days: int = DEFAULT_MAX_AGE_DAYS):
+        self.db_path = db_path
+        self.fetcher = fetcher
+        self.max_age_days = max_age_days
+        self._days = None
+        self._lock = threading.Lock()
+
+    # --- 加载与持久化 ---
+    def ensure_loaded(self) -> bool:
+        """保证日历可用：先读本地，过期时尝试刷新；返回日历是否可用"""
+        with self._lock:
+            if self._days is None:
+                self._days, refreshed_at, last_date = self._load()
+                if self.fetcher is not None and self._is_stale(refreshed_at, last_date):
+                    self._refresh(had_local=self._days is not None)
+            return self._days is not None
+
+    @property
+    def days(self):
+        """排好序的交易日 int32 数组；日历不可用时抛出 RuntimeError"""
+        if not self.ensure_loaded():
+            raise RuntimeError("交易日历不可用：本地没有保存的日历且无法下载")
+        return self._days
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute(CREATE_CALENDAR_TABLE_SQL)
+        conn.execute(CREATE_CALENDAR_META_TABLE_SQL)
+        return conn
+
+    def _load(self):
+        conn = self._connect()
+        try:
+            rows = conn.execute(f"SELECT trade_date FROM {CALENDAR_TABLE_NAME} ORDER BY trade_date").fetchall()
+            meta = conn.execute(f"SELECT refreshed_at, last_date FROM {CALENDAR_META_TABLE_NAME} WHERE id = 1").fetchone()
+        finally:
+            conn.close()
+        if not rows: return None, None, None
+        days = _to_days([row[0] for row in rows])
+        refreshed_at, last_date = meta if meta else (None, None)
+        return days, refreshed_at, last_date
+
+    def _is_stale(self, refreshed_at: Optional[str], last_date: Optional[str]) -> bool:
+        if refreshed_at is None or last_date is None: return True
+        if date.today().isoformat() > last_date: return True
+        return datetime.now() - datetime.fromisoformat(refreshed_at) > timedelta(days=self.max_age_days)
+
+    def _refresh(self, had_local: bool) -> None:
+        try:
+            raw = self.fetcher()
+            if raw is None or raw.empty: raise ValueError("交易日历接口返回空数据")
+            days = np.unique(_to_days(pd.to_datetime(raw['trade_date']).dt.strftime('%Y-%m-%d').to_numpy()))
+        except Exception as e:
+            if had_local:
+                logging.warning(f"刷新交易日历失败，继续使用本地保存的日历: {e}")
+            else:
+                logging.error(f"获取交易日历失败，本地也没有保存的日历: {e}")
+            return
+        self._save(days)
+        self._days = days
+        logging.info(f"交易日历已刷新并保存，共 {len(days)} 个交易日")
+
+    def _save(self, days) -> None:
+        dates = _to_strings(days, np.ones(len(days), dtype=bool))
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(f"DELETE FROM {CALENDAR_TABLE_NAME}")
+                conn.executemany(f"INSERT INTO {CALENDAR_TABLE_NAME} (trade_date) VALUES (?)", [(d,) for d in dates])
+                conn.execute(f"INSERT OR REPLACE INTO {CALENDAR_META_TABLE_NAME} (id, refreshed_at, first_date, last_date, day_count) "
+                             f"VALUES (1, ?, ?, ?, ?)", (datetime.now().isoformat(timespec='seconds'), dates[0], dates[-1], len(dates)))
+        finally:
+            conn.close()
+
+    # --- 批量日期运算：参数可以是单个日期或日期数组，返回值形状与之相同 ---
+    def is_trading_day(self, dates):
+        days = self.days
+        targets = _to_days(dates)
+        idx = np.searchsorted(days, targets).clip(max=len(days) - 1)
+        return days[idx] == targets
+
+    def next_trading_day(self, dates, inclusive: bool = False):
+        """严格晚于（inclusive 时不早于）给定日期的第一个交易日"""
+        days = self.days
+        idx = np.searchsorted(days, _to_days(dates), side='left' if inclusive else 'right')
+        valid = idx < len(days)
+        return self._as_result(days[idx.clip(max=len(days) - 1)], valid, dates)
+
+    def prev_trading_day(self, dates, inclusive: bool = False):
+        """严格早于（inclusive 时不晚于）给定日期的最后一个交易日"""
+        days = self.days
+        idx = np.searchsorted(days, _to_days(dates), side='right' if inclusive else 'left') - 1
+        valid = idx >= 0
+        return self._as_result(days[idx.clip(min=0)], valid, dates)
+
+    def count_between(self, start, end):
+        """区间 (start, end] 内的交易日数，即 start 之后到 end 为止经过了几个交易日"""
+        days = self.days
+        return np.searchsorted(days, _to_days(end), side='right') - np.searchsorted(days, _to_days(start), side='right')
+
+    def trading_days_between(self, start, end) -> List[str]:
+        """闭区间 [start, end] 内的全部交易日"""
+        days = self.days
+        lo, hi = np.searchsorted(days, _to_days(start), side='left'), np.searchsorted(days, _to_days(end), side='right')
+        selected = days[lo:hi]
+        return _to_strings(selected, np.ones(len(selected), dtype=bool)).tolist()
+
+    @staticmethod
+    def _as_result(days, valid, original):
+        strings = _to_strings(np.atleast_1d(days), np.atleast_1d(valid))
+        return strings[0] if np.ndim(original) == 0 else strings